@@ -9,6 +9,7 @@ from requre.record_and_replace import record, replace
 from requre.cassette import Cassette
 from requre.simple_object import Simple, Tuple
 from requre.guess_object import Guess
+from requre.serializers import register_serializer
 from requre.helpers.files import StoreFiles
 from requre.import_system import UpgradeImportSystem
 
@@ -23,6 +24,7 @@ __all__ = [
     Simple.__name__,
     Tuple.__name__,
     Guess.__name__,
+    register_serializer.__name__,
     StoreFiles.__name__,
     UpgradeImportSystem.__name__,
 ]
@@ -0,0 +1,341 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Content-addressed store of binary data (e.g. response bodies) shared by all
+storage files inside test_data directory. Every content is stored just once
+as test_data/.blobs/<sha256> and storage files contain just references.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import IO, Any, AsyncIterator, Dict, Iterator, Optional
+
+from requre.constants import (
+    BLOBS_DIRECTORY,
+    BLOB_REFERENCE_KEY,
+    RELATIVE_TEST_DATA_DIRECTORY,
+)
+from requre.exceptions import PersistentStorageException
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Store binary data under its sha256 digest. Read data are cached in-process
+    (least recently used are dropped when cache exceeds cache_limit bytes),
+    so identical content is read once per session, not once per test.
+    """
+
+    # maximal size of cached data in bytes, 0 disables the cache
+    cache_limit = 64 * 1024 * 1024
+    # data read from blob files, keyed by path of blob file
+    _cache: "OrderedDict[str, bytes]" = OrderedDict()
+    _cache_size = 0
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @classmethod
+    def for_storage_file(cls, storage_file: str) -> "BlobStore":
+        """
+        Return store for the test_data directory where the storage file is placed,
+        or for the directory of storage file when it is not inside test_data.
+
+        :param storage_file: path to storage file of cassette
+        :return: BlobStore instance
+        """
+        path = Path(storage_file).absolute()
+        for parent in path.parents:
+            if parent.name == RELATIVE_TEST_DATA_DIRECTORY:
+                return cls(str(parent / BLOBS_DIRECTORY))
+        return cls(str(path.parent / BLOBS_DIRECTORY))
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest)
+
+    def put(self, data: bytes) -> str:
+        """
+        Store data if not stored yet
+
+        :param data: content
+        :return: sha256 digest of the content
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        self.write_once(digest, data)
+        return digest
+
+    def write_once(self, name: str, data: bytes) -> bool:
+        """
+        Write data to file of the store, if it does not exist yet
+        (name has to be derived from content, e.g. its digest)
+
+        :param name: name of the file inside store directory
+        :param data: content
+        :return: True if file was written
+        """
+        path = self.path(name)
+        if os.path.exists(path):
+            return False
+        os.makedirs(self.directory, exist_ok=True)
+        # write via temporary file to not expose partially written blob
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_")
+        with os.fdopen(fd, "wb") as blob_file:
+            blob_file.write(data)
+        os.replace(temp_path, path)
+        logger.debug(f"Stored blob {name} ({len(data)} bytes)")
+        return True
+
+    def get(self, digest: str) -> bytes:
+        """
+        Read data stored under digest
+
+        :param digest: sha256 digest of the content
+        :return: content
+        """
+        path = self.path(digest)
+        data = self._cache.get(path)
+        if data is not None:
+            self._cache.move_to_end(path)
+            return data
+        with open(path, "rb") as blob_file:
+            data = blob_file.read()
+        self._cache_put(path, data)
+        return data
+
+    def _cache_put(self, path: str, data: bytes) -> None:
+        if len(data) > self.cache_limit:
+            return
+        BlobStore._cache[path] = data
+        BlobStore._cache_size += len(data)
+        while BlobStore._cache_size > self.cache_limit:
+            _, dropped = BlobStore._cache.popitem(last=False)
+            BlobStore._cache_size -= len(dropped)
+
+    def open(self, digest: str) -> IO[bytes]:
+        """
+        Open data stored under digest for reading, to be able to read them in chunks
+        without loading whole content to memory (in-process cache is not filled)
+
+        :param digest: sha256 digest of the content
+        :return: binary file object
+        """
+        path = self.path(digest)
+        data = self._cache.get(path)
+        if data is not None:
+            return BytesIO(data)
+        return open(path, "rb")
+
+    def writer(self) -> "BlobWriter":
+        """
+        Return writer to store content incrementally (without having it whole in memory)
+        """
+        return BlobWriter(self)
+
+    def reference(self, data: Optional[bytes]) -> Any:
+        """
+        Store data and return reference to them, what is stored in storage file
+
+        :param data: content (None is returned as is)
+        :return: reference dict
+        """
+        if data is None:
+            return None
+        return {BLOB_REFERENCE_KEY: self.put(data)}
+
+    @staticmethod
+    def is_reference(value: Any) -> bool:
+        return isinstance(value, dict) and BLOB_REFERENCE_KEY in value
+
+    def resolve(self, value: Any) -> Any:
+        """
+        Return content for reference, other values are returned as they are
+
+        :param value: reference dict or any stored value
+        :return: content
+        """
+        if self.is_reference(value):
+            return self.get(value[BLOB_REFERENCE_KEY])
+        return value
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        BlobStore._cache.clear()
+        BlobStore._cache_size = 0
+
+
+class BlobWriter:
+    """
+    Write content to blob store in chunks, digest is known when writer is closed
+    """
+
+    def __init__(self, store: BlobStore):
+        self.store = store
+        os.makedirs(store.directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=store.directory, prefix=".tmp_")
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.digest: Optional[str] = None
+
+    def write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def close(self) -> str:
+        """
+        Move written content to its place in blob store
+
+        :return: sha256 digest of the content
+        """
+        if self.digest is None:
+            self._file.close()
+            self.digest = self._hash.hexdigest()
+            path = self.store.path(self.digest)
+            if os.path.exists(path):
+                os.remove(self.temp_path)
+            else:
+                os.replace(self.temp_path, path)
+            logger.debug(f"Stored blob {self.digest} ({self.size} bytes)")
+        return self.digest
+
+
+class _BlobTeeWriter:
+    """
+    Writing part of BlobTee and AsyncBlobTee
+    """
+
+    def __init__(
+        self, store: BlobStore, reference: Dict[str, Any], decompressor: Any = None
+    ):
+        self.reference = reference
+        self.decompressor = decompressor
+        self._writer = store.writer()
+
+    @property
+    def finished(self) -> bool:
+        return self._writer.digest is not None
+
+    def _write(self, chunk: bytes) -> None:
+        if self.decompressor is not None:
+            chunk = self.decompressor.decompress(chunk)
+        self._writer.write(chunk)
+
+    def _close(self) -> None:
+        if not self.finished:
+            if self.decompressor is not None:
+                self._writer.write(self.decompressor.flush())
+            self.reference[BLOB_REFERENCE_KEY] = self._writer.close()
+
+
+class BlobTee(_BlobTeeWriter):
+    """
+    Pass chunks from source iterator to consumer and write them to blob store
+    at the same time. Reference dict (stored in cassette) gets digest of the blob
+    when source is exhausted or when finish() is called.
+
+    Written data may be transformed via decompressor (zlib decompress object),
+    e.g. when consumer reads compressed data, but decoded body is stored.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        store: BlobStore,
+        source: Iterator[bytes],
+        reference: Dict[str, Any],
+        decompressor: Any = None,
+    ):
+        super().__init__(store, reference, decompressor=decompressor)
+        self.source = source
+        # rest of the source read by finish(), what was not passed to consumer yet
+        self._rest: Optional[IO[bytes]] = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        if self._rest is not None:
+            chunk = self._rest.read(self.chunk_size)
+            if not chunk:
+                self._rest.close()
+                raise StopIteration
+            return chunk
+        try:
+            chunk = next(self.source)
+        except StopIteration:
+            self._close()
+            raise
+        self._write(chunk)
+        return chunk
+
+    def finish(self) -> None:
+        """
+        Write rest of the source to blob store, when consumer did not read it whole
+        (e.g. before cassette is dumped). Consumer then reads the rest
+        from temporary file.
+        """
+        if self.finished:
+            return
+        self._rest = tempfile.TemporaryFile()
+        for chunk in self.source:
+            self._write(chunk)
+            self._rest.write(chunk)
+        self._rest.seek(0)
+        self._close()
+
+
+class AsyncBlobTee(_BlobTeeWriter):
+    """
+    BlobTee of async source, e.g. stream of httpx.AsyncClient response.
+    Source can't be awaited by finish() called when cassette is dumped,
+    so the consumer has to read it whole or close it (see drain) before.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore,
+        source: AsyncIterator[bytes],
+        reference: Dict[str, Any],
+        decompressor: Any = None,
+    ):
+        super().__init__(store, reference, decompressor=decompressor)
+        self.source = source
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            chunk = await self.source.__anext__()
+        except StopAsyncIteration:
+            self._close()
+            raise
+        self._write(chunk)
+        return chunk
+
+    async def drain(self) -> None:
+        """
+        Write rest of the source to blob store, when consumer closes it
+        before reading it whole
+        """
+        if self.finished:
+            return
+        async for chunk in self.source:
+            self._write(chunk)
+        self._close()
+
+    def finish(self) -> None:
+        if not self.finished:
+            raise PersistentStorageException(
+                "Streamed async response has to be read or closed "
+                "before cassette is dumped, its body is not stored yet."
+            )
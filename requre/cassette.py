@@ -3,11 +3,14 @@
 
 import inspect
 import logging
+import mmap
 import os
 import sys
 import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import Enum
-from typing import Dict, Optional, List, Hashable, Any, Callable
+from typing import Dict, Optional, List, Hashable, Any, Callable, BinaryIO
 
 import yaml
 
@@ -17,6 +20,7 @@ from requre.constants import (
     ENV_STORAGE_FILE,
     VERSION_REQURE_FILE,
     KEY_MINIMAL_MATCH,
+    BUFFERS_FILE_SUFFIX,
 )
 from requre.exceptions import (
     PersistentStorageException,
@@ -30,6 +34,34 @@ original_sleep = time.sleep
 original_time = time.time
 logger = logging.getLogger(__name__)
 
+# cassette used by replacements installed for the whole session,
+# it is set per test (context) via activate_cassette
+_active_cassette: ContextVar[Optional["Cassette"]] = ContextVar(
+    "requre_active_cassette", default=None
+)
+
+
+def get_active_cassette() -> Optional["Cassette"]:
+    """
+    Return cassette activated for the current context or None if there is no one.
+    """
+    return _active_cassette.get()
+
+
+@contextmanager
+def activate_cassette(cassette: "Cassette"):
+    """
+    Context manager what activates cassette for the current context.
+    Calls of session replacements are routed to this cassette.
+
+    :param cassette: Cassette instance to activate
+    """
+    token = _active_cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _active_cassette.reset(token)
+
 
 class CassetteExecution:
     """
@@ -40,6 +72,8 @@ class CassetteExecution:
         self._function = None
         self._cassette = None
         self._obj_cls = None
+        # used when cassette is not set explicitly and no cassette is active
+        self.default_cassette = None
 
     @property
     def function(self):
@@ -55,9 +89,12 @@ class CassetteExecution:
     @property
     def cassette(self):
         """
-        return current cassette for function execution
+        return current cassette for function execution: explicitly set one,
+        or cassette activated for the current context, or default_cassette
         """
-        return self._cassette
+        if self._cassette is not None:
+            return self._cassette
+        return get_active_cassette() or self.default_cassette
 
     @cassette.setter
     def cassette(self, value):
@@ -310,6 +347,63 @@ class DataStructure:
         return data
 
 
+class BufferSegment:
+    """
+    Binary sidecar file of the storage file, where big binary buffers are stored
+    (e.g. out-of-band pickle buffers). Storage file contains just offset and size
+    of every buffer, and buffers are read back via memory mapped file, without
+    loading whole file to memory.
+    """
+
+    def __init__(self, path: str, truncate: bool = False):
+        self.path = path
+        self.truncate = truncate
+        self._write_file: Optional[BinaryIO] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    def write(self, data: memoryview) -> List[int]:
+        """
+        Append buffer to the segment file
+
+        :param data: buffer content
+        :return: [offset, size] of stored buffer
+        """
+        if self._write_file is None:
+            self._write_file = open(self.path, "wb" if self.truncate else "ab")
+        offset = self._write_file.tell()
+        self._write_file.write(data)
+        return [offset, data.nbytes]
+
+    def read(self, offset: int, size: int) -> memoryview:
+        """
+        Return read-only view of stored buffer
+
+        :param offset: offset of buffer in segment file
+        :param size: size of buffer
+        :return: memoryview pointing to memory mapped file
+        """
+        if self._write_file is not None:
+            self._write_file.flush()
+        if self._mmap is None or self._mmap.size() < offset + size:
+            with open(self.path, "rb") as segment_file:
+                self._mmap = mmap.mmap(
+                    segment_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+        end = offset + size
+        return memoryview(self._mmap)[offset:end]
+
+    def flush(self) -> None:
+        if self._write_file is not None:
+            self._write_file.flush()
+
+    def close(self) -> None:
+        if self._write_file is not None:
+            self._write_file.close()
+            self._write_file = None
+        # views of buffers may be still used by objects, mmap is closed by GC then
+        self._mmap = None
+
+
 class DataTypes(Enum):
     List = 1
     Value = 2
@@ -436,7 +530,17 @@ class Cassette:
     key_inspect_strategy_key = "key_strategy"
 
     def _set_defaults(self) -> None:
+        buffer_segment = getattr(self, "_buffer_segment", None)
+        if buffer_segment is not None:
+            buffer_segment.close()
+        self._buffer_segment: Optional[BufferSegment] = None
+        self._dump_hooks: List[Callable[[], None]] = []
         self.dump_after_store = False
+        # codec and level of archives stored by StoreFiles (class defaults if not set)
+        self.file_compression: Optional[str] = None
+        self.file_compression_level: Optional[int] = None
+        # previous manifests of directories stored by StoreFiles.store_delta_snapshot
+        self.file_manifests: Dict[str, Dict] = {}
         self.is_flushed = False
         self.storage_object: dict = {}
         self._storage_file: Optional[str] = None
@@ -589,6 +693,19 @@ class Cassette:
         if self.mode == StorageMode.append and os.path.exists(self._storage_file):
             self.storage_object = self.load()
 
+    @property
+    def buffer_segment(self) -> BufferSegment:
+        """
+        Binary sidecar file of storage_file for big buffers,
+        it is rewritten when recording in write mode.
+        """
+        if self._buffer_segment is None:
+            self._buffer_segment = BufferSegment(
+                path=f"{self.storage_file}.{BUFFERS_FILE_SUFFIX}",
+                truncate=self.mode == StorageMode.write,
+            )
+        return self._buffer_segment
+
     @staticmethod
     def transform_hashable(keys: List) -> List:
         output: List = []
@@ -745,6 +862,15 @@ class Cassette:
         else:
             del last_level[key[-1]]
 
+    def add_dump_hook(self, hook: Callable[[], None]) -> None:
+        """
+        Register function called (once) before content is dumped to storage file,
+        e.g. to finish data what are stored lazily
+
+        :param hook: function without arguments
+        """
+        self._dump_hooks.append(hook)
+
     def dump(self) -> None:
         """
         Explicitly stores content of storage_object to storage_file path
@@ -754,9 +880,13 @@ class Cassette:
         :return: None
         """
         if self.mode in [StorageMode.write, StorageMode.append]:
+            while self._dump_hooks:
+                self._dump_hooks.pop(0)()
             self._set_storage_metadata_if_not_set()
             if self.is_flushed:
                 return None
+            if self._buffer_segment is not None:
+                self._buffer_segment.flush()
             with open(self.storage_file, "w") as yaml_file:
                 yaml.dump(self.storage_object, yaml_file, default_flow_style=False)
             self.is_flushed = True
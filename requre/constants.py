@@ -1,8 +1,6 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
-import builtins
-
 VERSION_REQURE_FILE = 3
 ENV_STORAGE_FILE = "RESPONSE_FILE"
 ENV_REPLACEMENT_FILE = "REPLACEMENT_FILE"
@@ -15,8 +13,9 @@ METATADA_KEY = "_requre"
 KEY_MINIMAL_MATCH = 2
 RELATIVE_TEST_DATA_DIRECTORY = "test_data"
 DEFAULT_SUFIX = "yaml"
+BUFFERS_FILE_SUFFIX = "buffers"
+BLOBS_DIRECTORY = ".blobs"
+BLOB_REFERENCE_KEY = "requre_blob"
 REQURE_CASSETTE_ATTRIBUTE_NAME = "_requre_cassette"
 REQURE_SETUP_APPLIED_ATTRIBUTE_NAME = "_requre_cassette_setup_applied"
 TEST_METHOD_REGEXP = "test.*"
-
-DEFAULT_IMPORT_FUNCTION = builtins.__import__
@@ -1,18 +1,35 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+import datetime
+import inspect
 import logging
 import pickle
 import warnings
 from typing import Any, Dict, Optional
+from typing import Tuple as PyTuple
+from typing import Type as PyType
 
 import yaml
 
 from requre.objects import ObjectStorage
+from requre.serializers import serializer_registry
 from requre.simple_object import Simple, Tuple, Void
 
 logger = logging.getLogger(__name__)
 GUESS_STR = "guess_type"
+# types serialized by yaml.SafeDumper without looking inside
+YAML_SCALAR_TYPES = {
+    type(None),
+    str,
+    bytes,
+    bool,
+    int,
+    float,
+    datetime.date,
+    datetime.datetime,
+}
+YAML_CONTAINER_TYPES = {list, tuple, dict, set}
 
 
 class Guess(Simple):
@@ -25,26 +42,158 @@ class Guess(Simple):
     and it could be hidden inside object representation.
     """
 
-    @staticmethod
-    def guess_type(value):
+    # verdicts of YAML serializability per type, see is_yaml_safe_type
+    _yaml_type_verdicts: Dict[type, bool] = {}
+
+    @classmethod
+    def is_yaml_safe_type(cls, value_type: type) -> bool:
+        """
+        Check if yaml.safe_dump has representer for given type (cached per type)
+        SafeDumper dispatches builtin types by exact type, so subclasses of them
+        are not safe unless there is registered representer for them.
+        """
+        verdict = cls._yaml_type_verdicts.get(value_type)
+        if verdict is None:
+            verdict = value_type in yaml.SafeDumper.yaml_representers or any(
+                base in yaml.SafeDumper.yaml_multi_representers
+                for base in value_type.__mro__
+            )
+            cls._yaml_type_verdicts[value_type] = verdict
+        return verdict
+
+    @classmethod
+    def is_yaml_serializable(cls, value: Any) -> bool:
+        """
+        Walk types of the value (and its items) instead of serializing it.
+        Trial serialization is used just for items with custom representers,
+        where it is not known what they contain.
+        """
+        stack = [value]
+        visited = set()
+        while stack:
+            item = stack.pop()
+            item_type = type(item)
+            if item_type in YAML_SCALAR_TYPES:
+                continue
+            if not cls.is_yaml_safe_type(item_type):
+                return False
+            if item_type in YAML_CONTAINER_TYPES:
+                if id(item) in visited:
+                    continue
+                visited.add(id(item))
+                if item_type is dict:
+                    stack.extend(item.keys())
+                    stack.extend(item.values())
+                else:
+                    stack.extend(item)
+            else:
+                try:
+                    yaml.safe_dump(item)
+                except Exception:
+                    return False
+        return True
+
+    @classmethod
+    def guess_type_and_data(cls, value) -> PyTuple[type, Optional[bytes]]:
+        """
+        Select storage type for the value, for ObjectStorage it returns also
+        pickled value to avoid serialization of the value twice.
+
+        :param value: some object
+        :return: tuple of storage class and serialized value (if already done)
+        """
+        # Use serializer registered for the type (dataclasses, enums, sets, ...)
+        serializer = serializer_registry.lookup(type(value))
+        if serializer is not None:
+            return serializer, None
         if isinstance(value, tuple):
-            return Tuple
+            return Tuple, None
+        if inspect.isawaitable(value) or inspect.isasyncgen(value):
+            # output would be stored before it is computed
+            raise TypeError(
+                f"Unable to store {value}, decorated callable returns awaitable "
+                "or async generator, but it is not coroutine (async generator) function."
+            )
+        # Try to use type for storing simple output (list, dict, str, nums, etc...)
+        if cls.is_yaml_serializable(value):
+            return Simple, None
         try:
-            # Try to use type for storing simple output (list, dict, str, nums, etc...)
-            yaml.safe_dump(value)
-            return Simple
+            # Try to store anything serializable via pickle module
+            return ObjectStorage, pickle.dumps(value)
         except Exception:
-            try:
-                # Try to store anything serializable via pickle module
-                pickle.dumps(value)
-                return ObjectStorage
-            except Exception:
-                # do not store anything if not possible directly
-                warnings.warn(
-                    "Guess class - nonserializable return object - "
-                    f"Using supressed output, are you sure? {value}"
-                )
-                return Void
+            # do not store anything if not possible directly
+            warnings.warn(
+                "Guess class - nonserializable return object - "
+                f"Using supressed output, are you sure? {value}"
+            )
+            return Void, None
+
+    @classmethod
+    def guess_type(cls, value):
+        return cls.guess_type_and_data(value)[0]
+
+    @classmethod
+    def encode(cls, value: Any) -> Any:
+        """
+        Serialize nested value (e.g. field of dataclass) with its storage type.
+        Scalar values are returned directly.
+
+        :param value: some object
+        :return: serializable representation
+        """
+        if type(value) in YAML_SCALAR_TYPES:
+            return value
+        object_serialization_type, data = cls.guess_type_and_data(value)
+        serialized: Any = data
+        if serialized is None:
+            instance = object_serialization_type(store_keys=[], cassette=None)
+            serialized = (
+                instance.to_serializable(value)
+                if object_serialization_type is not Void
+                else f">>>>> Requre output supressed by using {Void.__name__}"
+            )
+        return {
+            GUESS_STR: cls.get_serializer_name(object_serialization_type),
+            "data": serialized,
+        }
+
+    @classmethod
+    def decode(cls, data: Any) -> Any:
+        """
+        Create object from representation created by encode method
+
+        :param data: serializable representation
+        :return: some object
+        """
+        if not isinstance(data, dict):
+            return data
+        return cls.get_serializer(data[GUESS_STR])(
+            store_keys=[], cassette=None
+        ).from_serializable(data["data"])
+
+    @staticmethod
+    def get_serializer_name(object_serialization_type: PyType[ObjectStorage]) -> str:
+        """
+        Name of serializer class stored in metadata
+        """
+        if object_serialization_type in (ObjectStorage, Simple, Void, Tuple):
+            return object_serialization_type.__name__
+        return serializer_registry.name(object_serialization_type)
+
+    @staticmethod
+    def get_serializer(name: str) -> PyType[ObjectStorage]:
+        """
+        Find serializer class by name stored in metadata
+        """
+        for object_serialization_type in (ObjectStorage, Simple, Void, Tuple):
+            if name == object_serialization_type.__name__:
+                return object_serialization_type
+        serializer = serializer_registry.get(name)
+        if serializer is None:
+            raise ValueError(
+                f"Unsupported type of stored object inside cassette: {name}"
+            )
+        return serializer
 
     def write(self, obj: Any, metadata: Optional[Dict] = None) -> Any:
         """
@@ -56,8 +205,12 @@ class Guess(Simple):
         :param metadata: store metedata to object
         :return: same obj
         """
-        object_serialization_type = self.guess_type(obj)
-        metadata[GUESS_STR] = object_serialization_type.__name__
+        object_serialization_type, data = self.guess_type_and_data(obj)
+        metadata[GUESS_STR] = self.get_serializer_name(object_serialization_type)
+        if data is not None:
+            # already serialized by guess_type_and_data
+            self.get_cassette().store(self.store_keys, data, metadata=metadata)
+            return obj
         instance = object_serialization_type(
             store_keys=self.store_keys,
             cassette=self.get_cassette(),
@@ -75,14 +228,12 @@ class Guess(Simple):
         data = self.get_cassette()[self.store_keys]
         guess_type = self.get_cassette().data_miner.metadata[GUESS_STR]
         if guess_type == ObjectStorage.__name__:
-            return pickle.loads(data)
-        elif guess_type == Simple.__name__:
-            return data
-        elif guess_type == Void.__name__:
-            return data
-        elif guess_type == Tuple.__name__:
-            return tuple(data)
-        else:
-            raise ValueError(
-                f"Unsupported type of stored object inside cassette: {guess_type}"
-            )
+            # use cassette of this object (in case of out-of-band buffers)
+            return ObjectStorage.from_serializable(self, data)
+        # do not pass cassette, it is not needed and it would be set to the class
+        instance = self.get_serializer(guess_type)(
+            store_keys=self.store_keys,
+            cassette=None,
+            storage_object_kwargs=self.storage_object_kwargs,
+        )
+        return instance.from_serializable(data)
@@ -10,8 +10,17 @@ This file is used by users to import special recording decorators or context man
 """
 
 from requre.helpers.git.helper import record_git_module
-from requre.helpers.httpx_response import record_httpx, recording_httpx
-from requre.helpers.requests_response import record_requests, recording_requests
+from requre.helpers.httpx_response import (
+    AsyncCassetteTransport,
+    CassetteTransport,
+    record_httpx,
+    recording_httpx,
+)
+from requre.helpers.requests_response import (
+    CassetteAdapter,
+    record_requests,
+    recording_requests,
+)
 from requre.helpers.tempfile import record_tempfile_module
 
 __all__ = [
@@ -21,4 +30,7 @@ __all__ = [
     record_git_module.__name__,
     record_httpx.__name__,
     recording_httpx.__name__,
+    CassetteTransport.__name__,
+    AsyncCassetteTransport.__name__,
+    CassetteAdapter.__name__,
 ]
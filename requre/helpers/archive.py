@@ -0,0 +1,423 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Codecs of tar archives, what are used by StoreFiles to store files and directories.
+Codec of stored archive is detected from its file name when replaying.
+Replayed archives are extracted once per session to ExtractionCache.
+"""
+
+import atexit
+import bz2
+import gzip
+import logging
+import lzma
+import os
+import shutil
+import stat
+import tarfile
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional
+
+from requre.exceptions import PersistentStorageException
+
+logger = logging.getLogger(__name__)
+
+# ioctl request of Linux to clone file (reflink, copy-on-write)
+FICLONE = 0x40049409
+
+
+class TarCodec:
+    """
+    Compression of tar archive supported by tarfile module
+
+    :param name: name of the codec, used as suffix of archive (.tar.<name>)
+    :param compress_function: function to compress whole tar archive
+    :param level_argument: argument of compress_function to set compression level
+    """
+
+    # members can be read without reading whole archive
+    random_access = False
+
+    def __init__(
+        self,
+        name: str,
+        compress_function: Optional[Callable[..., bytes]] = None,
+        level_argument: Optional[str] = None,
+    ):
+        self.name = name
+        self.compress_function = compress_function
+        self.level_argument = level_argument
+
+    @property
+    def suffix(self) -> str:
+        return f".tar.{self.name}" if self.name else ".tar"
+
+    def compress(self, payload: bytes, level: Optional[int] = None) -> bytes:
+        """
+        Compress uncompressed tar archive
+
+        :param payload: content of tar archive
+        :param level: compression level, default level of the codec when not set
+        """
+        if self.compress_function is None:
+            return payload
+        kwargs: Dict[str, Any] = {}
+        if level is not None and self.level_argument:
+            kwargs[self.level_argument] = level
+        return self.compress_function(payload, **kwargs)
+
+    def open(self, content: bytes) -> tarfile.TarFile:
+        """
+        Open archive for reading
+
+        :param content: content of archive file
+        """
+        return tarfile.open(  # type: ignore
+            mode=f"r:{self.name}", fileobj=BytesIO(content)
+        )
+
+    def extract(self, archive_path: str, target: str) -> None:
+        """
+        Extract archive without its top directory to target directory,
+        or to target file when archive contains single file
+
+        :param archive_path: path of archive file
+        :param target: path of extracted file or directory
+        """
+        with open(archive_path, "rb") as archive_file:
+            content = archive_file.read()
+        with self.open(content) as tar_store:
+            members = tar_store.getmembers()
+            if members[0].isfile():
+                with open(target, mode="wb") as output_file:
+                    output_file.write(
+                        tar_store.extractfile(members[0]).read()  # type: ignore
+                    )
+                return
+            for tar_item in members:
+                # we have to modify path of files to remove topdir
+                if len(tar_item.name.split(os.path.sep, 1)) > 1:
+                    tar_item.name = tar_item.name.split(os.path.sep, 1)[1]
+                else:
+                    tar_item.name = "."
+                tar_store.extract(tar_item, path=target)
+
+    def extract_member(self, archive_path: str, member: str, target: str) -> None:
+        """
+        Extract one file of archive (path without top directory) to target file,
+        just codecs with random_access do not read whole archive
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            extracted = os.path.join(temp_dir, "extracted")
+            self.extract(archive_path, extracted)
+            shutil.move(os.path.join(extracted, member), target)
+
+
+class ZstdTarCodec(TarCodec):
+    """
+    Zstandard compression, available when zstandard module is installed
+    """
+
+    def __init__(self):
+        super().__init__("zst")
+
+    @staticmethod
+    def _zstandard():
+        try:
+            import zstandard  # type: ignore
+        except ImportError as ex:
+            raise PersistentStorageException(
+                "zstandard module has to be installed to use zst archives."
+            ) from ex
+        return zstandard
+
+    def compress(self, payload: bytes, level: Optional[int] = None) -> bytes:
+        compressor = self._zstandard().ZstdCompressor(
+            level=3 if level is None else level
+        )
+        return compressor.compress(payload)
+
+    def open(self, content: bytes) -> tarfile.TarFile:
+        decompressor = self._zstandard().ZstdDecompressor().decompressobj()
+        return tarfile.open(
+            mode="r:", fileobj=BytesIO(decompressor.decompress(content))
+        )
+
+
+class ZipCodec(TarCodec):
+    """
+    Zip archive, members are compressed separately (deflate) and listed
+    in central index, so replay extracts them in parallel threads
+    or reads just needed ones (see ExtractionCache.extract_member).
+    Archive is converted from tar payload, timestamps are not stored.
+    """
+
+    random_access = True
+
+    def __init__(self, workers: Optional[int] = None):
+        super().__init__("zip")
+        self.workers = workers
+
+    @property
+    def suffix(self) -> str:
+        return ".zip"
+
+    def compress(self, payload: bytes, level: Optional[int] = None) -> bytes:
+        output = BytesIO()
+        with tarfile.open(mode="r:", fileobj=BytesIO(payload)) as tar_store:
+            with zipfile.ZipFile(output, mode="w") as zip_store:
+                for member in tar_store.getmembers():
+                    name = f"{member.name}/" if member.isdir() else member.name
+                    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+                    if member.isdir():
+                        info.external_attr = (stat.S_IFDIR | member.mode) << 16
+                        data = b""
+                    elif member.issym():
+                        info.external_attr = (stat.S_IFLNK | member.mode) << 16
+                        data = member.linkname.encode()
+                    else:
+                        info.external_attr = (stat.S_IFREG | member.mode) << 16
+                        data = tar_store.extractfile(member).read()  # type: ignore
+                    zip_store.writestr(
+                        info,
+                        data,
+                        compress_type=zipfile.ZIP_DEFLATED,
+                        compresslevel=level,
+                    )
+        return output.getvalue()
+
+    def open(self, content: bytes) -> tarfile.TarFile:
+        raise PersistentStorageException("zip archives are not tar archives")
+
+    @staticmethod
+    def _write_member(
+        zip_store: zipfile.ZipFile, info: zipfile.ZipInfo, target: str
+    ) -> None:
+        mode = info.external_attr >> 16
+        if os.path.lexists(target) and not os.path.isdir(target):
+            os.remove(target)
+        if stat.S_ISLNK(mode):
+            os.symlink(zip_store.read(info).decode(), target)
+            return
+        # decompression of members runs in parallel, it does not hold GIL
+        with zip_store.open(info) as member_file, open(target, "wb") as output_file:
+            shutil.copyfileobj(member_file, output_file)
+        os.chmod(target, stat.S_IMODE(mode))
+
+    def extract(self, archive_path: str, target: str) -> None:
+        with zipfile.ZipFile(archive_path) as zip_store:
+            infos = zip_store.infolist()
+            if not infos[0].is_dir():
+                self._write_member(zip_store, infos[0], target)
+                return
+            top_dir = infos[0].filename
+            os.makedirs(target, exist_ok=True)
+            directories = []
+            files = []
+            for info in infos[1:]:
+                path = os.path.join(target, info.filename.replace(top_dir, "", 1))
+                if info.is_dir():
+                    os.makedirs(path, exist_ok=True)
+                    directories.append((path, info))
+                else:
+                    files.append((info, path))
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                for _ in executor.map(
+                    lambda item: self._write_member(zip_store, *item), files
+                ):
+                    pass
+            for path, info in reversed(directories):
+                os.chmod(path, stat.S_IMODE(info.external_attr >> 16))
+
+    def extract_member(self, archive_path: str, member: str, target: str) -> None:
+        with zipfile.ZipFile(archive_path) as zip_store:
+            top_dir = zip_store.infolist()[0].filename
+            self._write_member(zip_store, zip_store.getinfo(top_dir + member), target)
+
+
+TAR_CODECS: Dict[str, TarCodec] = {
+    codec.name: codec
+    for codec in [
+        TarCodec("xz", lzma.compress, level_argument="preset"),
+        # without timestamp in header, same payload gives same archive
+        TarCodec("gz", partial(gzip.compress, mtime=0), "compresslevel"),
+        TarCodec("bz2", bz2.compress, level_argument="compresslevel"),
+        ZstdTarCodec(),
+        ZipCodec(),
+        TarCodec(""),
+    ]
+}
+
+
+def get_codec(name: Optional[str]) -> TarCodec:
+    """
+    Codec by name: xz, gz, bz2, zst, zip, or none (or empty string) for uncompressed tar
+
+    :param name: name of the codec
+    :return: TarCodec instance
+    """
+    name = name or ""
+    name = {"none": "", "gzip": "gz", "zstd": "zst"}.get(name, name)
+    if name not in TAR_CODECS:
+        raise PersistentStorageException(
+            f"Unknown archive codec {name}, supported: {', '.join(TAR_CODECS)}"
+        )
+    return TAR_CODECS[name]
+
+
+def codec_from_file_name(file_name: str) -> TarCodec:
+    """
+    Detect codec of archive from its suffix (.tar.<codec>, .zip or .tar)
+    """
+    for codec in TAR_CODECS.values():
+        if codec.name and file_name.endswith(codec.suffix):
+            return codec
+    if file_name.endswith(".tar"):
+        return TAR_CODECS[""]
+    raise PersistentStorageException(f"Unknown archive type of {file_name}")
+
+
+def clone_file(source: str, target: str) -> None:
+    """
+    Copy file with its permissions, via reflink (copy-on-write clone) when
+    filesystem supports it, so content is not copied. Existing target is replaced.
+    Modification time is not copied (archives store normalized one),
+    target has time of its creation.
+    """
+    if os.path.lexists(target) and not os.path.isdir(target):
+        # rewrite readonly files as well
+        os.remove(target)
+    if ExtractionCache.use_reflinks:
+        try:
+            import fcntl
+
+            with open(source, "rb") as source_file, open(target, "wb") as target_file:
+                fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+            shutil.copymode(source, target)
+            return
+        except (ImportError, OSError) as ex:
+            logger.debug(f"Reflinks are not used: {ex!r}")
+            ExtractionCache.use_reflinks = False
+    shutil.copyfile(source, target)
+    shutil.copymode(source, target)
+
+
+class ExtractionCache:
+    """
+    Archives extracted once per session to temporary directory, replayed files
+    and directories are then materialized from it via clone_file,
+    instead of decompressing and extracting the archive again for every target.
+    """
+
+    use_reflinks = True
+    _directory: Optional[str] = None
+    # extracted path by (path, size, mtime) of archive, or (path, member)
+    _extracted: Dict[Any, str] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def directory(cls) -> str:
+        if cls._directory is None:
+            cls._directory = tempfile.mkdtemp(prefix="requre_extracted_")
+            atexit.register(shutil.rmtree, cls._directory, True)
+        return cls._directory
+
+    @classmethod
+    def extract(cls, archive_path: str, codec: TarCodec) -> str:
+        """
+        Extract archive (without its top directory) if not extracted yet
+
+        :param archive_path: path of archive file
+        :param codec: codec of the archive
+        :return: path of extracted file or directory
+        """
+        stat = os.stat(archive_path)
+        key = (os.path.realpath(archive_path), stat.st_size, stat.st_mtime_ns)
+        with cls._lock:
+            extracted = cls._extracted.get(key)
+            if extracted is not None:
+                return extracted
+            extracted = os.path.join(cls.directory(), str(len(cls._extracted)))
+            codec.extract(archive_path, extracted)
+            logger.debug(f"Extracted {archive_path} to {extracted}")
+            cls._extracted[key] = extracted
+            return extracted
+
+    @classmethod
+    def extract_member(cls, archive_path: str, codec: TarCodec, member: str) -> str:
+        """
+        Extract one file of archive if not extracted yet, whole archive is extracted
+        when codec does not support random access
+
+        :param archive_path: path of archive file
+        :param codec: codec of the archive
+        :param member: path of file inside archive (without top directory)
+        :return: path of extracted file
+        """
+        if not codec.random_access:
+            return os.path.join(cls.extract(archive_path, codec), member)
+        key = (os.path.realpath(archive_path), member)
+        with cls._lock:
+            extracted = cls._extracted.get(key)
+            if extracted is None:
+                extracted = os.path.join(cls.directory(), str(len(cls._extracted)))
+                codec.extract_member(archive_path, member, extracted)
+                cls._extracted[key] = extracted
+        return extracted
+
+    @staticmethod
+    def _replace_link(source: str, target: str) -> None:
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target)
+        elif os.path.lexists(target):
+            os.remove(target)
+        os.symlink(os.readlink(source), target)
+
+    @classmethod
+    def materialize(cls, extracted: str, target: str) -> None:
+        """
+        Create file or directory tree (merged with existing one) from extracted one,
+        existing files and symlinks are replaced
+        """
+        if not os.path.isdir(extracted):
+            clone_file(extracted, target)
+            return
+        directories = [(extracted, target)]
+        os.makedirs(target, exist_ok=True)
+        for root, dirs, files in os.walk(extracted):
+            target_root = os.path.join(target, os.path.relpath(root, extracted))
+            for name in dirs + files:
+                source_path = os.path.join(root, name)
+                target_path = os.path.join(target_root, name)
+                if os.path.islink(source_path):
+                    cls._replace_link(source_path, target_path)
+                elif os.path.isdir(source_path):
+                    if os.path.islink(target_path) or os.path.isfile(target_path):
+                        os.remove(target_path)
+                    os.makedirs(target_path, exist_ok=True)
+                    directories.append((source_path, target_path))
+                else:
+                    clone_file(source_path, target_path)
+            # do not descend to symlinks of directories
+            dirs[:] = [
+                name for name in dirs if not os.path.islink(os.path.join(root, name))
+            ]
+        # files can't be created in readonly directories, set modes at the end
+        for source_path, target_path in reversed(directories):
+            shutil.copymode(source_path, target_path)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            for extracted in cls._extracted.values():
+                if os.path.isdir(extracted):
+                    shutil.rmtree(extracted, ignore_errors=True)
+                elif os.path.exists(extracted):
+                    os.remove(extracted)
+            cls._extracted.clear()
@@ -2,15 +2,28 @@
 # SPDX-License-Identifier: MIT
 
 import functools
+import hashlib
 import logging
 import os
+import stat
 import tarfile
+import tempfile
+import warnings
+from concurrent.futures import Future, ProcessPoolExecutor
 from io import BytesIO
-from typing import Any, Dict, Optional, Type, Union
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
 
+from requre.blobs import BlobStore
 from requre.cassette import Cassette, CassetteExecution, StorageMode
 from requre.exceptions import PersistentStorageException
 from requre.guess_object import Guess
+from requre.helpers.archive import (
+    ExtractionCache,
+    TarCodec,
+    clone_file,
+    codec_from_file_name,
+    get_codec,
+)
 from requre.objects import ObjectStorage
 from requre.simple_object import Simple
 
@@ -24,9 +37,48 @@ def return_cls_type(cassette: Optional[Cassette]) -> Union[Type[Simple], Type[Gu
         return Guess
 
 
+def _write_snapshot(
+    directory: str, name: str, codec: TarCodec, payload: bytes, level: Optional[int]
+) -> None:
+    """
+    Compress snapshot and write it to BlobStore, run in worker process as well
+    """
+    BlobStore(directory).write_once(name, codec.compress(payload, level))
+
+
+def _write_staged_snapshot(
+    directory: str, name: str, codec: TarCodec, staged: str, level: Optional[int]
+) -> None:
+    """
+    Compress snapshot staged to file by recording process, run in worker process
+    """
+    try:
+        with open(staged, "rb") as staged_file:
+            payload = staged_file.read()
+        _write_snapshot(directory, name, codec, payload, level)
+    finally:
+        os.remove(staged)
+
+
 class StoreFiles(ObjectStorage):
     dir_suffix = "file_storage"
+    # codec of archives (xz, gz, bz2, zst, zip or none), see requre.helpers.archive
     tar_compression = "xz"
+    # compression level, default level of the codec when None
+    tar_compression_level: Optional[int] = None
+    # number of processes compressing snapshots in background while test continues,
+    # snapshots are compressed before returning to the test when 0;
+    # uncompressed snapshot is staged to temporary file in blob directory
+    # for worker, so it is not held in memory until worker takes it
+    compression_workers = 0
+    _executor: Optional[ProcessPoolExecutor] = None
+    _executor_workers = 0
+    # snapshots being compressed, by path of archive,
+    # removed when waited for or when written successfully
+    _pending: Dict[str, Future] = {}
+    # store directories as manifest of files, where just files changed since
+    # previous snapshot of the same directory are archived
+    delta_snapshots = False
     basic_ps_keys = ["X", "file", "tar"]
     _cassette: Cassette = None
 
@@ -34,24 +86,274 @@ class StoreFiles(ObjectStorage):
     def _test_identifier(cassette):
         return os.path.basename(cassette.storage_file)
 
+    @classmethod
+    def _codec(cls, cassette: Cassette) -> Tuple[TarCodec, Optional[int]]:
+        """
+        Codec and compression level of stored archives, set for cassette or class
+        """
+        codec = get_codec(cassette.file_compression or cls.tar_compression)
+        level = cassette.file_compression_level
+        if level is None:
+            level = cls.tar_compression_level
+        return codec, level
+
+    @staticmethod
+    def _snapshot_filter(tarinfo: tarfile.TarInfo) -> tarfile.TarInfo:
+        # owner and modification time are not part of snapshot,
+        # same content gives same payload (and name of archive)
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = ""
+        tarinfo.mtime = 0
+        return tarinfo
+
+    @classmethod
+    def store_snapshot(cls, cassette: Cassette, pathname: str) -> str:
+        """
+        Store file or directory as tar archive named by sha256 of its uncompressed
+        content. Archives are shared by storage files inside test_data directory
+        (see BlobStore) and every snapshot is written (and compressed) just once.
+        Content is captured immediately, compression runs in background processes
+        when compression_workers is set and cassette.dump() waits for it.
+
+        :param cassette: Cassette instance
+        :param pathname: file or directory to store
+        :return: path of archive relative to directory of storage file
+        """
+        with BytesIO() as fileobj:
+            with tarfile.open(mode="w", fileobj=fileobj) as tar_store:
+                tar_store.add(
+                    pathname,
+                    arcname=os.path.basename(os.path.normpath(pathname)),
+                    filter=cls._snapshot_filter,
+                )
+            payload = fileobj.getvalue()
+        return cls._store_archive(cassette, payload)
+
+    @classmethod
+    def _store_archive(cls, cassette: Cassette, payload: bytes) -> str:
+        """
+        Store uncompressed tar archive named by its sha256, see store_snapshot
+        """
+        codec, level = cls._codec(cassette)
+        blob_store = BlobStore.for_storage_file(cassette.storage_file)
+        name = f"{hashlib.sha256(payload).hexdigest()}{codec.suffix}"
+        path = blob_store.path(name)
+        cls._prune_pending()
+        if not os.path.exists(path) and path not in cls._pending:
+            if cls.compression_workers:
+                os.makedirs(blob_store.directory, exist_ok=True)
+                fd, staged = tempfile.mkstemp(dir=blob_store.directory, prefix=".tmp_")
+                with os.fdopen(fd, "wb") as staged_file:
+                    staged_file.write(payload)
+                cls._pending[path] = cls._get_executor().submit(
+                    _write_staged_snapshot,
+                    blob_store.directory,
+                    name,
+                    codec,
+                    staged,
+                    level,
+                )
+            else:
+                _write_snapshot(blob_store.directory, name, codec, payload, level)
+        if path in cls._pending:
+            # storage file is not dumped before archive is written
+            cassette.add_dump_hook(functools.partial(cls.wait_for_snapshot, path))
+        return os.path.relpath(
+            path,
+            os.path.dirname(os.path.abspath(cassette.storage_file)),
+        )
+
     @staticmethod
-    def store_file_content(cassette: Cassette, content: Any, file_name: str):
-        generated = f"{os.path.basename(cassette.storage_file)}.{file_name}_"
-        target_dir = os.path.realpath(os.path.dirname(cassette.storage_file))
-        # generate unique number for each file store to avoid rewrite current content
-        # increase highest number
-        suffix = f".tar.{StoreFiles.tar_compression}"
-        existing_nums = sorted(
-            int(x.replace(generated, "").replace(suffix, ""))
-            for x in os.listdir(target_dir)
-            if x.startswith(generated)
+    def _file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def store_delta_snapshot(cls, cassette: Cassette, pathname: str) -> List[Dict]:
+        """
+        Store directory as manifest of its files (path, mode, size, sha256).
+        Files with content not stored by previous snapshot of the same directory
+        are stored to tar archive (see store_snapshot) with members named by sha256,
+        manifest references archive of every file.
+
+        :param cassette: Cassette instance
+        :param pathname: directory to store
+        :return: manifest, list of dicts
+        """
+        # previous manifests are kept by cassette, {directory: {path: (size, mtime,
+        # sha256, archive)}}, and start again with new storage file
+        key = os.path.realpath(pathname)
+        previous = cassette.file_manifests.get(key, {})
+        archived = {item[2]: item[3] for item in previous.values()}
+        mtimes: Dict[str, int] = {}
+        changed: Dict[str, str] = {}
+        manifest: List[Dict] = []
+        for root, dirs, files in os.walk(pathname):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                full_path = os.path.join(root, name)
+                file_stat = os.lstat(full_path)
+                entry: Dict[str, Any] = {
+                    "path": os.path.relpath(full_path, pathname),
+                    "mode": stat.S_IMODE(file_stat.st_mode),
+                }
+                manifest.append(entry)
+                if stat.S_ISLNK(file_stat.st_mode):
+                    entry["link"] = os.readlink(full_path)
+                elif stat.S_ISREG(file_stat.st_mode):
+                    entry["size"] = file_stat.st_size
+                    old = previous.get(entry["path"])
+                    if old and old[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+                        # not changed, do not read it again
+                        entry["sha256"] = old[2]
+                    else:
+                        entry["sha256"] = cls._file_digest(full_path)
+                    if entry["sha256"] not in archived:
+                        changed[entry["sha256"]] = full_path
+                    mtimes[entry["path"]] = file_stat.st_mtime_ns
+        if changed:
+            with BytesIO() as fileobj:
+                with tarfile.open(mode="w", fileobj=fileobj) as tar_store:
+                    # top directory, removed when extracting
+                    top_dir = tarfile.TarInfo("objects")
+                    top_dir.type = tarfile.DIRTYPE
+                    top_dir.mode = 0o755
+                    tar_store.addfile(top_dir)
+                    for digest, full_path in changed.items():
+                        tar_store.add(
+                            full_path,
+                            arcname=f"objects/{digest}",
+                            filter=cls._snapshot_filter,
+                        )
+                payload = fileobj.getvalue()
+            archive = cls._store_archive(cassette, payload)
+            archived.update((digest, archive) for digest in changed)
+        current = {}
+        for entry in manifest:
+            if "sha256" in entry:
+                entry["archive"] = archived[entry["sha256"]]
+                current[entry["path"]] = (
+                    entry["size"],
+                    mtimes[entry["path"]],
+                    entry["sha256"],
+                    entry["archive"],
+                )
+        cassette.file_manifests[key] = current
+        return manifest
+
+    @classmethod
+    def restore_delta_snapshot(
+        cls, cassette: Cassette, manifest: List[Dict], pathname: str
+    ) -> None:
+        """
+        Create files of manifest (see store_delta_snapshot) in directory pathname
+        """
+        directories = []
+        os.makedirs(pathname, exist_ok=True)
+        for entry in manifest:
+            target = os.path.join(pathname, entry["path"])
+            if "link" in entry:
+                if os.path.lexists(target):
+                    os.remove(target)
+                os.symlink(entry["link"], target)
+            elif "sha256" in entry:
+                archive = entry["archive"]
+                archive_path = os.path.join(
+                    os.path.dirname(cassette.storage_file), archive
+                )
+                cls.wait_for_snapshot(os.path.abspath(archive_path))
+                # just needed files are read from archives with random access
+                extracted = ExtractionCache.extract_member(
+                    archive_path, codec_from_file_name(archive), entry["sha256"]
+                )
+                clone_file(extracted, target)
+                os.chmod(target, entry["mode"])
+            else:
+                os.makedirs(target, exist_ok=True)
+                directories.append(entry)
+        # files can't be created in readonly directories, set modes at the end
+        for entry in reversed(directories):
+            os.chmod(os.path.join(pathname, entry["path"]), entry["mode"])
+
+    @classmethod
+    def _get_executor(cls) -> ProcessPoolExecutor:
+        if (
+            cls._executor is not None
+            and cls._executor_workers != cls.compression_workers
+        ):
+            cls.shutdown_executor()
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=cls.compression_workers)
+            cls._executor_workers = cls.compression_workers
+        return cls._executor
+
+    @classmethod
+    def shutdown_executor(cls) -> None:
+        """
+        Wait for snapshots compressed in background and stop worker processes,
+        they are started again by next snapshot if compression_workers is set
+        """
+        for path in list(cls._pending):
+            cls.wait_for_snapshot(path)
+        if cls._executor is not None:
+            cls._executor.shutdown()
+            cls._executor = None
+            cls._executor_workers = 0
+
+    @classmethod
+    def _prune_pending(cls) -> None:
+        # failed ones are kept to raise the exception in wait_for_snapshot
+        for path, future in list(cls._pending.items()):
+            if future.done() and future.exception() is None:
+                del cls._pending[path]
+
+    @classmethod
+    def wait_for_snapshot(cls, path: str) -> None:
+        """
+        Wait until archive compressed in background is written,
+        exception of compression is raised here
+
+        :param path: path of archive
+        """
+        future = cls._pending.pop(path, None)
+        if future is not None:
+            future.result()
+
+    @classmethod
+    def store_file_content(
+        cls,
+        cassette: Cassette,
+        content: bytes,
+        file_name: Optional[str] = None,
+        suffix: Optional[str] = None,
+    ) -> str:
+        """
+        Store content of already compressed archive, named by its sha256,
+        see store_snapshot to store files
+
+        :param cassette: Cassette instance
+        :param content: content of archive
+        :param file_name: DEPRECATED, not used, archive is named by its content
+        :param suffix: suffix of archive, suffix of codec of cassette by default
+        :return: path of archive relative to directory of storage file
+        """
+        if file_name is not None:
+            warnings.warn(
+                "file_name of StoreFiles.store_file_content is not used, "
+                "archive is named by its content",
+                DeprecationWarning,
+            )
+        suffix = suffix or cls._codec(cassette)[0].suffix
+        blob_store = BlobStore.for_storage_file(cassette.storage_file)
+        name = f"{hashlib.sha256(content).hexdigest()}{suffix}"
+        blob_store.write_once(name, content)
+        return os.path.relpath(
+            blob_store.path(name),
+            os.path.dirname(os.path.abspath(cassette.storage_file)),
         )
-        next_num = 1 if not existing_nums else existing_nums[-1] + 1
-        file_path = os.path.join(target_dir, f"{generated}{next_num}{suffix}")
-        with open(file_path, "wb") as outfile:
-            outfile.write(content)
-        # return properly generated unique file name
-        return os.path.basename(file_path)
 
     @staticmethod
     def read_file_content(
@@ -68,33 +370,6 @@ class StoreFiles(ObjectStorage):
             content = infile.read()
         return content
 
-    @classmethod
-    def __write_file(cls, content, pathname):
-        with BytesIO(content) as fileobj:
-            with tarfile.open(
-                mode=f"r:{cls.tar_compression}", fileobj=fileobj
-            ) as tar_store:
-                members = tar_store.getmembers()
-                tarinfo_1st_member = members[0]
-                if tarinfo_1st_member.isfile():
-                    with open(pathname, mode="wb") as output_file:
-                        output_file.write(
-                            tar_store.extractfile(tarinfo_1st_member).read()
-                        )
-                    return
-                for tar_item in members:
-                    # we have to modify path of files to remove topdir
-                    if len(tar_item.name.split(os.path.sep, 1)) > 1:
-                        tar_item.name = tar_item.name.split(os.path.sep, 1)[1]
-                    else:
-                        tar_item.name = "."
-                    try:
-                        tar_store.extract(tar_item, path=pathname)
-                    except OSError:
-                        # rewrite readonly files if necessary
-                        os.remove(os.path.join(pathname, tar_item.name))
-                        tar_store.extract(tar_item, path=pathname)
-
     @classmethod
     def _copy_logic(
         cls,
@@ -106,61 +381,70 @@ class StoreFiles(ObjectStorage):
     ) -> Any:
         """
         Internal function. Copy files to or back from persisten storage
-        It will create tar archive with tar_compression and stores it to Persistent Storage
+        It will create tar archive with tar_compression (or file_compression of cassette)
+        and stores reference to it to Persistent Storage
         """
         FILENAME = "filename"
         TARGET_PATH = "target_path"
         RETURNED = "return_value"
+        MANIFEST = "manifest"
         serialization = ret_store_cls(store_keys=["not_important"], cassette=cassette)
         logger.debug(f"Copy files {pathname} -> {keys}")
         logger.debug(f"Persistent Storage mode: {cassette.mode}")
-        original_cwd = os.getcwd()
         if cassette.do_store(keys=cls.basic_ps_keys + keys):
-            try:
-                artifact_name = os.path.basename(pathname)
-                artifact_path = os.path.dirname(pathname)
-                os.chdir(artifact_path)
-                with BytesIO() as fileobj:
-                    with tarfile.open(
-                        mode=f"x:{cls.tar_compression}", fileobj=fileobj
-                    ) as tar_store:
-                        tar_store.add(name=artifact_name)
-                    metadata = {cassette.data_miner.LATENCY_KEY: 0}
-                    file_name = cls.store_file_content(
-                        cassette=cassette,
-                        file_name=os.path.basename(pathname),
-                        content=fileobj.getvalue(),
-                    )
-                    serialized = serialization.to_serializable(return_value)
-                    output = {
-                        FILENAME: file_name,
-                        RETURNED: serialized,
-                        TARGET_PATH: pathname,
-                    }
-                    cassette.store(
-                        keys=cls.basic_ps_keys + keys,
-                        values=output,
-                        metadata=metadata,
-                    )
-            finally:
-                os.chdir(original_cwd)
+            metadata = {cassette.data_miner.LATENCY_KEY: 0}
+            output = {
+                RETURNED: serialization.to_serializable(return_value),
+                TARGET_PATH: pathname,
+            }
+            if cls.delta_snapshots and os.path.isdir(pathname):
+                output[MANIFEST] = cls.store_delta_snapshot(
+                    cassette=cassette, pathname=pathname
+                )
+            else:
+                output[FILENAME] = cls.store_snapshot(
+                    cassette=cassette, pathname=pathname
+                )
+            cassette.store(
+                keys=cls.basic_ps_keys + keys,
+                values=output,
+                metadata=metadata,
+            )
         else:
             output = cassette[cls.basic_ps_keys + keys]
             pathname = pathname or output[RETURNED]
-            content = cls.read_file_content(
-                cassette=cassette, file_name=output[FILENAME]
-            )
             # WORKAROUND: some parts expects old dir and some new one. so copy to both to ensure.
             # mainly when creating complex objects.
-            for item in [pathname, output[TARGET_PATH]]:
-                cls.__write_file(content, item)
+            targets = {os.path.realpath(pathname): pathname}
+            targets.setdefault(
+                os.path.realpath(output[TARGET_PATH]), output[TARGET_PATH]
+            )
+            if MANIFEST in output:
+                for item in targets.values():
+                    cls.restore_delta_snapshot(cassette, output[MANIFEST], item)
+            else:
+                archive_path = os.path.join(
+                    os.path.dirname(cassette.storage_file), output[FILENAME]
+                )
+                cls.wait_for_snapshot(os.path.abspath(archive_path))
+                if not os.path.exists(archive_path):
+                    raise FileNotFoundError(
+                        f"requre cannot read from file {archive_path}"
+                    )
+                # archive is extracted once per session
+                extracted = ExtractionCache.extract(
+                    archive_path, codec_from_file_name(output[FILENAME])
+                )
+                for item in targets.values():
+                    ExtractionCache.materialize(extracted, item)
             return_value = serialization.from_serializable(output[RETURNED])
         return return_value
 
     @classmethod
     def __get_executor_and_return_cls(cls, cassette, output_cls):
         casex = CassetteExecution()
-        casex.cassette = cassette or cls.get_cassette()
+        casex.cassette = cassette
+        casex.default_cassette = cls.get_cassette()
         casex.obj_cls = cls
         if not output_cls:
             output_cls = return_cls_type(cassette)
@@ -0,0 +1,229 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Git-aware snapshots of repositories: git bundles with objects what were not stored
+by previous bundle of the same repository, instead of archives of whole directory.
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from requre.blobs import BlobStore
+from requre.cassette import Cassette
+from requre.exceptions import PersistentStorageException
+from requre.helpers.files import StoreFiles
+
+logger = logging.getLogger(__name__)
+
+FILENAME = "filename"
+TARGET_PATH = "target_path"
+RETURNED = "return_value"
+REFS = "refs"
+HEAD_KEY = "head"
+BARE = "bare"
+CONFIG = "config"
+
+BUNDLE_SUFFIX = ".bundle"
+
+
+def git(cwd: str, *args: str, stdin: Optional[str] = None, check: bool = True) -> str:
+    """
+    Run git command in directory and return its stripped output
+
+    :param check: raise PersistentStorageException when command fails
+    """
+    try:
+        return subprocess.run(
+            ["git", *args],
+            cwd=cwd,
+            input=stdin,
+            capture_output=True,
+            text=True,
+            check=check,
+        ).stdout.strip()
+    except subprocess.CalledProcessError as ex:
+        raise PersistentStorageException(
+            f"git {' '.join(args)} failed in {cwd}: {ex.stderr.strip()}"
+        ) from ex
+
+
+class GitBundle(StoreFiles):
+    """
+    Store git repository (e.g. created by git.Repo.clone_from) as git bundle.
+    Bundle contains just objects not stored by previous bundle of the same repository
+    in the same storage file, refs are stored in storage file.
+    Replay creates repository if needed, unbundles objects and restores refs.
+    """
+
+    basic_ps_keys = ["X", "file", "git"]
+    # refs what are restored when replaying
+    ref_prefixes = ["refs/"]
+    # restore HEAD, remotes and working tree, as after clone
+    restore_checkout = True
+    # commits of refs already stored, by storage file and git dir
+    _stored_tips: Dict[Tuple[str, str], Set[str]] = {}
+
+    @staticmethod
+    def _refs(git_dir: str) -> Dict[str, str]:
+        output = git(git_dir, "for-each-ref", "--format=%(objectname) %(refname)")
+        refs = {}
+        for line in output.splitlines():
+            sha, ref = line.split(" ", 1)
+            refs[ref] = sha
+        return refs
+
+    @classmethod
+    def store_bundle(
+        cls, cassette: Cassette, git_dir: str, refs: Dict[str, str]
+    ) -> Optional[str]:
+        """
+        Store bundle with objects of refs not stored yet to BlobStore
+
+        :return: path of bundle relative to directory of storage file,
+                 None when there is nothing new to store
+        """
+        if not refs:
+            return None
+        key = (os.path.abspath(cassette.storage_file), git_dir)
+        stored = cls._stored_tips.setdefault(key, set())
+        exclude = [f"^{sha}" for sha in sorted(stored)]
+        new_objects = git(
+            git_dir, "rev-list", "--objects", "-n1", *refs.values(), *exclude
+        )
+        stored.update(refs.values())
+        if not new_objects:
+            return None
+        blob_store = BlobStore.for_storage_file(cassette.storage_file)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            bundle_path = os.path.join(temp_dir, f"snapshot{BUNDLE_SUFFIX}")
+            git(
+                git_dir,
+                "bundle",
+                "create",
+                "-q",
+                bundle_path,
+                "--stdin",
+                stdin="\n".join(list(refs) + exclude) + "\n",
+            )
+            with open(bundle_path, "rb") as bundle_file:
+                content = bundle_file.read()
+        name = f"{hashlib.sha256(content).hexdigest()}{BUNDLE_SUFFIX}"
+        blob_store.write_once(name, content)
+        return os.path.relpath(
+            blob_store.path(name),
+            os.path.dirname(os.path.abspath(cassette.storage_file)),
+        )
+
+    @classmethod
+    def restore(cls, cassette: Cassette, pathname: str, output: Dict) -> None:
+        """
+        Restore repository stored by _copy_logic to pathname
+        """
+        # do not look for repository in parent directories
+        if not os.path.isfile(os.path.join(pathname, "HEAD")) and not os.path.exists(
+            os.path.join(pathname, ".git")
+        ):
+            os.makedirs(pathname, exist_ok=True)
+            init_args = ["--bare"] if output[BARE] else []
+            git(pathname, "init", "-q", *init_args)
+        git_dir = git(pathname, "rev-parse", "--absolute-git-dir")
+        if output[FILENAME]:
+            bundle_path = os.path.join(
+                os.path.dirname(cassette.storage_file), output[FILENAME]
+            )
+            git(git_dir, "bundle", "unbundle", os.path.abspath(bundle_path))
+        updates = [
+            f"update {ref} {sha}"
+            for ref, sha in output[REFS].items()
+            if any(ref.startswith(prefix) for prefix in cls.ref_prefixes)
+        ]
+        if updates:
+            git(git_dir, "update-ref", "--stdin", stdin="\n".join(updates) + "\n")
+        if not cls.restore_checkout:
+            return
+        for config_key in dict.fromkeys(item[0] for item in output[CONFIG]):
+            git(git_dir, "config", "--unset-all", config_key, check=False)
+        for config_key, value in output[CONFIG]:
+            git(git_dir, "config", "--add", config_key, value)
+        if output[HEAD_KEY].startswith("refs/"):
+            git(git_dir, "symbolic-ref", "HEAD", output[HEAD_KEY])
+        elif output[HEAD_KEY]:
+            git(git_dir, "update-ref", "--no-deref", "HEAD", output[HEAD_KEY])
+        if not output[BARE] and output[REFS]:
+            git(pathname, "reset", "-q", "--hard")
+
+    @classmethod
+    def _copy_logic(
+        cls,
+        cassette: Cassette,
+        pathname: str,
+        keys: list,
+        ret_store_cls: Any,
+        return_value: Any,
+    ) -> Any:
+        """
+        Internal function. Store git repository as bundle or restore it from bundles
+        """
+        serialization = ret_store_cls(store_keys=["not_important"], cassette=cassette)
+        logger.debug(f"Store git repository {pathname} -> {keys}")
+        if cassette.do_store(keys=cls.basic_ps_keys + keys):
+            git_dir = git(pathname, "rev-parse", "--absolute-git-dir")
+            refs = cls._refs(git_dir)
+            # symbolic ref of HEAD, or commit when detached
+            head = git(git_dir, "symbolic-ref", "-q", "HEAD", check=False)
+            config: List[List[str]] = []
+            if cls.restore_checkout:
+                if not head and refs:
+                    head = git(git_dir, "rev-parse", "HEAD")
+                regexp_output = git(
+                    git_dir,
+                    "config",
+                    "--local",
+                    "--get-regexp",
+                    r"^(remote|branch)\.",
+                    check=False,
+                )
+                for line in regexp_output.splitlines():
+                    config_key, _, value = line.partition(" ")
+                    config.append([config_key, value])
+            output = {
+                FILENAME: cls.store_bundle(cassette, git_dir, refs),
+                REFS: refs,
+                HEAD_KEY: head,
+                BARE: git(git_dir, "rev-parse", "--is-bare-repository") == "true",
+                CONFIG: config,
+                RETURNED: serialization.to_serializable(return_value),
+                TARGET_PATH: pathname,
+            }
+            cassette.store(
+                keys=cls.basic_ps_keys + keys,
+                values=output,
+                metadata={cassette.data_miner.LATENCY_KEY: 0},
+            )
+        else:
+            output = cassette[cls.basic_ps_keys + keys]
+            pathname = pathname or output[RETURNED]
+            # WORKAROUND of StoreFiles, restore to both paths if they differ
+            targets = {os.path.realpath(pathname): pathname}
+            targets.setdefault(
+                os.path.realpath(output[TARGET_PATH]), output[TARGET_PATH]
+            )
+            for item in targets.values():
+                cls.restore(cassette, item, output)
+            return_value = serialization.from_serializable(output[RETURNED])
+        return return_value
+
+
+class GitFetchBundle(GitBundle):
+    """
+    Store objects and remote refs fetched to existing repository,
+    local branches, HEAD and working tree are not changed when replaying
+    """
+
+    ref_prefixes = ["refs/remotes/", "refs/tags/"]
+    restore_checkout = False
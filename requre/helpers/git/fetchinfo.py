@@ -1,19 +1,21 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
-from typing import Any, Callable, List
+from typing import Any, Callable, List, Optional, Type
 
 from git.remote import FetchInfo
 from git.util import IterableList
 from requre.storage import PersistentObjectStorage
 from requre.objects import ObjectStorage
 from requre.helpers.files import StoreFiles
+from requre.helpers.git.bundle import GitBundle, GitFetchBundle
 
 
 class FetchInfoStorageList(ObjectStorage):
     # TODO: improve handling of "ref" item (need deep inspection of git objects and consequences)
     # it is not mandatory for current packit operations
-    __ignored = ["ref"]
+    # "old_commit" is git object (of fast-forwarded refs), it can't be loaded from yaml
+    __ignored = ["ref", "old_commit"]
     __response_keys_special: List[str] = []
     __response_keys = list(
         set(FetchInfo.__slots__) - set(__ignored) - set(__response_keys_special)
@@ -46,6 +48,13 @@ class RemoteFetch(FetchInfoStorageList):
     """
 
     stack_internal_check = False
+    # class what stores git dir after fetch,
+    # not stored by default to be able to replay older storage files
+    snapshot_cls: Optional[Type[StoreFiles]] = None
+
+    @staticmethod
+    def _snapshot_path(repo: Any) -> str:
+        return repo.git_dir
 
     @classmethod
     def execute(cls, keys: list, func: Callable, *args, **kwargs) -> Any:
@@ -61,11 +70,38 @@ class RemoteFetch(FetchInfoStorageList):
 
         output = super().execute(keys, func, *args, **kwargs)
         git_object = args[0]
-        git_dir = git_object.repo.git_dir
-        StoreFiles.explicit_reference(git_dir)
+        if cls.snapshot_cls is not None:
+            # function is not called, git dir is just stored or restored
+            cls.snapshot_cls.explicit_reference(
+                cls._snapshot_path(git_object.repo),
+                dest_key="fetch",
+                cassette=kwargs.get("cassette"),
+            )(lambda: None)()
         if not PersistentObjectStorage().do_store(keys):
             # mimic the code in git for read mode for Remote.fetch
             # https://github.com/gitpython-developers/GitPython/blob/master/git/remote.py
             if hasattr(git_object.repo.odb, "update_cache"):
                 git_object.repo.odb.update_cache()
         return output
+
+
+class RemoteFetchBundle(RemoteFetch):
+    """
+    Use this class for git.remote.Remote.fetch recording,
+    fetched objects are stored as git bundle (see GitFetchBundle)
+    """
+
+    snapshot_cls = GitFetchBundle
+
+
+class RemotePullBundle(RemoteFetch):
+    """
+    Use this class for git.remote.Remote.pull recording, repository
+    is stored as git bundle (see GitBundle) with its refs and working tree
+    """
+
+    snapshot_cls = GitBundle
+
+    @staticmethod
+    def _snapshot_path(repo: Any) -> str:
+        return repo.working_tree_dir or repo.git_dir
@@ -5,8 +5,13 @@ from typing import Optional
 
 from requre.cassette import Cassette
 from requre.helpers.files import StoreFiles
-from requre.helpers.git.fetchinfo import FetchInfoStorageList
-from requre.helpers.git.pushinfo import PushInfoStorageList
+from requre.helpers.git.bundle import GitBundle
+from requre.helpers.git.fetchinfo import (
+    FetchInfoStorageList,
+    RemoteFetchBundle,
+    RemotePullBundle,
+)
+from requre.helpers.git.pushinfo import PushInfoBundleList, PushInfoStorageList
 from requre.helpers.git.repo import Repo
 from requre.record_and_replace import (
     make_generic,
@@ -18,11 +23,24 @@ from requre.record_and_replace import (
 def record_git_module(
     _func=None,
     cassette: Optional[Cassette] = None,
+    git_bundles: bool = False,
 ):
+    """
+    Record git clone, fetch, pull and push of GitPython
+
+    :param cassette: Cassette instance to pass inside object to work with
+    :param git_bundles: store cloned repositories and fetched objects as git bundles
+                        (just objects not stored yet), instead of archives of whole
+                        directory after clone
+    """
+    files_cls = GitBundle if git_bundles else StoreFiles
+    fetch_cls = RemoteFetchBundle if git_bundles else FetchInfoStorageList
+    pull_cls = RemotePullBundle if git_bundles else FetchInfoStorageList
+    push_cls = PushInfoBundleList if git_bundles else PushInfoStorageList
     decorators = [
         (
             "git.repo.base.Repo.clone_from",
-            StoreFiles.where_arg_references(
+            files_cls.where_arg_references(
                 key_position_params_dict={"to_path": 2},
                 output_cls=Repo,
                 cassette=cassette,
@@ -30,10 +48,10 @@ def record_git_module(
         ),
         (
             "git.remote.Remote.push",
-            PushInfoStorageList.decorator_plain(),
+            push_cls.decorator_plain(),
         ),
-        ("git.remote.Remote.fetch", FetchInfoStorageList.decorator_plain()),
-        ("git.remote.Remote.pull", FetchInfoStorageList.decorator_plain()),
+        ("git.remote.Remote.fetch", fetch_cls.decorator_plain()),
+        ("git.remote.Remote.pull", pull_cls.decorator_plain()),
     ]
     record_git_decorator = replace_module_match_with_multiple_decorators(
         *decorators,
@@ -2,7 +2,7 @@
 # SPDX-License-Identifier: MIT
 
 import os
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Type
 
 from git.refs.head import HEAD
 from git.remote import PushInfo
@@ -11,6 +11,7 @@ from git.util import IterableList
 
 from requre.objects import ObjectStorage
 from requre.helpers.files import StoreFiles
+from requre.helpers.git.bundle import GitBundle
 
 
 class PushInfoStorageList(ObjectStorage):
@@ -20,6 +21,9 @@ class PushInfoStorageList(ObjectStorage):
         set(PushInfo.__slots__) - set(__ignored) - set(__response_keys_special)
     )
     stack_internal_check = False
+    # class what stores local remote repository after push,
+    # not stored by default to be able to replay older storage files
+    snapshot_cls: Optional[Type[StoreFiles]] = None
 
     object_type = IterableList
 
@@ -65,6 +69,17 @@ class PushInfoStorageList(ObjectStorage):
         output = super().execute(keys, func, *args, **kwargs)
         git_object = args[0]
         remote_url = git_object.repo.remotes[git_object.name].url
-        if os.path.isdir(remote_url):
-            StoreFiles.explicit_reference(remote_url)
+        if cls.snapshot_cls is not None and os.path.isdir(remote_url):
+            # function is not called, repository is just stored or restored
+            cls.snapshot_cls.explicit_reference(
+                remote_url, dest_key="push", cassette=kwargs.get("cassette")
+            )(lambda: None)()
         return output
+
+
+class PushInfoBundleList(PushInfoStorageList):
+    """
+    Store local remote repository after push as git bundle (see GitBundle)
+    """
+
+    snapshot_cls = GitBundle
@@ -2,16 +2,136 @@
 # SPDX-License-Identifier: MIT
 
 
+import asyncio
 import datetime
 import json
+import logging
 from contextlib import contextmanager
-from typing import Any, Dict, List, Optional
+from functools import partial
+from io import BytesIO
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 
 import httpx
 
-from requre.cassette import Cassette
+from requre.blobs import AsyncBlobTee, BlobStore, BlobTee
+from requre.cassette import Cassette, activate_cassette, original_time
 from requre.objects import ObjectStorage
-from requre.record_and_replace import make_generic, recording, replace
+from requre.record_and_replace import (
+    ReplacementTarget,
+    _recording_targets,
+    make_generic,
+    replace_module_match_with_multiple_decorators,
+)
+from requre.constants import BLOB_REFERENCE_KEY
+from requre.utils import (
+    get_content_compressor,
+    get_content_decompressor,
+    is_json_content_type,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayByteStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """
+    Stream of stored (decoded) body, read lazily in chunks from opened file object
+    and encoded again according to Content-Encoding on the fly,
+    so httpx decodes it back the same way as response from the server.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self, opener: Callable[[], IO[bytes]], content_encoding: Optional[str] = None
+    ) -> None:
+        self.opener = opener
+        self.content_encoding = content_encoding
+
+    def __iter__(self) -> Iterator[bytes]:
+        compressor = get_content_compressor(self.content_encoding)
+        with self.opener() as body:
+            while True:
+                chunk = body.read(self.chunk_size)
+                if not chunk:
+                    break
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        compressor = get_content_compressor(self.content_encoding)
+        # blob file is opened and read in executor, to not block event loop
+        body = await loop.run_in_executor(None, self.opener)
+        try:
+            while True:
+                if isinstance(body, BytesIO):
+                    chunk = body.read(self.chunk_size)
+                else:
+                    chunk = await loop.run_in_executor(None, body.read, self.chunk_size)
+                if not chunk:
+                    break
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+        finally:
+            body.close()
+        if compressor is not None:
+            yield compressor.flush()
+
+
+class TeeByteStream(httpx.SyncByteStream):
+    """
+    Stream of not yet read response (Client.send(stream=True)), what writes
+    (decoded) body to blob store while client reads it
+    """
+
+    def __init__(self, tee: BlobTee, stream: httpx.SyncByteStream) -> None:
+        self.tee = tee
+        self.stream = stream
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self.tee
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class AsyncTeeByteStream(httpx.AsyncByteStream):
+    """
+    TeeByteStream of AsyncClient response, rest of the body
+    is stored when the response is closed before it is read whole
+    """
+
+    def __init__(self, tee: AsyncBlobTee, stream: httpx.AsyncByteStream) -> None:
+        self.tee = tee
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self.tee:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.tee.drain()
+        finally:
+            await self.stream.aclose()
 
 
 class HTTPXRequestResponseHandling(ObjectStorage):
@@ -19,6 +139,7 @@ class HTTPXRequestResponseHandling(ObjectStorage):
     __ignored = ["cookies"]
     __response_keys_special = ["next_request", "headers", "_elapsed", "_content"]
     __store_indicator = "__store_indicator"
+    __stream = "__stream"
     __implicit_encoding = "utf-8"
 
     def __init__(
@@ -26,6 +147,8 @@ class HTTPXRequestResponseHandling(ObjectStorage):
         store_keys: list,
         cassette: Optional[Cassette] = None,
         response_headers_to_drop=None,
+        store_blobs: bool = False,
+        opaque_json: bool = False,
     ) -> None:
         # replace request if given as key and use prettier url
         for index, key in enumerate(store_keys):
@@ -34,6 +157,22 @@ class HTTPXRequestResponseHandling(ObjectStorage):
                 store_keys.insert(index, key.method)
         super().__init__(store_keys, cassette=cassette)
         self.response_headers_to_drop = response_headers_to_drop or []
+        # store bodies to content-addressed blob store shared by storage files
+        self.store_blobs = store_blobs
+        # store JSON bodies verbatim as text, not as parsed object tree
+        self.opaque_json = opaque_json
+        # response was streamed, but it is already read (see write_async)
+        self._streamed = False
+        # response is replayed inside coroutine (see read_async)
+        self._async_read = False
+        # response is recorded inside coroutine (see write_async)
+        self._async_write = False
+        # replayed response has to be read from blob file via its stream
+        self._read_body = False
+
+    @property
+    def blob_store(self) -> BlobStore:
+        return BlobStore.for_storage_file(self.get_cassette().storage_file)
 
     def write(
         self, response: httpx.Response, metadata: Optional[Dict] = None
@@ -44,6 +183,31 @@ class HTTPXRequestResponseHandling(ObjectStorage):
         #    self.write(getattr(response, "next"))
         return response
 
+    async def write_async(
+        self, response: httpx.Response, metadata: Optional[Dict] = None
+    ) -> httpx.Response:
+        self._async_write = True
+        try:
+            if not hasattr(response, "_content") and not self._can_tee(response):
+                # streamed response of AsyncClient, body is read when recorded
+                # and response is replayed as (async) stream
+                await response.aread()
+                self._streamed = True
+            return self.write(response, metadata)
+        finally:
+            self._async_write = False
+
+    async def read_async(self):
+        self._async_read = True
+        try:
+            response = await super().read_async()
+        finally:
+            self._async_read = False
+        if self._read_body:
+            # read body stored in blob file without blocking event loop
+            await response.aread()
+        return response
+
     def read(self):
         data = super().read()
         # TODO: disabled for now, improve next handling if we find it makes sense
@@ -51,8 +215,68 @@ class HTTPXRequestResponseHandling(ObjectStorage):
         #    data._next = self.read()
         return data
 
+    def _can_tee(self, response: httpx.Response) -> bool:
+        if not self.store_blobs:
+            return False
+        if self._async_write:
+            # body of async stream can't be stored when cassette is dumped
+            # after every store, before client reads it (see AsyncBlobTee)
+            if not isinstance(response.stream, httpx.AsyncByteStream):
+                return False
+            if self.get_cassette().dump_after_store:
+                return False
+        elif not isinstance(response.stream, httpx.SyncByteStream):
+            return False
+        try:
+            get_content_decompressor(response.headers.get("Content-Encoding"))
+        except ValueError:
+            return False
+        return True
+
+    def _tee_stream(self, response: httpx.Response) -> Optional[Dict[str, Any]]:
+        """
+        Store body of streamed response to blob store while client reads it,
+        instead of reading it whole when recording.
+
+        :return: blob reference, filled when body is read
+        """
+        stream = response.stream
+        if not self._can_tee(response):
+            return None
+        decompressor = get_content_decompressor(
+            response.headers.get("Content-Encoding")
+        )
+        reference: Dict[str, Any] = {BLOB_REFERENCE_KEY: None}
+        tee: Union[BlobTee, AsyncBlobTee]
+        if self._async_write and isinstance(stream, httpx.AsyncByteStream):
+            tee = AsyncBlobTee(
+                self.blob_store,
+                stream.__aiter__(),
+                reference,
+                decompressor=decompressor,
+            )
+            response.stream = AsyncTeeByteStream(tee, stream)
+        elif isinstance(stream, httpx.SyncByteStream):
+            tee = BlobTee(
+                self.blob_store, iter(stream), reference, decompressor=decompressor
+            )
+            response.stream = TeeByteStream(tee, stream)
+        else:
+            return None
+        self.get_cassette().add_dump_hook(tee.finish)
+        return reference
+
     def to_serializable(self, response: httpx.Response) -> Any:
-        output = dict()
+        output: Dict[str, Any] = dict()
+        tee_reference = None
+        if self._streamed:
+            output[self.__stream] = True
+        elif not hasattr(response, "_content"):
+            # streamed response (Client.send(stream=True)), replay it as stream
+            output[self.__stream] = True
+            tee_reference = self._tee_stream(response)
+            if tee_reference is None:
+                response.read()
         for key in self.__response_keys:
             output[key] = getattr(response, key)
         for key in self.__response_keys_special:
@@ -63,19 +287,36 @@ class HTTPXRequestResponseHandling(ObjectStorage):
                         headers_dict[header] = None
                 output[key] = headers_dict
             if key == "_elapsed":
-                output[key] = response.elapsed.total_seconds()
-            if key == "_content":
+                # elapsed is known after the response is closed (not for streams)
+                elapsed = getattr(response, key, None)
+                output[key] = elapsed.total_seconds() if elapsed else 0
+            if key == "_content" and tee_reference is not None:
+                # body is written to blob store while client reads it
+                output[key] = tee_reference
+                output[self.__store_indicator] = 3
+            elif key == "_content":
                 what_store = response._content  # type: ignore
                 encoding = response.encoding or self.__implicit_encoding
-                try:
-                    what_store = what_store.decode(encoding)  # type: ignore
+                if self.store_blobs and isinstance(what_store, bytes):
+                    # body is stored as is, referenced via its digest
+                    what_store = self.blob_store.reference(what_store)
+                    indicator = 3
+                else:
                     try:
-                        what_store = json.loads(what_store)
-                        indicator = 2
-                    except json.decoder.JSONDecodeError:
-                        indicator = 1
-                except (ValueError, AttributeError):
-                    indicator = 0
+                        what_store = what_store.decode(encoding)  # type: ignore
+                        if self.opaque_json and is_json_content_type(
+                            response.headers.get("Content-Type")
+                        ):
+                            # JSON document kept as text, replayed without parsing
+                            indicator = 4
+                        else:
+                            try:
+                                what_store = json.loads(what_store)
+                                indicator = 2
+                            except json.decoder.JSONDecodeError:
+                                indicator = 1
+                    except (ValueError, AttributeError):
+                        indicator = 0
                 output[key] = what_store
                 output[self.__store_indicator] = indicator
             if key == "next_request":
@@ -84,33 +325,79 @@ class HTTPXRequestResponseHandling(ObjectStorage):
                     output[key] = self.store_keys
         return output
 
+    def _stream_from_data(
+        self, data: Any, encoding: str, headers: httpx.Headers
+    ) -> ReplayByteStream:
+        content_encoding = headers.get("Content-Encoding")
+        try:
+            get_content_compressor(content_encoding)
+        except ValueError:
+            # body can't be encoded again, replay it as decoded
+            logger.debug(f"Replaying stream without {content_encoding} encoding.")
+            del headers["Content-Encoding"]
+            content_encoding = None
+        indicator = data[self.__store_indicator]
+        opener: Callable[[], IO[bytes]]
+        if indicator == 3:
+            opener = partial(self.blob_store.open, data["_content"][BLOB_REFERENCE_KEY])
+        else:
+            if indicator == 0:
+                content = data["_content"]
+            elif indicator in (1, 4):
+                content = data["_content"].encode(encoding)
+            elif indicator == 2:
+                content = json.dumps(data["_content"]).encode(encoding)
+            else:
+                raise TypeError("Invalid type of encoded content.")
+            opener = partial(BytesIO, content)
+        return ReplayByteStream(opener, content_encoding=content_encoding)
+
     def from_serializable(self, data: Any) -> httpx.Response:
         # Process the content
         encoding = data["encoding"] or self.__implicit_encoding
 
+        streamed = data.get(self.__stream)
+        self._read_body = (
+            self._async_read and not streamed and data[self.__store_indicator] == 3
+        )
+        if streamed or self._read_body:
+            # body is read in chunks when the response is read or iterated
+            headers = httpx.Headers(data["headers"])
+            stream = self._stream_from_data(data, encoding, headers)
+            response = httpx.Response(
+                status_code=data["status_code"], headers=headers, stream=stream
+            )
+        else:
+            response = self._response_with_content(data, encoding)
+        response.encoding = encoding
+        response.elapsed = datetime.timedelta(seconds=data.get("elapsed", 0))
+        response.next_request = data.get("next_request")
+
+        return response
+
+    def _response_with_content(self, data: Any, encoding: str) -> httpx.Response:
         indicator = data[self.__store_indicator]
         content, text, deserialized_json = None, None, None
         if indicator == 0:
             content = data["_content"]  # raw data
         elif indicator == 1:
             text = data["_content"]  # encoded text
+        elif indicator == 4:
+            content = data["_content"].encode(encoding)  # JSON as text
         elif indicator == 2:
             deserialized_json = data["_content"]  # JSON
+        elif indicator == 3:
+            content = self.blob_store.resolve(data["_content"])  # blob reference
         else:
             raise TypeError("Invalid type of encoded content.")
 
-        response = httpx.Response(
+        return httpx.Response(
             status_code=data["status_code"],
             headers=data["headers"],
             content=content,
             text=text,
             json=deserialized_json,
         )
-        response.encoding = encoding
-        response.elapsed = datetime.timedelta(seconds=data.get("elapsed", 0))
-        response.next_request = data.get("next_request")
-
-        return response
 
     @classmethod
     def decorator_all_keys(
@@ -198,15 +485,125 @@ class HTTPXRequestResponseHandling(ObjectStorage):
         )
 
 
+class _CassetteTransportBase:
+    """
+    Common part of httpx transports what store responses to cassette
+    """
+
+    def __init__(
+        self,
+        transport: Any = None,
+        cassette: Optional[Cassette] = None,
+        response_headers_to_drop: Optional[List[str]] = None,
+        store_blobs: bool = False,
+        opaque_json: bool = False,
+    ) -> None:
+        self._transport = transport
+        self._cassette = cassette
+        self.storage_object_kwargs: Dict[str, Any] = {
+            "response_headers_to_drop": response_headers_to_drop,
+            "store_blobs": store_blobs,
+            "opaque_json": opaque_json,
+        }
+
+    @property
+    def cassette(self) -> Cassette:
+        return self._cassette or HTTPXRequestResponseHandling.get_cassette()
+
+    def _storage(self, request: httpx.Request) -> HTTPXRequestResponseHandling:
+        return HTTPXRequestResponseHandling(
+            store_keys=[request], cassette=None, **self.storage_object_kwargs
+        )
+
+    def _metadata(self, cassette: Cassette, time_before: float) -> Dict:
+        return {cassette.data_miner.LATENCY_KEY: original_time() - time_before}
+
+
+class CassetteTransport(_CassetteTransportBase, httpx.BaseTransport):
+    """
+    httpx transport, what replays responses from cassette and records them
+    via wrapped (real) transport. It is passed to the client directly,
+    no modules are patched:
+
+        client = httpx.Client(transport=CassetteTransport(cassette=cassette))
+
+    Responses are stored under request method and url (without keys of the call
+    stack), so storage files are not compatible with record_httpx ones.
+    Cassette is dumped when the transport (client) is closed.
+
+    :param transport: transport used for recording, httpx.HTTPTransport by default
+    :param cassette: Cassette instance, cassette of ObjectStorage by default
+    :param response_headers_to_drop: names of headers not stored with responses
+    :param store_blobs: store response bodies to test_data/.blobs
+    :param opaque_json: store JSON bodies as text
+    """
+
+    @property
+    def transport(self) -> httpx.BaseTransport:
+        # created when recording only
+        if self._transport is None:
+            self._transport = httpx.HTTPTransport()
+        return self._transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = self.cassette
+        with activate_cassette(cassette):
+            storage = self._storage(request)
+            if not cassette.do_store(storage.store_keys):
+                return storage.read()
+            time_before = original_time()
+            response = self.transport.handle_request(request)
+            return storage.write(response, self._metadata(cassette, time_before))
+
+    def close(self) -> None:
+        self.cassette.dump()
+        if self._transport is not None:
+            self._transport.close()
+
+
+class AsyncCassetteTransport(_CassetteTransportBase, httpx.AsyncBaseTransport):
+    """
+    Same as CassetteTransport, for httpx.AsyncClient. Recording uses
+    httpx.AsyncHTTPTransport by default.
+    """
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport()
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        cassette = self.cassette
+        with activate_cassette(cassette):
+            storage = self._storage(request)
+            if not cassette.do_store(storage.store_keys):
+                return await storage.read_async()
+            time_before = original_time()
+            response = await self.transport.handle_async_request(request)
+            return await storage.write_async(
+                response, self._metadata(cassette, time_before)
+            )
+
+    async def aclose(self) -> None:
+        self.cassette.dump()
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
 @make_generic
 def record_httpx(
     _func=None,
     response_headers_to_drop: Optional[List[str]] = None,
     cassette: Optional[Cassette] = None,
+    session: bool = False,
+    store_blobs: bool = False,
+    opaque_json: bool = False,
 ):
     """
     Decorator which can be used to store all httpx requests to a file
-    and replay responses on the next run.
+    and replay responses on the next run. Requests of both Client and AsyncClient
+    are stored, decorated function could be coroutine function as well.
 
     - The matching is based on `url`.
     - Removes tokens from the url when saving if needed.
@@ -219,17 +616,30 @@ def record_httpx(
     :param storage_file: str - storage file to be passed to cassette instance if given,
                                else it creates new instance
     :param cassette: Cassette instance to pass inside object to work with
+    :param session: install the replacement once per session
+                    and route calls to the cassette of the decorated function
+    :param store_blobs: store response bodies once to test_data/.blobs/<sha256>
+                        and keep just references to them inside storage file
+    :param opaque_json: store JSON bodies as text, without parsing them when recording
+                        and serializing them again when replaying
     """
 
     response_headers_to_drop = response_headers_to_drop or []
-    replace_decorator = replace(
-        what="httpx._client.Client.send",
+    decorate = HTTPXRequestResponseHandling.decorator(
+        item_list=[1],
+        response_headers_to_drop=response_headers_to_drop,
+        storage_object_kwargs={
+            "store_blobs": store_blobs,
+            "opaque_json": opaque_json,
+        },
         cassette=cassette,
-        decorate=HTTPXRequestResponseHandling.decorator(
-            item_list=[1],
-            response_headers_to_drop=response_headers_to_drop,
-            cassette=cassette,
-        ),
+    )
+    # sync and async clients share the cassette of the decorated function
+    replace_decorator = replace_module_match_with_multiple_decorators(
+        ("httpx._client.Client.send", decorate),
+        ("httpx._client.AsyncClient.send", decorate),
+        cassette=cassette,
+        session=session,
     )
 
     if _func is not None:
@@ -243,8 +653,8 @@ def recording_httpx(
     response_headers_to_drop: Optional[List[str]] = None, storage_file=None
 ):
     """
-    Context manager which can be used to store all httpx requests to a file
-    and replay responses on the next run.
+    Context manager which can be used to store all httpx requests
+    (of Client and AsyncClient) to a file and replay responses on the next run.
 
     - The matching is based on `url`.
     - Removes tokens from the url when saving if needed.
@@ -254,12 +664,15 @@ def recording_httpx(
                                         (Will be replaced to `None`.)
     :param storage_file: file for reading and writing data in storage_object
     """
-    with recording(
-        what="httpx._client.Client.send",
-        decorate=HTTPXRequestResponseHandling.decorator(
-            item_list=[1],
-            response_headers_to_drop=response_headers_to_drop,
-        ),
+    decorate = HTTPXRequestResponseHandling.decorator(
+        item_list=[1],
+        response_headers_to_drop=response_headers_to_drop,
+    )
+    with _recording_targets(
+        targets=[
+            ReplacementTarget(what="httpx._client.Client.send", decorate=decorate),
+            ReplacementTarget(what="httpx._client.AsyncClient.send", decorate=decorate),
+        ],
         storage_file=storage_file,
     ) as cassette:
         yield cassette
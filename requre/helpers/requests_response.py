@@ -4,17 +4,30 @@
 
 import datetime
 import json
+import logging
+import threading
 from contextlib import contextmanager
+from functools import partial
 from io import BytesIO, IOBase
-from typing import Any, Dict, Generator, List, Optional
+from typing import IO, Any, Callable, Dict, Generator, List, Optional, Union
 from urllib.parse import urlparse
 
+from requests.adapters import BaseAdapter, HTTPAdapter
 from requests.models import PreparedRequest, Request, Response
 from requests.structures import CaseInsensitiveDict
 
-from requre.cassette import Cassette
+from requre.blobs import BlobStore, BlobTee
+from requre.cassette import Cassette, activate_cassette, original_time
+from requre.constants import BLOB_REFERENCE_KEY
 from requre.objects import ObjectStorage
 from requre.record_and_replace import make_generic, recording, replace
+from requre.utils import (
+    encode_content,
+    get_content_decompressor,
+    is_json_content_type,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def remove_password_from_url(url):
@@ -28,9 +41,74 @@ def remove_password_from_url(url):
 
 
 class FakeBaseHTTPResponse(IOBase):
-    def __init__(self, raw_data: bytes, decoded_data: bytes) -> None:
-        self.raw_stream = BytesIO(raw_data)
-        self.decoded_stream = BytesIO(decoded_data)
+    """
+    Replacement of urllib3 response replaying stored raw (compressed) and decoded data.
+
+    When just decoded data are stored, they may be given as callable (to be
+    created on first access) and raw data are created via compression
+    by content_encoding only when read without decode_content.
+
+    Data may be given via openers as well, callables returning binary file objects
+    (e.g. blob files), what are read lazily in chunks when streamed.
+    """
+
+    def __init__(
+        self,
+        raw_data: Optional[bytes] = None,
+        decoded_data: Union[bytes, Callable[[], bytes], None] = None,
+        content_encoding: Optional[str] = None,
+        raw_opener: Optional[Callable[[], IO[bytes]]] = None,
+        decoded_opener: Optional[Callable[[], IO[bytes]]] = None,
+    ) -> None:
+        self._raw_data = raw_data
+        self._decoded_data = decoded_data
+        self.content_encoding = content_encoding
+        self._raw_opener = raw_opener
+        self._decoded_opener = decoded_opener
+        self._raw_stream: Optional[IO[bytes]] = None
+        self._decoded_stream: Optional[IO[bytes]] = None
+
+    @staticmethod
+    def _read_all(opener: Callable[[], IO[bytes]]) -> bytes:
+        with opener() as stream:
+            return stream.read()
+
+    @property
+    def decoded_data(self) -> bytes:
+        if self._decoded_data is None and self._decoded_opener is not None:
+            self._decoded_data = self._read_all(self._decoded_opener)
+        if callable(self._decoded_data):
+            self._decoded_data = self._decoded_data()
+        return self._decoded_data or b""
+
+    @property
+    def raw_data(self) -> bytes:
+        if self._raw_data is None:
+            if self._raw_opener is not None:
+                self._raw_data = self._read_all(self._raw_opener)
+            else:
+                self._raw_data = encode_content(
+                    self.decoded_data, self.content_encoding
+                )
+        return self._raw_data
+
+    @property
+    def raw_stream(self) -> IO[bytes]:
+        if self._raw_stream is None:
+            if self._raw_data is None and self._raw_opener is not None:
+                self._raw_stream = self._raw_opener()
+            else:
+                self._raw_stream = BytesIO(self.raw_data)
+        return self._raw_stream
+
+    @property
+    def decoded_stream(self) -> IO[bytes]:
+        if self._decoded_stream is None:
+            if self._decoded_data is None and self._decoded_opener is not None:
+                self._decoded_stream = self._decoded_opener()
+            else:
+                self._decoded_stream = BytesIO(self.decoded_data)
+        return self._decoded_stream
 
     def readable(self) -> bool:
         return True
@@ -42,13 +120,13 @@ class FakeBaseHTTPResponse(IOBase):
         cache_content: bool = False,
     ) -> bytes:
         stream = self.decoded_stream if decode_content else self.raw_stream
-        return stream.read(amt)
+        return stream.read(-1 if amt is None else amt)
 
     def read1(
         self, amt: Optional[int] = None, decode_content: Optional[bool] = None
     ) -> bytes:
-        stream = self.decoded_stream if decode_content else self.raw_stream
-        return stream.read1(amt)
+        stream: Any = self.decoded_stream if decode_content else self.raw_stream
+        return stream.read1(-1 if amt is None else amt)
 
     def stream(
         self, amt: Optional[int] = 2**16, decode_content: Optional[bool] = None
@@ -57,7 +135,7 @@ class FakeBaseHTTPResponse(IOBase):
 
         def generate():
             while True:
-                chunk = stream.read(amt)
+                chunk = stream.read(-1 if amt is None else amt)
                 if not chunk:
                     break
                 yield chunk
@@ -69,12 +147,97 @@ class FakeBaseHTTPResponse(IOBase):
             return data
         return self.decoded_stream.read()
 
+    def close(self) -> None:
+        for stream in (self._raw_stream, self._decoded_stream):
+            if stream is not None:
+                stream.close()
+        super().close()
+
+
+class TeeHTTPResponse(IOBase):
+    """
+    Proxy of not yet read urllib3 response (requests with stream=True), what writes
+    body to blob store while client reads it, so it is never whole in memory.
+    Decoded body is stored, also when client reads raw (compressed) data.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self, response: Any, blob_store: BlobStore, reference: Dict[str, Any]
+    ) -> None:
+        self._response = response
+        self._blob_store = blob_store
+        self._reference = reference
+        self._tee: Optional[BlobTee] = None
+        self._buffer = b""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._response, name)
+
+    def _get_tee(self, decode_content: Optional[bool]) -> BlobTee:
+        if self._tee is None:
+            # data are passed in the form of the first read
+            decompressor = None
+            if not decode_content:
+                decompressor = get_content_decompressor(
+                    self._response.headers.get("Content-Encoding")
+                )
+            self._tee = BlobTee(
+                self._blob_store,
+                self._response.stream(self.chunk_size, decode_content=decode_content),
+                self._reference,
+                decompressor=decompressor,
+            )
+        return self._tee
+
+    def readable(self) -> bool:
+        return True
+
+    def read(
+        self,
+        amt: Optional[int] = None,
+        decode_content: Optional[bool] = None,
+        cache_content: bool = False,
+    ) -> bytes:
+        tee = self._get_tee(decode_content)
+        if amt is None:
+            data, self._buffer = self._buffer + b"".join(tee), b""
+            return data
+        while len(self._buffer) < amt:
+            chunk = next(tee, b"")
+            if not chunk:
+                break
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def stream(
+        self, amt: Optional[int] = 2**16, decode_content: Optional[bool] = None
+    ) -> Generator[bytes, None, None]:
+        while True:
+            chunk = self.read(amt, decode_content=decode_content)
+            if not chunk:
+                break
+            yield chunk
+
+    def finish(self) -> None:
+        """
+        Store rest of the body, what was not read by client yet
+        """
+        self._get_tee(decode_content=True).finish()
+
+    def close(self) -> None:
+        self._response.close()
+        super().close()
+
 
 class RequestResponseHandling(ObjectStorage):
     __response_keys = ["status_code", "encoding", "reason"]
     __ignored = ["cookies"]
     __response_keys_special = ["raw", "_next", "headers", "elapsed", "_content"]
     __store_indicator = "__store_indicator"
+    __single_body = "__single_body"
     __implicit_encoding = "UTF-8"
 
     def __init__(
@@ -82,6 +245,9 @@ class RequestResponseHandling(ObjectStorage):
         store_keys: list,
         cassette: Optional[Cassette] = None,
         response_headers_to_drop=None,
+        store_blobs: bool = False,
+        single_body: bool = False,
+        opaque_json: bool = False,
     ) -> None:
         # replace request if given as key and use prettier url
         for index, key in enumerate(store_keys):
@@ -90,6 +256,16 @@ class RequestResponseHandling(ObjectStorage):
                 store_keys.insert(index, key.method)
         super().__init__(store_keys, cassette=cassette)
         self.response_headers_to_drop = response_headers_to_drop or []
+        # store bodies to content-addressed blob store shared by storage files
+        self.store_blobs = store_blobs
+        # store just decoded body, raw data are created from it when replaying
+        self.single_body = single_body
+        # store JSON bodies verbatim as text, not as parsed object tree
+        self.opaque_json = opaque_json
+
+    @property
+    def blob_store(self) -> BlobStore:
+        return BlobStore.for_storage_file(self.get_cassette().storage_file)
 
     def write(self, response: Response, metadata: Optional[Dict] = None) -> Response:
         super().write(response, metadata)
@@ -105,25 +281,68 @@ class RequestResponseHandling(ObjectStorage):
         #    data._next = self.read()
         return data
 
+    def _tee_stream(self, response: Response) -> Optional[Dict[str, Any]]:
+        """
+        Store body of not read response (stream=True) to blob store
+        while client reads it, instead of reading it whole when recording.
+
+        :return: blob reference, filled when body is read
+        """
+        if not (
+            self.store_blobs
+            and response._content is False  # type: ignore
+            and hasattr(response.raw, "stream")
+            and hasattr(response.raw, "_decode")
+        ):
+            return None
+        try:
+            get_content_decompressor(response.headers.get("Content-Encoding"))
+        except ValueError:
+            return None
+        reference: Dict[str, Any] = {BLOB_REFERENCE_KEY: None}
+        response.raw = TeeHTTPResponse(response.raw, self.blob_store, reference)
+        self.get_cassette().add_dump_hook(response.raw.finish)
+        return reference
+
     def to_serializable(self, response: Response) -> Any:
-        output = dict()
+        output: Dict[str, Any] = dict()
+        body = None
+        tee_reference = self._tee_stream(response)
         for key in self.__response_keys:
             output[key] = getattr(response, key)
         for key in self.__response_keys_special:
-            if key == "raw":
+            if key == "raw" and tee_reference is not None:
+                # raw data are created from decoded body when replaying
+                output[key] = None
+            elif key == "raw":
                 if hasattr(response.raw, "_decode"):
                     # urllib3.response.BaseHTTPResponse
                     raw_data = response.raw.read(decode_content=False)
                     decoded_data = response.raw._decode(
                         raw_data, decode_content=True, flush_decoder=True
                     )
-                    output[key] = raw_data
-                    output[f"{key}_decoded"] = decoded_data
+                    if self.single_body:
+                        body = decoded_data
+                    elif self.store_blobs:
+                        output[key] = self.blob_store.reference(raw_data)
+                        output[f"{key}_decoded"] = self.blob_store.reference(
+                            decoded_data
+                        )
+                    else:
+                        output[key] = raw_data
+                        output[f"{key}_decoded"] = decoded_data
                     # replay it back to raw
                     response.raw = FakeBaseHTTPResponse(raw_data, decoded_data)
                 else:
                     raw_data = response.raw.read()
-                    output[key] = raw_data
+                    if self.single_body:
+                        body = raw_data
+                    else:
+                        output[key] = (
+                            self.blob_store.reference(raw_data)
+                            if self.store_blobs
+                            else raw_data
+                        )
                     # replay it back to raw
                     response.raw = BytesIO(raw_data)
             if key == "headers":
@@ -135,17 +354,37 @@ class RequestResponseHandling(ObjectStorage):
             if key == "elapsed":
                 output[key] = response.elapsed.total_seconds()
             if key == "_content":
-                what_store = response._content  # type: ignore
+                what_store: Any = response._content  # type: ignore
                 encoding = response.encoding or self.__implicit_encoding
-                try:
-                    what_store = what_store.decode(encoding)  # type: ignore
+                if self.single_body:
+                    output[self.__single_body] = True
+                    if not isinstance(what_store, bytes):
+                        # content was not read yet (stream=True)
+                        what_store = body
+                if tee_reference is not None:
+                    # body is written to blob store while client reads it
+                    what_store = tee_reference
+                    indicator = 3
+                elif self.store_blobs and isinstance(what_store, bytes):
+                    # body is stored as is, referenced via its digest
+                    what_store = self.blob_store.reference(what_store)
+                    indicator = 3
+                else:
                     try:
-                        what_store = json.loads(what_store)
-                        indicator = 2
-                    except json.decoder.JSONDecodeError:
-                        indicator = 1
-                except (ValueError, AttributeError):
-                    indicator = 0
+                        what_store = what_store.decode(encoding)  # type: ignore
+                        if self.opaque_json and is_json_content_type(
+                            response.headers.get("Content-Type")
+                        ):
+                            # JSON document kept as text, replayed without parsing
+                            indicator = 4
+                        else:
+                            try:
+                                what_store = json.loads(what_store)
+                                indicator = 2
+                            except json.decoder.JSONDecodeError:
+                                indicator = 1
+                    except (ValueError, AttributeError):
+                        indicator = 0
                 output[key] = what_store
                 output[self.__store_indicator] = indicator
             if key == "_next":
@@ -154,33 +393,80 @@ class RequestResponseHandling(ObjectStorage):
                     output[key] = self.store_keys
         return output
 
+    def resolve_blob(self, value: Any) -> Any:
+        if BlobStore.is_reference(value):
+            return self.blob_store.resolve(value)
+        return value
+
+    def _content_from_data(self, data: Any, encoding: str) -> Any:
+        key = "_content"
+        indicator = data[self.__store_indicator]
+        if indicator == 0:
+            what_store = data[key]
+        elif indicator in (1, 4):
+            what_store = data[key].encode(encoding)
+        elif indicator == 2:
+            what_store = json.dumps(data[key])
+            what_store = what_store.encode(encoding)
+        elif indicator == 3:
+            what_store = self.resolve_blob(data[key])
+        return what_store
+
+    def _body_arguments(self, name: str, value: Any) -> Dict[str, Any]:
+        """
+        Arguments for FakeBaseHTTPResponse, blobs are opened lazily and read in chunks
+        """
+        if BlobStore.is_reference(value):
+            return {
+                f"{name}_opener": partial(
+                    self.blob_store.open, value[BLOB_REFERENCE_KEY]
+                )
+            }
+        return {f"{name}_data": value}
+
     def from_serializable(self, data: Any) -> Response:
         response = Response()
         for key in self.__response_keys:
             setattr(response, key, data[key])
+        encoding = response.encoding or self.__implicit_encoding
+        single_body = data.get(self.__single_body, False)
+        # content stored as blob is streamed from blob file when accessed
+        lazy_content = not single_body and data[self.__store_indicator] == 3
         for key in self.__response_keys_special:
             if key == "raw":
-                if f"{key}_decoded" in data:
+                if single_body:
+                    # content and raw data are created on the first access
                     response.raw = FakeBaseHTTPResponse(
-                        data[key], data[f"{key}_decoded"]
+                        decoded_data=lambda: self._content_from_data(data, encoding),
+                        content_encoding=CaseInsensitiveDict(data["headers"]).get(
+                            "Content-Encoding"
+                        ),
+                    )
+                elif lazy_content or f"{key}_decoded" in data:
+                    decoded = (
+                        data["_content"] if lazy_content else data[f"{key}_decoded"]
+                    )
+                    response.raw = FakeBaseHTTPResponse(
+                        **self._body_arguments("raw", data[key]),
+                        **self._body_arguments("decoded", decoded),
+                        content_encoding=CaseInsensitiveDict(data["headers"]).get(
+                            "Content-Encoding"
+                        ),
                     )
                 else:
-                    response.raw = BytesIO(data[key])
+                    response.raw = BytesIO(self.resolve_blob(data[key]))
             if key == "headers":
                 response.headers = CaseInsensitiveDict(data[key])
             if key == "elapsed":
                 response.elapsed = datetime.timedelta(seconds=data[key])
             if key == "_content":
-                encoding = response.encoding or self.__implicit_encoding
-                indicator = data[self.__store_indicator]
-                if indicator == 0:
-                    what_store = data[key]
-                elif indicator == 1:
-                    what_store = data[key].encode(encoding)
-                elif indicator == 2:
-                    what_store = json.dumps(data[key])
-                    what_store = what_store.encode(encoding)
-                response._content = what_store  # type: ignore
+                if single_body or lazy_content:
+                    # Response.content reads decoded data from raw when accessed
+                    response._content = False  # type: ignore
+                else:
+                    response._content = self._content_from_data(  # type: ignore
+                        data, encoding
+                    )
             if key == "_next":
                 setattr(response, "_next", data[key])
         return response
@@ -271,11 +557,115 @@ class RequestResponseHandling(ObjectStorage):
         )
 
 
+class CassetteAdapter(BaseAdapter):
+    """
+    requests transport adapter, what replays responses from cassette
+    and records them via wrapped (real) adapter. It is mounted just to chosen
+    sessions (or url prefixes), Session.send is not patched:
+
+        session.mount("https://api.example.com/", CassetteAdapter(cassette=cassette))
+
+    Responses are stored under request method and url (without keys of the call
+    stack), so storage files are not compatible with record_requests ones.
+    Cassette is dumped when the adapter (session) is closed.
+
+    :param adapter: adapter used for recording, requests.adapters.HTTPAdapter by default
+    :param cassette: Cassette instance, cassette of ObjectStorage by default
+    :param response_headers_to_drop: names of headers not stored with responses
+    :param store_blobs: store response bodies to test_data/.blobs
+    :param single_body: store just decoded body
+    :param opaque_json: store JSON bodies as text
+    """
+
+    def __init__(
+        self,
+        adapter: Optional[BaseAdapter] = None,
+        cassette: Optional[Cassette] = None,
+        response_headers_to_drop: Optional[List[str]] = None,
+        store_blobs: bool = False,
+        single_body: bool = False,
+        opaque_json: bool = False,
+    ) -> None:
+        super().__init__()
+        self._adapter = adapter
+        self._cassette = cassette
+        # adapter could be used by more threads, cassette is accessed one by one,
+        # requests to the server are sent in parallel
+        self._lock = threading.Lock()
+        self.storage_object_kwargs: Dict[str, Any] = {
+            "response_headers_to_drop": response_headers_to_drop,
+            "store_blobs": store_blobs,
+            "single_body": single_body,
+            "opaque_json": opaque_json,
+        }
+
+    @property
+    def adapter(self) -> BaseAdapter:
+        # created when recording only
+        if self._adapter is None:
+            self._adapter = HTTPAdapter()
+        return self._adapter
+
+    @property
+    def cassette(self) -> Cassette:
+        return self._cassette or RequestResponseHandling.get_cassette()
+
+    def send(
+        self,
+        request: PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        verify: Any = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> Response:
+        cassette = self.cassette
+        with activate_cassette(cassette):
+            storage = RequestResponseHandling(
+                store_keys=[request], cassette=None, **self.storage_object_kwargs
+            )
+            if not cassette.do_store(storage.store_keys):
+                with self._lock:
+                    response = storage.read()
+                # same as HTTPAdapter.build_response
+                response.url = request.url
+                response.request = request
+                response.connection = self
+                return response
+            time_before = original_time()
+            response = self.adapter.send(
+                request,
+                stream=stream,
+                timeout=timeout,
+                verify=verify,
+                cert=cert,
+                proxies=proxies,
+            )
+            if not stream:
+                # read body before storing it, as Session.send does after this call,
+                # not read (streamed) body would be stored as raw binary data
+                response.content
+            latency = original_time() - time_before
+            with self._lock:
+                return storage.write(
+                    response, {cassette.data_miner.LATENCY_KEY: latency}
+                )
+
+    def close(self) -> None:
+        self.cassette.dump()
+        if self._adapter is not None:
+            self._adapter.close()
+
+
 @make_generic
 def record_requests(
     _func=None,
     response_headers_to_drop: Optional[List[str]] = None,
     cassette: Optional[Cassette] = None,
+    session: bool = False,
+    store_blobs: bool = False,
+    single_body: bool = False,
+    opaque_json: bool = False,
 ):
     """
     Decorator which can be used to store all requests to a file
@@ -292,6 +682,14 @@ def record_requests(
     :param storage_file: str - storage file to be passed to cassette instance if given,
                                else it creates new instance
     :param cassette: Cassette instance to pass inside object to work with
+    :param session: install the replacement once per session
+                    and route calls to the cassette of the decorated function
+    :param store_blobs: store response bodies once to test_data/.blobs/<sha256>
+                        and keep just references to them inside storage file
+    :param single_body: store just decoded body, instead of raw, decoded and content
+                        representation, other ones are created when accessed
+    :param opaque_json: store JSON bodies as text, without parsing them when recording
+                        and serializing them again when replaying
     """
 
     response_headers_to_drop = response_headers_to_drop or []
@@ -301,8 +699,14 @@ def record_requests(
         decorate=RequestResponseHandling.decorator(
             item_list=[1],
             response_headers_to_drop=response_headers_to_drop,
+            storage_object_kwargs={
+                "store_blobs": store_blobs,
+                "single_body": single_body,
+                "opaque_json": opaque_json,
+            },
             cassette=cassette,
         ),
+        session=session,
     )
 
     if _func is not None:
@@ -90,7 +90,8 @@ class TempFile(ObjectStorage):
         """
         warn("Please replace it by MkTemp.decorator_plain()")
         casex = CassetteExecution()
-        casex.cassette = cassette or cls.get_cassette()
+        casex.cassette = cassette
+        casex.default_cassette = cls.get_cassette()
         casex.obj_cls = cls
 
         def internal(func):
@@ -115,7 +116,8 @@ class TempFile(ObjectStorage):
         """
         warn("Please replace it by class mkdtemp MkDTemp.decorator_plain()")
         casex = CassetteExecution()
-        casex.cassette = cassette or cls.get_cassette()
+        casex.cassette = cassette
+        casex.default_cassette = cls.get_cassette()
         casex.obj_cls = cls
 
         def internal(func):
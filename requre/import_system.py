@@ -1,20 +1,24 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
-import builtins
-import functools
+import importlib.abc
+import logging
+import sys
+import types
 from enum import Enum
 from typing import Any, Callable, List, Optional
 
 from requre.cassette import Cassette
-from requre.constants import DEFAULT_IMPORT_FUNCTION
 from requre.record_and_replace import (
     ModuleRecord,
+    _apply_module_replacement,
     _parse_and_replace_sys_modules,
     _revert_modules,
 )
 from requre.storage import PersistentObjectStorage
 
+logger = logging.getLogger(__name__)
+
 
 class ReplaceType(Enum):
     """
@@ -59,16 +63,115 @@ def replace(
     return upgraded_import_system
 
 
+class PendingUpgrade:
+    """
+    Upgrade of the module what is not imported yet.
+    It is applied by ImportHookFinder once the module is executed.
+    """
+
+    def __init__(self, what, decorate, replace, add_revert_list):
+        self.what = what
+        self.decorate = decorate
+        self.replace = replace
+        self.add_revert_list = add_revert_list
+        # candidates of module names, e.g. for "a.b.c" -> "a.b", "a"
+        parts = what.split(".")
+        self.module_names = {".".join(parts[:i]) for i in range(1, len(parts))}
+
+
+class ImportHookLoader(importlib.abc.Loader):
+    """
+    Wrapper of original loader, what applies pending upgrades after
+    the module is executed.
+    """
+
+    def __init__(self, loader, finder: "ImportHookFinder"):
+        self.loader = loader
+        self.finder = finder
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        # hide the wrapper, module behaves as loaded by the original loader
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.finder.module_executed(module)
+
+    def __getattr__(self, item):
+        return getattr(self.loader, item)
+
+
+class ImportHookFinder(importlib.abc.MetaPathFinder):
+    """
+    sys.meta_path finder what wraps loaders of modules, which are targets of pending
+    upgrades. All other imports are handled by the rest of finders directly.
+    """
+
+    def __init__(self, upgrade_import_system: "UpgradeImportSystem"):
+        self.upgrade_import_system = upgrade_import_system
+        self.pending: List[PendingUpgrade] = []
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+        self.pending.clear()
+
+    def find_spec(self, fullname, path, target=None):
+        if not any(fullname in item.module_names for item in self.pending):
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = ImportHookLoader(spec.loader, self)
+            return spec
+        return None
+
+    def module_executed(self, module: types.ModuleType):
+        """
+        Apply pending upgrades what target the executed module, every upgrade
+        is applied just once.
+        """
+        for item in list(self.pending):
+            if module.__name__ not in item.module_names:
+                continue
+            recorded_items = _apply_module_replacement(
+                what=item.what,
+                module=module,
+                cassette=self.upgrade_import_system.cassette,
+                decorate=item.decorate,
+                replace=item.replace,
+                module_record_list=[],
+                add_revert_list=item.add_revert_list,
+            )
+            if recorded_items:
+                logger.debug(f"Applied {item.what} when importing {module.__name__}")
+                self.upgrade_import_system.module_list += recorded_items
+                self.pending.remove(item)
+        if not self.pending:
+            self.uninstall()
+
+
 class UpgradeImportSystem:
     def __init__(self, cassette: Optional[Cassette] = None) -> None:
         self.cassette = cassette or PersistentObjectStorage().cassette
         self.module_list: List[ModuleRecord] = []
+        self.import_hook = ImportHookFinder(self)
 
     def __enter__(self) -> "UpgradeImportSystem":
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        builtins.__import__ = DEFAULT_IMPORT_FUNCTION
         self.revert()
 
     def revert(self) -> "UpgradeImportSystem":
@@ -77,7 +180,7 @@ class UpgradeImportSystem:
 
         :return: self (chaining is supported)
         """
-        builtins.__import__ = DEFAULT_IMPORT_FUNCTION
+        self.import_hook.uninstall()
         _revert_modules(self.module_list)
         # TODO: fix reverting of 'from' modules
         self.module_list.clear()
@@ -125,7 +228,6 @@ class UpgradeImportSystem:
         replace_type,
         replacement,
         add_revert_list,
-        func=DEFAULT_IMPORT_FUNCTION,
     ):
         replace = None
         decorate = None
@@ -144,21 +246,13 @@ class UpgradeImportSystem:
         if recorded_items:
             self.module_list += recorded_items
             return
-
-        @functools.wraps(func)
-        def new_import(*args, **kwargs):
-            with open("debug.file", "w") as fd:
-                fd.write("eee", what, args, kwargs)
-            out = func(*args, **kwargs)
-            recorded_items = _parse_and_replace_sys_modules(
+        # apply it when the module is imported
+        self.import_hook.pending.append(
+            PendingUpgrade(
                 what=what,
-                cassette=self.cassette,
                 decorate=decorate,
                 replace=replace,
                 add_revert_list=add_revert_list,
             )
-            if recorded_items:
-                self.module_list += recorded_items
-            return out
-
-        func = new_import
+        )
+        self.import_hook.install()
@@ -0,0 +1,189 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Load generator, what sends requests stored in storage files to a target service
+and compares latencies of its responses with the stored ones.
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from requre.cassette import Cassette
+from requre.postprocessing import DictProcessing
+from requre.serve import request_key
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = [50, 90, 99]
+# request bodies are not stored in storage files, requests with these methods
+# would be sent without them, so they are skipped (and counted in report)
+BODY_METHODS = {"POST", "PUT", "PATCH"}
+
+
+class LoadRequest:
+    """
+    Request stored in storage file with latency and status of its response
+    """
+
+    def __init__(
+        self, method: str, path: str, latency: float, status: Optional[int] = None
+    ):
+        self.method = method
+        self.path = path
+        self.latency = latency
+        self.status = status
+
+    @classmethod
+    def from_storage_files(cls, storage_files: List[str]) -> List["LoadRequest"]:
+        """
+        Requests of storage files in stored order
+        """
+        output = []
+        for storage_file in storage_files:
+            cassette = Cassette()
+            cassette.storage_file = storage_file
+            for method, url, metadata, stored in DictProcessing(
+                cassette.storage_object
+            ).responses():
+                output.append(
+                    cls(
+                        *request_key(method, url),
+                        latency=metadata.get(cassette.data_miner.LATENCY_KEY, 0),
+                        status=stored.get("status_code"),
+                    )
+                )
+        return output
+
+
+class LoadResult:
+    def __init__(
+        self, request: LoadRequest, latency: float, status: Optional[int] = None
+    ):
+        self.request = request
+        self.latency = latency
+        # None when request failed
+        self.status = status
+
+    @property
+    def matches(self) -> bool:
+        return self.status is not None and self.status == self.request.status
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of sorted values
+    """
+    if not values:
+        return 0
+    index = max(0, int(len(values) * percent / 100 + 0.5) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    output = {f"p{item}": percentile(values, item) for item in PERCENTILES}
+    output["max"] = values[-1] if values else 0
+    return output
+
+
+async def run_load(
+    target: str,
+    requests: List[LoadRequest],
+    concurrency: int = 10,
+    repeat: int = 1,
+    timeout: float = 30,
+) -> List[LoadResult]:
+    """
+    Send requests (repeat times) to the target by concurrency parallel workers
+
+    :param target: base url of tested service, used instead of stored host
+    :param requests: stored requests
+    :param concurrency: number of requests sent at the same time
+    :param repeat: how many times requests are sent
+    :param timeout: timeout of one request in seconds
+    :return: results in order of finishing
+    """
+    results: List[LoadResult] = []
+    # workers share one iterator, all of them run in one thread
+    pending: Iterator[LoadRequest] = itertools.chain.from_iterable(
+        itertools.repeat(requests, repeat)
+    )
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for request in pending:
+            start = time.perf_counter()
+            status: Optional[int] = None
+            try:
+                response = await client.request(request.method, request.path)
+                status = response.status_code
+            except httpx.HTTPError as ex:
+                logger.debug(f"{request.method} {request.path} failed: {ex!r}")
+            results.append(LoadResult(request, time.perf_counter() - start, status))
+
+    async with httpx.AsyncClient(
+        base_url=target.rstrip("/"),
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=concurrency),
+    ) as client:
+        await asyncio.gather(*[worker(client) for _ in range(concurrency)])
+    return results
+
+
+def report(results: List[LoadResult], duration: float, skipped: int = 0) -> Dict:
+    """
+    Summary of the load: throughput and latency percentiles compared with stored ones
+
+    :param skipped: number of stored requests what were not sent (see BODY_METHODS)
+    """
+    measured = latency_summary([item.latency for item in results])
+    recorded = latency_summary([item.request.latency for item in results])
+    return {
+        "requests": len(results),
+        "skipped": skipped,
+        "failed": sum(1 for item in results if item.status is None),
+        "status_mismatch": sum(
+            1 for item in results if item.status is not None and not item.matches
+        ),
+        "duration": duration,
+        "throughput": len(results) / duration if duration else 0,
+        "latency": measured,
+        "recorded_latency": recorded,
+        "latency_ratio": {
+            key: measured[key] / recorded[key] if recorded[key] else None
+            for key in measured
+        },
+    }
+
+
+def benchmark(
+    target: str,
+    storage_files: List[str],
+    concurrency: int = 10,
+    repeat: int = 1,
+    timeout: float = 30,
+) -> Dict:
+    """
+    Send requests of storage files to the target and return report of the load.
+    Requests with body (see BODY_METHODS) are skipped.
+    """
+    requests = []
+    skipped = 0
+    for request in LoadRequest.from_storage_files(storage_files):
+        if request.method in BODY_METHODS:
+            logger.info(f"Skipped {request.method} {request.path}, body is not stored")
+            skipped += 1
+        else:
+            requests.append(request)
+    start = time.perf_counter()
+    results = asyncio.run(
+        run_load(
+            target, requests, concurrency=concurrency, repeat=repeat, timeout=timeout
+        )
+    )
+    return report(results, time.perf_counter() - start, skipped=skipped)
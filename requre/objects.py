@@ -1,23 +1,129 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import functools
 import inspect
+import io
 import logging
 import pickle
+import types
 import warnings
 from typing import Optional, Callable, Any, List, Dict
 
+from requre.exceptions import PersistentStorageException
 from requre.storage import PersistentObjectStorage
 from requre.cassette import (
     original_time,
     StorageKeysInspectFull,
     Cassette,
     CassetteExecution,
+    get_active_cassette,
 )
 
-
 logger = logging.getLogger(__name__)
+# key of the stored dict, when object is pickled with out-of-band buffers
+OUT_OF_BAND_KEY = "pickle_protocol_5"
+
+
+class _instance_or_classmethod:
+    """
+    Method bound to the instance when called via instance, to the class otherwise
+    """
+
+    def __init__(self, func: Callable):
+        self.__func__ = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, instance, owner):
+        return types.MethodType(self.__func__, owner if instance is None else instance)
+
+
+def _wraps_like(func: Callable, call: Callable) -> Callable:
+    """
+    Create wrapper of func what calls call(*args, **kwargs). Wrapper is coroutine
+    function or async generator function when func is, so it is possible to inspect
+    it same way as the original function.
+    """
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def coroutine_wrapper(*args, **kwargs):
+            return await call(*args, **kwargs)
+
+        return coroutine_wrapper
+
+    if inspect.isasyncgenfunction(func):
+
+        @functools.wraps(func)
+        async def async_generator_wrapper(*args, **kwargs):
+            async for item in call(*args, **kwargs):
+                yield item
+
+        return async_generator_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return call(*args, **kwargs)
+
+    return wrapper
+
+
+class _OutOfBandPickler(pickle.Pickler):
+    """
+    Pickler what moves big buffers out of the pickled data.
+    Objects reduced to PickleBuffer (e.g. array-like objects) use protocol 5
+    buffer_callback, bytes and bytearray objects are always pickled in-band
+    by pickle, so they are moved out via persistent_id.
+    """
+
+    def __init__(self, file, threshold: int):
+        super().__init__(file, protocol=5, buffer_callback=self._buffer_callback)
+        self.threshold = threshold
+        self.buffers: List[pickle.PickleBuffer] = []
+        self.bytes_buffers: List[pickle.PickleBuffer] = []
+
+    def _buffer_callback(self, buffer: pickle.PickleBuffer) -> bool:
+        try:
+            if buffer.raw().nbytes < self.threshold:
+                return True
+        except BufferError:
+            # non-contiguous buffer, keep it in-band
+            return True
+        self.buffers.append(buffer)
+        return False
+
+    def persistent_id(self, obj):
+        if type(obj) in (bytes, bytearray) and len(obj) >= self.threshold:
+            self.bytes_buffers.append(pickle.PickleBuffer(obj))
+            return type(obj).__name__, len(self.bytes_buffers) - 1
+        return None
+
+
+class _OutOfBandUnpickler(pickle.Unpickler):
+    """
+    Unpickler of data pickled by _OutOfBandPickler, buffers are views
+    of memory mapped binary sidecar file of cassette.
+    Objects reconstructed from PickleBuffer get the views (zero-copy),
+    bytes and bytearray objects are copied (once) from the mapped file:
+    bytes can't reference foreign memory and bytearray must not modify
+    the read-only mapping, returned views would change type of replayed values.
+    """
+
+    def __init__(
+        self, file, buffers: List[memoryview], bytes_buffers: List[memoryview]
+    ):
+        super().__init__(file, buffers=buffers)
+        self.bytes_buffers = bytes_buffers
+
+    def persistent_load(self, pid):
+        kind, index = pid
+        # the only copy of the buffer, see class docstring
+        if kind == "bytes":
+            return bytes(self.bytes_buffers[index])
+        if kind == "bytearray":
+            return bytearray(self.bytes_buffers[index])
+        raise pickle.UnpicklingError(f"Unsupported persistent id: {pid}")
 
 
 class ObjectStorage:
@@ -35,33 +141,56 @@ class ObjectStorage:
     object_type = object
     DUPLICATION_KEY = "requre.objects"
     stack_internal_check = True
+    # store buffers bigger than threshold to binary sidecar file of cassette
+    # via pickle protocol 5, instead of inline (base64) inside storage file;
+    # replayed PickleBuffer objects reference the mapped file (zero-copy),
+    # bytes and bytearray objects are copied from it
+    out_of_band_buffers = False
+    out_of_band_threshold = 64 * 1024
 
     def __init__(
         self,
         store_keys: list,
-        cassette: Cassette,
+        cassette: Optional[Cassette],
         storage_object_kwargs: Optional[dict] = None,
     ) -> None:
         self.store_keys = store_keys
         if cassette:
-            self.set_cassette(cassette)
+            # passed cassette is used by this object, also when other one is active
+            self._cassette = cassette
+            if get_active_cassette() is None:
+                self.set_cassette(cassette)
         self.store_keys = store_keys
         self.storage_object_kwargs = storage_object_kwargs or {}
 
-    @classmethod
-    def get_cassette(cls):
+    @_instance_or_classmethod
+    def get_cassette(self_or_cls):
         """
         Internal method to return proper cassette, it is important after rewriting of singletons
-        Cassette were not passed to object executor
+        Cassette were not passed to object executor.
+        Cassette passed to the instance takes precedence,
+        then cassette activated for the current context.
         :return: Cassette instance
         """
-        if cls._cassette:
-            return cls._cassette
+        if not isinstance(self_or_cls, type) and "_cassette" in vars(self_or_cls):
+            return self_or_cls._cassette
+        active_cassette = get_active_cassette()
+        if active_cassette is not None:
+            return active_cassette
+        if self_or_cls._cassette:
+            return self_or_cls._cassette
         else:
             return PersistentObjectStorage().cassette
 
     @classmethod
     def set_cassette(cls, value):
+        # cassette is bound to the context, do not change class for other contexts
+        active_cassette = get_active_cassette()
+        if active_cassette is not None and active_cassette is not value:
+            raise PersistentStorageException(
+                f"Unable to set cassette of {cls.__name__}, other cassette is active "
+                "in the current context, pass the cassette to the object instead."
+            )
         cls._cassette = value
 
     @classmethod
@@ -90,6 +219,26 @@ class ObjectStorage:
         :param kwargs: parameters of original function
         :return: CassetteExecution class with function and cassette instance
         """
+        func_exposed = func.function if isinstance(func, CassetteExecution) else func
+        # coroutine functions return awaitable, async generators return async iterator
+        if inspect.iscoroutinefunction(func_exposed):
+            return cls.execute_async(
+                keys,
+                func,
+                *args,
+                storage_object_kwargs=storage_object_kwargs,
+                cassette=cassette,
+                **kwargs,
+            )
+        if inspect.isasyncgenfunction(func_exposed):
+            return cls.execute_async_generator(
+                keys,
+                func,
+                *args,
+                storage_object_kwargs=storage_object_kwargs,
+                cassette=cassette,
+                **kwargs,
+            )
         storage_object_kwargs = storage_object_kwargs or {}
         object_storage = cls(
             store_keys=keys, cassette=cassette, **storage_object_kwargs
@@ -97,30 +246,14 @@ class ObjectStorage:
 
         if object_storage.get_cassette().do_store(keys):
             time_before = original_time()
-            func_exposed = (
-                func.function if isinstance(func, CassetteExecution) else func
-            )
             response = func_exposed(*args, **kwargs)
 
             time_after = original_time()
-            call_stack = StorageKeysInspectFull.get_base_keys(func_exposed)
-            # do not store data of fuction what will be stored by upper decodator
-            if cls.stack_internal_check and call_stack.count(cls.DUPLICATION_KEY) > 1:
+            metadata = cls._execution_metadata(
+                func_exposed, args, kwargs, cassette, time_after - time_before
+            )
+            if metadata is None:
                 return response
-            metadata: Dict = {
-                cassette.data_miner.LATENCY_KEY: time_after - time_before,
-                cassette.data_miner.METADATA_CALLER_LIST: call_stack,
-            }
-            if cassette.data_miner.store_arg_debug_metadata:
-                args_clean = [f"'{x}'" if isinstance(x, str) else str(x) for x in args]
-                kwargs_clean = [
-                    f"""{k}={f"'{v}'" if isinstance(v, str) else str(v)}"""
-                    for k, v in kwargs.items()
-                ]
-                caller = (
-                    f"{func_exposed.__name__}({', '.join(args_clean + kwargs_clean)})"
-                )
-                metadata[cassette.data_miner.METADATA_ARG_DEBUG_KEY] = caller
             object_storage.write(response, metadata)
             logger.debug(f"WRITE Keys: {keys} -> {response}")
             return response
@@ -130,6 +263,123 @@ class ObjectStorage:
             logger.debug(f"READ  Keys: {keys} -> {response}")
             return response
 
+    @classmethod
+    async def execute_async(
+        cls,
+        keys: list,
+        func: Callable,
+        *args,
+        storage_object_kwargs=None,
+        cassette: Cassette,
+        **kwargs,
+    ) -> Any:
+        """
+        Same as execute, but for coroutine functions, original function is awaited
+        and object is written via write_async
+        """
+        storage_object_kwargs = storage_object_kwargs or {}
+        object_storage = cls(
+            store_keys=keys, cassette=cassette, **storage_object_kwargs
+        )
+
+        if object_storage.get_cassette().do_store(keys):
+            time_before = original_time()
+            func_exposed = (
+                func.function if isinstance(func, CassetteExecution) else func
+            )
+            response = await func_exposed(*args, **kwargs)
+
+            time_after = original_time()
+            metadata = cls._execution_metadata(
+                func_exposed, args, kwargs, cassette, time_after - time_before
+            )
+            if metadata is None:
+                return response
+            await object_storage.write_async(response, metadata)
+            logger.debug(f"WRITE Keys: {keys} -> {response}")
+            return response
+
+        else:
+            response = await object_storage.read_async()
+            logger.debug(f"READ  Keys: {keys} -> {response}")
+            return response
+
+    @classmethod
+    async def execute_async_generator(
+        cls,
+        keys: list,
+        func: Callable,
+        *args,
+        storage_object_kwargs=None,
+        cassette: Cassette,
+        **kwargs,
+    ) -> Any:
+        """
+        Same as execute, but for async generator functions. Items are passed
+        to the caller as they are generated and list of them is stored
+        (via write_async) when generator finishes or it is closed.
+        """
+        storage_object_kwargs = storage_object_kwargs or {}
+        object_storage = cls(
+            store_keys=keys, cassette=cassette, **storage_object_kwargs
+        )
+
+        if object_storage.get_cassette().do_store(keys):
+            time_before = original_time()
+            func_exposed = (
+                func.function if isinstance(func, CassetteExecution) else func
+            )
+            items: List[Any] = []
+            try:
+                async for item in func_exposed(*args, **kwargs):
+                    items.append(item)
+                    yield item
+            finally:
+                time_after = original_time()
+                metadata = cls._execution_metadata(
+                    func_exposed, args, kwargs, cassette, time_after - time_before
+                )
+                if metadata is not None:
+                    await object_storage.write_async(items, metadata)
+                    logger.debug(f"WRITE Keys: {keys} -> {items}")
+
+        else:
+            items = await object_storage.read_async()
+            logger.debug(f"READ  Keys: {keys} -> {items}")
+            for item in items:
+                yield item
+
+    @classmethod
+    def _execution_metadata(
+        cls,
+        func_exposed: Callable,
+        args: tuple,
+        kwargs: dict,
+        cassette: Cassette,
+        latency: float,
+    ) -> Optional[Dict]:
+        """
+        Metadata stored with output of the function,
+        None when output will be stored by upper decorator
+        """
+        call_stack = StorageKeysInspectFull.get_base_keys(func_exposed)
+        # do not store data of fuction what will be stored by upper decodator
+        if cls.stack_internal_check and call_stack.count(cls.DUPLICATION_KEY) > 1:
+            return None
+        metadata: Dict = {
+            cassette.data_miner.LATENCY_KEY: latency,
+            cassette.data_miner.METADATA_CALLER_LIST: call_stack,
+        }
+        if cassette.data_miner.store_arg_debug_metadata:
+            args_clean = [f"'{x}'" if isinstance(x, str) else str(x) for x in args]
+            kwargs_clean = [
+                f"""{k}={f"'{v}'" if isinstance(v, str) else str(v)}"""
+                for k, v in kwargs.items()
+            ]
+            caller = f"{func_exposed.__name__}({', '.join(args_clean + kwargs_clean)})"
+            metadata[cassette.data_miner.METADATA_ARG_DEBUG_KEY] = caller
+        return metadata
+
     @classmethod
     def execute_all_keys(
         cls,
@@ -210,14 +460,13 @@ class ObjectStorage:
         """
 
         def internal(func):
-            @functools.wraps(func)
             def internal_internal(*args, **kwargs):
                 return cls.decorator(
                     item_list=list(range(len(args))) + list(kwargs.keys()),
                     cassette=cassette,
                 )(func)(*args, **kwargs)
 
-            return internal_internal
+            return _wraps_like(func, internal_internal)
 
         return internal
 
@@ -244,12 +493,12 @@ class ObjectStorage:
 
         map_function_to_item = map_function_to_item or {}
         casex = CassetteExecution()
-        casex.cassette = cassette or cls.get_cassette()
+        casex.cassette = cassette
+        casex.default_cassette = cls.get_cassette()
         casex.obj_cls = cls
 
         def internal(func: Callable):
-            @functools.wraps(func)
-            def internal_internal(*args, **kwargs):
+            def get_keys(args, kwargs) -> list:
                 keys = cls.get_base_keys(func)
                 # get all possible arguments of passed function
                 try:
@@ -283,8 +532,11 @@ class ObjectStorage:
                         keys.append(key)
                     else:
                         keys.append(map_function_to_item[param_name](key))
+                return keys
+
+            def internal_internal(*args, **kwargs):
                 return cls.execute(
-                    keys,
+                    get_keys(args, kwargs),
                     func,
                     *args,
                     storage_object_kwargs=storage_object_kwargs,
@@ -292,7 +544,7 @@ class ObjectStorage:
                     **kwargs,
                 )
 
-            return internal_internal
+            return _wraps_like(func, internal_internal)
 
         casex.function = internal
         return casex
@@ -325,6 +577,37 @@ class ObjectStorage:
         )
         return obj
 
+    async def write_async(self, obj: Any, metadata: Optional[Dict] = None) -> Any:
+        """
+        Write the object representation to storage, used for output of coroutines.
+        Override it when object has to be awaited to get its representation.
+
+        :param obj: some object
+        :param metadata: store metedata to object
+        :return: same obj
+        """
+        return self.write(obj, metadata)
+
+    async def read_async(self):
+        """
+        Same as read, used for coroutines. Latency (when used) is applied
+        via asyncio.sleep, to not block event loop.
+        Override it when reading of object needs I/O.
+
+        :return: proper object
+        """
+        data_miner = self.get_cassette().data_miner
+        use_latency = data_miner.use_latency
+        # there is no await between, so other tasks do not see the change
+        data_miner.use_latency = False
+        try:
+            obj = self.read()
+        finally:
+            data_miner.use_latency = use_latency
+        if use_latency:
+            await asyncio.sleep(data_miner.metadata.get(data_miner.LATENCY_KEY, 0))
+        return obj
+
     def read(self):
         """
         Crete object representation of serialized data in persistent storage
@@ -343,6 +626,8 @@ class ObjectStorage:
         :param obj: some object
         :return: Yaml serializable object
         """
+        if self.out_of_band_buffers:
+            return self._to_serializable_out_of_band(obj)
         output = pickle.dumps(obj)
         return output
 
@@ -353,5 +638,31 @@ class ObjectStorage:
         :param data: Yaml serializable object
         :return: some object
         """
+        if isinstance(data, dict) and OUT_OF_BAND_KEY in data:
+            return self._from_serializable_out_of_band(data)
         output = pickle.loads(data)
         return output
+
+    def _to_serializable_out_of_band(self, obj: Any) -> Dict:
+        """
+        Pickle object via protocol 5, big buffers are written to buffer segment
+        of cassette and just their offsets are returned.
+        """
+        pickled = io.BytesIO()
+        pickler = _OutOfBandPickler(pickled, threshold=self.out_of_band_threshold)
+        pickler.dump(obj)
+        segment = self.get_cassette().buffer_segment
+        return {
+            OUT_OF_BAND_KEY: pickled.getvalue(),
+            "buffers": [segment.write(item.raw()) for item in pickler.buffers],
+            "bytes": [segment.write(item.raw()) for item in pickler.bytes_buffers],
+        }
+
+    def _from_serializable_out_of_band(self, data: Dict) -> Any:
+        segment = self.get_cassette().buffer_segment
+        unpickler = _OutOfBandUnpickler(
+            io.BytesIO(data[OUT_OF_BAND_KEY]),
+            buffers=[segment.read(*item) for item in data["buffers"]],
+            bytes_buffers=[segment.read(*item) for item in data["bytes"]],
+        )
+        return unpickler.load()
@@ -2,8 +2,9 @@
 # SPDX-License-Identifier: MIT
 
 import os
+import json
 import logging
-from typing import Union, Any, Dict, Optional, List
+from typing import Union, Any, Dict, Iterator, Optional, List, Tuple
 from .constants import KEY_MINIMAL_MATCH, METATADA_KEY
 from .cassette import DataMiner, DataStructure, DataTypes
 from glob import glob
@@ -17,6 +18,14 @@ from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+# store indicators of response handlers for body stored as JSON object tree
+# and for JSON body stored verbatim as text
+STORE_INDICATOR_KEY = "__store_indicator"
+JSON_TREE_INDICATOR = 2
+JSON_TEXT_INDICATOR = 4
+# methods used as storage keys of HTTP responses (together with url)
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
 
 class DictProcessing:
     def __init__(self, requre_dict: dict):
@@ -124,6 +133,68 @@ class DictProcessing:
                 for v in internal_object.values():
                     self.simplify(internal_object=v, ignore_list=ignore_list)
 
+    def expand_json_bodies(self, internal_object: Any = None) -> int:
+        """
+        Replace JSON response bodies stored verbatim as text by parsed object trees,
+        to have readable form of storage file for review and diffs.
+        Replaying of expanded file works, but body is not byte-identical anymore.
+
+        :return: number of expanded bodies
+        """
+        internal_object = (
+            self.requre_dict if internal_object is None else internal_object
+        )
+        expanded = 0
+        values: Any
+        if isinstance(internal_object, dict):
+            if (
+                internal_object.get(STORE_INDICATOR_KEY) == JSON_TEXT_INDICATOR
+                and "_content" in internal_object
+            ):
+                internal_object["_content"] = json.loads(internal_object["_content"])
+                internal_object[STORE_INDICATOR_KEY] = JSON_TREE_INDICATOR
+                return 1
+            values = internal_object.values()
+        elif isinstance(internal_object, list):
+            values = internal_object
+        else:
+            return 0
+        for value in values:
+            expanded += self.expand_json_bodies(internal_object=value)
+        return expanded
+
+    def responses(
+        self, internal_object: Any = None, keys: Optional[List[Any]] = None
+    ) -> Iterator[Tuple[str, str, Dict, Dict]]:
+        """
+        Find HTTP responses (of requests or httpx handlers), what are stored
+        under method and url keys
+
+        :return: tuples (method, url, metadata, stored response) in stored order
+        """
+        if internal_object is None:
+            internal_object = self.requre_dict
+            keys = []
+        keys = keys or []
+        if isinstance(internal_object, dict):
+            for key, value in internal_object.items():
+                if key != METATADA_KEY:
+                    yield from self.responses(internal_object=value, keys=keys + [key])
+        elif (
+            isinstance(internal_object, list)
+            and len(keys) >= 2
+            and keys[-2] in HTTP_METHODS
+        ):
+            for item in internal_object:
+                if isinstance(item, dict) and DataStructure.OUTPUT_KEY in item:
+                    metadata = item.get(DataStructure.METADATA_KEY) or {}
+                    output = item[DataStructure.OUTPUT_KEY]
+                else:
+                    # storage file version 1, without metadata
+                    metadata, output = {}, item
+                if isinstance(output, dict) and "status_code" in output:
+                    yield keys[-2], keys[-1], metadata, output
+
 
 class TarFilesSimilarity:
     def __init__(self, path, hash_function=None):
@@ -6,6 +6,7 @@ import logging
 import pytest
 
 from requre.online_replacing import recording_requests
+from requre.record_and_replace import uninstall_session_replacements
 from requre.utils import StorageMode, get_datafile_filename
 
 logger = logging.getLogger(__name__)
@@ -27,3 +28,8 @@ def record_requests_fixture(request):
         yield cassette
         cassette.dump()
         logger.debug(f"End requre {mode_description} with storage file: {storage_file}")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    # revert replacements installed once per session (replace(..., session=True))
+    uninstall_session_replacements()
@@ -7,11 +7,27 @@ import logging
 import os
 import re
 import sys
+import threading
 import types
-from contextlib import contextmanager
-from typing import Any, Callable, List, Optional, Tuple, Union
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
-from requre.cassette import Cassette, CassetteExecution
+from requre.cassette import (
+    Cassette,
+    CassetteExecution,
+    activate_cassette,
+    get_active_cassette,
+)
 from requre.cassette import StorageKeysInspectSimple
 from requre.constants import (
     REQURE_CASSETTE_ATTRIBUTE_NAME,
@@ -45,109 +61,196 @@ class ModuleRecord:
         )
 
 
-def _apply_module_replacement(
-    what,
-    module,
-    cassette,
-    decorate,
-    replace,
-    module_record_list: List[ModuleRecord],
-    add_revert_list: List,
-) -> List[ModuleRecord]:
+def _bind_cassette(items, cassette: Optional[Cassette]) -> None:
     """
-    Internal method what finds inside module if the what string matches.
-    If yes, apply the  replacement, otherwise return None
+    Internal function what sets cassette to CassetteExecution objects.
 
-    :param what: What will be replaced
-    :param module: the module where we try to find match for "what"
+    :param items: replacement or decorator, or list of decorators
     :param cassette: Cassette instance
-    :param decorate: decorator to be applied
+    """
+    for item in items if isinstance(items, list) else [items]:
+        if isinstance(item, CassetteExecution):
+            item.cassette = cassette
+            # class cassette is not changed for the context with active cassette
+            if get_active_cassette() is None:
+                item.obj_cls.set_cassette(cassette)
+
+
+def _create_replacement(
+    original_obj, cassette, decorate, replace, bind_cassette=True
+) -> Tuple[Callable, Union[Callable, List[Callable]]]:
+    """
+    Internal function what creates replacement of original_obj.
+    It binds cassette to CassetteExecution objects if there are some.
+
+    :param original_obj: object what will be replaced
+    :param cassette: Cassette instance
+    :param decorate: decorator (or list of them) to be applied
     :param replace: replace function to be applied
-    :param module_record_list: list of modules what was already applied
-    :return: None or ModuleRecord
+    :param bind_cassette: set cassette to CassetteExecution objects
+    :return: tuple of replacement and function(s) used to create it
     """
-    full_module_list = what.split(".")
-    module_name = module.__name__
-    output_record_list: List[ModuleRecord] = list()
-    # avoid to deep dive into
-    # if not matched, try to find just part, if not imported as full path
-    for depth, _ in enumerate(full_module_list):
-        original_obj = module
-        parent_obj = None
-        # rest of list has to match object path
-        for module_path in full_module_list[depth:]:
-            parent_obj = original_obj
-            try:
-                original_obj = getattr(original_obj, module_path)
-            except AttributeError:
-                # this is used also for indication that match of path passed
-                # in case it match partial path, make it None
-                parent_obj = None
-                break
-            original_obj_text = (
-                original_obj.__name__
-                if hasattr(original_obj, "__name__")
-                else str(original_obj)
-            )
+    if replace is not None:
+        if bind_cassette:
+            _bind_cassette(replace, cassette)
+        if isinstance(replace, CassetteExecution):
+            new_function = replace.function
+        else:
+            new_function = replace
+        return new_function, new_function
+    new_function = decorate if isinstance(decorate, list) else [decorate]
+    if bind_cassette:
+        _bind_cassette(new_function, cassette)
+    replacement = original_obj
+    for item in new_function:
+        if isinstance(item, CassetteExecution):
+            replacement = item.function(replacement)
+        else:
+            replacement = item(replacement)
+    return replacement, new_function
+
+
+class ReplacementTarget:
+    """
+    One "what" target of the replacement system with decorator or replacement
+    what will be applied to it.
+    """
+
+    def __init__(self, what: str, decorate=None, replace=None, add_revert_list=None):
+        self.what = what
+        self.path = what.split(".")
+        self.decorate = decorate
+        self.replace = replace
+        self.add_revert_list = add_revert_list
+
+    def __str__(self):
+        return (
+            f"ReplacementTarget({self.what}, decorate={self.decorate},"
+            f" replace={self.replace})"
+        )
+
+
+class _TrieNode:
+    __slots__ = ("children", "matches")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        # (target, depth) pairs what ends in this node
+        self.matches: List[Tuple[ReplacementTarget, int]] = []
+
+
+class TargetTrie:
+    """
+    Trie of object paths compiled from several "what" targets.
+
+    Every suffix of the target path is inserted (target could be imported
+    as module, submodule or just the object itself), so common parts of paths
+    are resolved via getattr just once per module for all targets.
+    """
+
+    def __init__(self, targets: List[ReplacementTarget]):
+        self.targets = targets
+        self.root = _TrieNode()
+        for target in targets:
+            for depth in range(len(target.path)):
+                node = self.root
+                for key in target.path[depth:]:
+                    node = node.children.setdefault(key, _TrieNode())
+                node.matches.append((target, depth))
+
+    def walk(self, module) -> List[Tuple[ReplacementTarget, int, Any, Any]]:
+        """
+        Find all targets what could be reached inside module.
+
+        :param module: module where to start with getattr resolution
+        :return: list of (target, depth, parent object, original object)
+        """
+        output: List[Tuple[ReplacementTarget, int, Any, Any]] = []
+        stack = [(self.root, module)]
+        while stack:
+            node, parent_obj = stack.pop()
+            for key, child in node.children.items():
+                try:
+                    original_obj = getattr(parent_obj, key)
+                except AttributeError:
+                    continue
+                for target, depth in child.matches:
+                    output.append((target, depth, parent_obj, original_obj))
+                if child.children:
+                    stack.append((child, original_obj))
+        # keep order of targets and partial paths from the longest one
+        output.sort(key=lambda item: (self.targets.index(item[0]), item[1]))
+        return output
+
+
+def _is_target_match(
+    target: ReplacementTarget, module_name: str, depth: int, parent_obj, original_obj
+) -> bool:
+    """
+    Check if object found in module comes from the module path inside "what",
+    avoid to replace something else with same path, eg, you define what "re.search",
+    and it matches "search" as part of your module but it does not come from re module
+    """
+    try:
+        # TODO: this part should be improved, theoretically
+        #  join(full_module_list).startswith( original_obj.__module__)
+        #  could lead to issue, that it matches another module path
+        if original_obj.__module__ and not target.what.startswith(
+            original_obj.__module__
+        ):
             logger.debug(
-                f"\tmodule {module_name} -> {module_path} in "
-                f"{original_obj_text} ({full_module_list[depth:]})"
+                f"SIMILAR MATCH module {module_name} "
+                f"in {parent_obj.__name__} -> {original_obj.__name__} "
+                f"from {original_obj.__module__} ({target.path[depth:]})"
             )
-        # continue if parent is empty or module of function did not match
-        # path inside what avoid replace something else with same path
-        # eg, you define what "re.search", and it matches "search" as
-        # part of your module but it does not come from re module
-
-        try:
-            # TODO: this part should be improved, theoretically
-            #  join(full_module_list).startswith( original_obj.__module__)
-            #  could lead to issue, that it matches another module path
-            if not parent_obj:
-                continue
-            if original_obj.__module__ and not ".".join(full_module_list).startswith(
-                original_obj.__module__
-            ):
-                logger.debug(
-                    f"SIMILAR MATCH module {module_name} "
-                    f"in {parent_obj.__name__} -> {original_obj.__name__} "
-                    f"from {original_obj.__module__} ({full_module_list[depth:]})"
-                )
-                continue
-        except AttributeError as e:
-            logger.debug(e)
-            continue
+            return False
         logger.info(
             f"MATCH module {module_name} "
             f"in {parent_obj.__name__} -> {original_obj.__name__} "
-            f"from {original_obj.__module__} ({full_module_list[depth:]})"
+            f"from {original_obj.__module__} ({target.path[depth:]})"
         )
-        if replace is not None:
-            if isinstance(replace, CassetteExecution):
-                new_function = replace.function
-                replace.cassette = cassette
-                replace.obj_cls.set_cassette(cassette)
-            else:
-                new_function = replace
-            replacement = new_function
-        elif decorate is not None:
-            if not isinstance(decorate, list):
-                new_function = [decorate]
-            else:
-                new_function = decorate
-            replacement = original_obj
-            for item in new_function:
-                if isinstance(item, CassetteExecution):
-                    item.cassette = cassette
-                    item.obj_cls.set_cassette(cassette)
-                    replacement = item.function(replacement)
-                else:
-                    replacement = item(replacement)
-        else:
+    except AttributeError as e:
+        logger.debug(e)
+        return False
+    return True
+
+
+def _replace_in_module(
+    trie: TargetTrie,
+    module,
+    cassette,
+    module_record_dict: Dict[int, List[ModuleRecord]],
+) -> List[ModuleRecord]:
+    """
+    Internal function what applies all targets of the trie inside one module.
+
+    :param trie: compiled targets
+    :param module: the module where we try to find match for targets
+    :param cassette: Cassette instance
+    :param module_record_dict: records already applied, per target (id of target)
+    :return: list of new ModuleRecord items
+    """
+    module_name = module.__name__
+    output_record_list: List[ModuleRecord] = []
+    for target, depth, parent_obj, original_obj in trie.walk(module):
+        if not _is_target_match(target, module_name, depth, parent_obj, original_obj):
             continue
-        # check if already replaced, then continue
-        if original_obj in [x.replacement for x in module_record_list]:
-            logger.info(f"\talready replaced {what} in {module_name}")
+        if target.replace is None and target.decorate is None:
             continue
+        target_records = module_record_dict.setdefault(id(target), [])
+        # check if already replaced (also via another partial path), then continue
+        if original_obj in [x.replacement for x in target_records] or any(
+            x.parent is parent_obj and x.original is original_obj
+            for x in target_records
+        ):
+            logger.info(f"\talready replaced {target.what} in {module_name}")
+            continue
+        replacement, new_function = _create_replacement(
+            original_obj=original_obj,
+            cassette=cassette,
+            decorate=target.decorate,
+            replace=target.replace,
+        )
         # TODO: have to try to investigate how to do multiple replacements of same
         #  change the module string in replacements, to be able to do multiple
         #  replacements this is tricky and may be confusing, but also make it
@@ -164,33 +267,68 @@ def _apply_module_replacement(
             else new_function
         )
         logger.info(
-            f"\tREPLACES {what} in {module_name}"
+            f"\tREPLACES {target.what} in {module_name}"
             f" by function {fn_str} {original_obj}"
         )
-        output_record_list.append(
-            ModuleRecord(
-                what=what,
-                parent=parent_obj,
-                original=original_obj,
-                replacement=replacement,
-                add_revert_list=add_revert_list,
-            )
+        record = ModuleRecord(
+            what=target.what,
+            parent=parent_obj,
+            original=original_obj,
+            replacement=replacement,
+            add_revert_list=target.add_revert_list,
         )
+        target_records.append(record)
+        output_record_list.append(record)
     return output_record_list
 
 
-def _parse_and_replace_sys_modules(
-    what: str,
-    cassette: Cassette,
-    decorate: Any = None,
-    replace: Any = None,
-    add_revert_list: Optional[List] = None,
+def _apply_module_replacement(
+    what,
+    module,
+    cassette,
+    decorate,
+    replace,
+    module_record_list: List[ModuleRecord],
+    add_revert_list: List,
 ) -> List[ModuleRecord]:
     """
-    Internal fucntion what will check all sys.modules, and try to find there implementation of
-    "what" and replace or decorate it by given value(s)
+    Internal method what finds inside module if the what string matches.
+    If yes, apply the  replacement, otherwise return None
+
+    :param what: What will be replaced
+    :param module: the module where we try to find match for "what"
+    :param cassette: Cassette instance
+    :param decorate: decorator to be applied
+    :param replace: replace function to be applied
+    :param module_record_list: list of modules what was already applied
+    :return: None or ModuleRecord
+    """
+    target = ReplacementTarget(
+        what=what, decorate=decorate, replace=replace, add_revert_list=add_revert_list
+    )
+    return _replace_in_module(
+        trie=TargetTrie([target]),
+        module=module,
+        cassette=cassette,
+        module_record_dict={id(target): list(module_record_list)},
+    )
+
+
+def _parse_and_replace_sys_modules_multiple(
+    targets: List[ReplacementTarget],
+    cassette: Optional[Cassette],
+) -> List[ModuleRecord]:
     """
-    logger.info(f"\n++++++ SEARCH {what} decorator={decorate} replace={replace}")
+    Internal function what resolves all targets in single pass over sys.modules
+    and replace or decorate them by given value(s)
+
+    :param targets: list of ReplacementTarget objects
+    :param cassette: Cassette instance
+    :return: one list of ModuleRecord items for all targets, to revert them together
+    """
+    logger.info(f"\n++++++ SEARCH {', '.join(str(x) for x in targets)}")
+    trie = TargetTrie(targets)
+    module_record_dict: Dict[int, List[ModuleRecord]] = {}
     module_list: List[ModuleRecord] = []
     # go over all modules, and try to find match
     for module in sys.modules.copy().values():
@@ -198,18 +336,39 @@ def _parse_and_replace_sys_modules(
             # ignore non-modules (for example coverage abuses sys.modules
             # to store its DebugOutputFile object)
             continue
-        module_list += _apply_module_replacement(
-            what=what,
+        module_list += _replace_in_module(
+            trie=trie,
             module=module,
             cassette=cassette,
-            decorate=decorate,
-            replace=replace,
-            module_record_list=module_list,
-            add_revert_list=add_revert_list,
+            module_record_dict=module_record_dict,
         )
     return module_list
 
 
+def _parse_and_replace_sys_modules(
+    what: str,
+    cassette: Optional[Cassette],
+    decorate: Any = None,
+    replace: Any = None,
+    add_revert_list: Optional[List] = None,
+) -> List[ModuleRecord]:
+    """
+    Internal fucntion what will check all sys.modules, and try to find there implementation of
+    "what" and replace or decorate it by given value(s)
+    """
+    return _parse_and_replace_sys_modules_multiple(
+        targets=[
+            ReplacementTarget(
+                what=what,
+                decorate=decorate,
+                replace=replace,
+                add_revert_list=add_revert_list,
+            )
+        ],
+        cassette=cassette,
+    )
+
+
 def change_storage_file(
     cassette: Cassette, func, args, storage_file: Optional[str] = None
 ):
@@ -274,6 +433,229 @@ def _revert_modules(module_list: List[ModuleRecord]):
                 )
 
 
+class _SessionHandler:
+    """
+    Decorator(s) or replacement used by SessionReplacement with replacements
+    created from them, cached per original object for the lifetime of the handler.
+    """
+
+    def __init__(self, decorate=None, replace=None):
+        if decorate is None and replace is None:
+            decorate = Guess.decorator_plain()
+        elif decorate is not None and replace is not None:
+            raise ValueError(
+                "right one from [decorate, replace] parameter has to be set."
+            )
+        self.decorate = decorate
+        self.replace = replace
+        self._replacements: Dict[Callable, Callable] = {}
+
+    def replacement(self, original: Callable) -> Callable:
+        replacement = self._replacements.get(original)
+        if replacement is None:
+            # cassette is not bound here, CassetteExecution and ObjectStorage
+            # use the cassette activated for the current context
+            replacement, _ = _create_replacement(
+                original_obj=original,
+                cassette=None,
+                decorate=self.decorate,
+                replace=self.replace,
+                bind_cassette=False,
+            )
+            self._replacements[original] = replacement
+        return replacement
+
+
+# handlers of session replacements activated for the current context, by "what"
+_context_handlers: ContextVar[Optional[Dict[str, _SessionHandler]]] = ContextVar(
+    "requre_context_handlers", default=None
+)
+
+
+class SessionReplacement:
+    """
+    Replacement of one "what" target what is installed just once per session.
+
+    Installed wrapper looks for the cassette activated for the current context
+    (see requre.cassette.activate_cassette) on every call. When there is no active
+    cassette, the original object is called directly, otherwise the call is routed
+    to the decorated/replaced variant storing data to the active cassette.
+    Decorator or replacement could be also activated just for the current context
+    (see activate_handler), so concurrently running scopes do not affect each other.
+    """
+
+    def __init__(self, what: str, decorate=None, replace=None):
+        self.what = what
+        self.module_list: List[ModuleRecord] = []
+        self.decorate = None
+        self.replace = None
+        # True when installed for the whole session, otherwise it is reverted
+        # after the last user (see release_session_replacement)
+        self.persistent = False
+        self.users = 0
+        self.set_handler(decorate=decorate, replace=replace)
+
+    def __str__(self):
+        return f"SessionReplacement({self.what}, installed={bool(self.module_list)})"
+
+    def set_handler(self, decorate=None, replace=None) -> None:
+        """
+        Set decorator(s) or replacement used when cassette is active
+        and no handler is activated for the current context.
+
+        :param decorate: function decorator, or list of them, to be applied to what
+        :param replace: replace original function by given one
+        """
+        self.handler = _SessionHandler(decorate=decorate, replace=replace)
+        self.decorate, self.replace = self.handler.decorate, self.handler.replace
+
+    def has_handler(self, decorate=None, replace=None) -> bool:
+        return self.decorate is decorate and self.replace is replace
+
+    @contextmanager
+    def activate_handler(self, decorate=None, replace=None):
+        """
+        Context manager what uses given decorator(s) or replacement
+        just for calls done in the current context.
+
+        :param decorate: function decorator, or list of them, to be applied to what
+        :param replace: replace original function by given one
+        """
+        handlers = dict(_context_handlers.get() or {})
+        # replacements created for the handler are dropped with it
+        handlers[self.what] = _SessionHandler(decorate=decorate, replace=replace)
+        token = _context_handlers.set(handlers)
+        try:
+            yield self
+        finally:
+            _context_handlers.reset(token)
+
+    def _get_replacement(self, original: Callable) -> Callable:
+        handler = (_context_handlers.get() or {}).get(self.what) or self.handler
+        return handler.replacement(original)
+
+    def wrap(self, original: Callable) -> Callable:
+        """
+        Create dispatching wrapper for the original object.
+        """
+
+        @functools.wraps(original)
+        def _session_replaced(*args, **kwargs):
+            if get_active_cassette() is None:
+                return original(*args, **kwargs)
+            return self._get_replacement(original)(*args, **kwargs)
+
+        return _session_replaced
+
+
+# replacements installed for the whole session, stored by "what" target
+_session_replacements: Dict[str, SessionReplacement] = {}
+_session_replacements_lock = threading.RLock()
+
+
+def install_session_replacement(
+    what: str,
+    decorate: Optional[Union[List[Callable], Callable]] = None,
+    replace: Optional[Callable] = None,
+    persistent: bool = True,
+) -> SessionReplacement:
+    """
+    Install the replacement of "what" for the whole session.
+
+    It patches sys.modules just once, next calls only change the handler,
+    if a different decorator or replacement is given.
+    Patched objects are routed to the cassette activated for the current context,
+    use decorators with the session=True parameter
+    (or requre.cassette.activate_cassette) to activate it.
+    It could be also called from pytest hooks, e.g. pytest_sessionstart in conftest.py
+
+    :param what: str - full path of function inside module
+    :param decorate: function decorator what will be applied to what, could be also list of
+                     decorators, to be able to apply more decorators on one function
+    :param replace: replace original function by given one
+    :param persistent: keep it installed until uninstall_session_replacements is called,
+                       otherwise it is reverted by release_session_replacement
+                       when it is not used anymore
+    :return: SessionReplacement object
+    """
+    with _session_replacements_lock:
+        session_replacement = _session_replacements.get(what)
+        if session_replacement is None:
+            session_replacement = SessionReplacement(
+                what=what, decorate=decorate, replace=replace
+            )
+            _session_replacements[what] = session_replacement
+        elif (decorate is not None or replace is not None) and not (
+            session_replacement.has_handler(decorate=decorate, replace=replace)
+        ):
+            session_replacement.set_handler(decorate=decorate, replace=replace)
+        session_replacement.persistent = session_replacement.persistent or persistent
+        if not session_replacement.module_list:
+            # module could be imported after previous try
+            session_replacement.module_list = _parse_and_replace_sys_modules(
+                what=what, cassette=None, decorate=session_replacement.wrap
+            )
+        session_replacement.users += 1
+        return session_replacement
+
+
+def release_session_replacement(session_replacement: SessionReplacement) -> None:
+    """
+    Mark the replacement as not used by the caller anymore.
+    Replacement what is not persistent is reverted after the last user releases it.
+    """
+    with _session_replacements_lock:
+        session_replacement.users -= 1
+        if session_replacement.persistent or session_replacement.users > 0:
+            return
+        _revert_modules(session_replacement.module_list)
+        if _session_replacements.get(session_replacement.what) is session_replacement:
+            del _session_replacements[session_replacement.what]
+
+
+@contextmanager
+def session_scope(
+    what: str,
+    cassette: Cassette,
+    decorate: Optional[Union[List[Callable], Callable]] = None,
+    replace: Optional[Callable] = None,
+    persistent: bool = True,
+):
+    """
+    Context manager what routes calls of "what" done in the current context
+    to the given cassette. Calls from other contexts (e.g. threads started
+    without copying the context) use the original object, or the cassette
+    activated for their own context.
+
+    :param what: str - full path of function inside module
+    :param cassette: Cassette instance to activate
+    :param decorate: function decorator (or list of them) used in the current context
+    :param replace: replace original function by given one in the current context
+    :param persistent: keep replacement installed for the whole session,
+                       otherwise it is reverted when it is not used by any scope
+    """
+    session_replacement = install_session_replacement(
+        what=what, decorate=decorate, replace=replace, persistent=persistent
+    )
+    try:
+        with activate_cassette(cassette), session_replacement.activate_handler(
+            decorate=decorate, replace=replace
+        ):
+            yield cassette
+    finally:
+        release_session_replacement(session_replacement)
+
+
+def uninstall_session_replacements() -> None:
+    """
+    Revert all replacements installed via install_session_replacement.
+    """
+    with _session_replacements_lock:
+        for session_replacement in _session_replacements.values():
+            _revert_modules(session_replacement.module_list)
+        _session_replacements.clear()
+
+
 def make_generic(_decorator=None):
     """
     Decorator for decorators to make them applicable both on classes and methods/functions.
@@ -380,12 +762,24 @@ def replace(
     decorate: Optional[Union[List[Callable], Callable]] = None,
     replace: Optional[Callable] = None,
     storage_keys_strategy=None,
+    session: bool = False,
+    context_isolated: bool = False,
 ):
     """
     Decorator what helps you to replace/decorate functions/methods inside any already
     imported module. It uses what as identifier what you want to replace, then you can
     define if it will be decorated or replaced by given function.
 
+    With session=True, the replacement is installed just once per session
+    (see install_session_replacement) and the decorator only activates its cassette
+    for the decorated function, so there is no patching and reverting of sys.modules
+    for every test.
+
+    With context_isolated=True, only calls done in the context of the decorated function
+    are stored to its cassette, other threads or concurrently running scopes call
+    the original object (or their own cassette). Be aware that threads do not
+    inherit the context, use contextvars.copy_context().run to propagate it.
+
     Be aware of several situations:
       * This will not work if there are dynamic imports inside code execution
         * Workaround: import the module as part of your test code fist
@@ -408,6 +802,10 @@ def replace(
     :param cassette: Cassette instance to pass inside object to work with
     :param storage_keys_strategy: you can change key strategy for storing data
                                   default simple one avoid to store stack information
+    :param session: install the replacement once per session and route calls
+                    to the cassette of currently executed function
+    :param context_isolated: route just calls from the current context to the cassette,
+                             replacement is reverted after the last scope finishes
     """
     storage_keys_strategy = storage_keys_strategy or StorageKeysInspectSimple
 
@@ -417,6 +815,43 @@ def replace(
     elif decorate is not None and replace is not None:
         raise ValueError("right one from [decorate, replace] parameter has to be set.")
 
+    def patch(cassette_int: Cassette):
+        if session or context_isolated:
+            return [], session_scope(
+                what=what,
+                cassette=cassette_int,
+                decorate=decorate,
+                replace=replace,
+                persistent=session,
+            )
+        # Store values and their replacements for modules
+        # to be able to _revert_modules changes back
+        module_list = _parse_and_replace_sys_modules(
+            what=what, cassette=cassette_int, decorate=decorate, replace=replace
+        )
+        return module_list, nullcontext(cassette_int)
+
+    return _cassette_replace_decorator(
+        cassette=cassette, storage_keys_strategy=storage_keys_strategy, patch=patch
+    )
+
+
+def _cassette_replace_decorator(
+    cassette: Optional[Cassette],
+    storage_keys_strategy,
+    patch: Callable[[Cassette], Tuple[List[ModuleRecord], ContextManager]],
+):
+    """
+    Internal function what creates decorator shared by replace decorators.
+    It prepares cassette for the decorated function, applies the patch before
+    its execution, then dumps cassette and reverts modules.
+
+    :param cassette: Cassette instance, created if not given
+    :param storage_keys_strategy: key strategy for storing data
+    :param patch: function what applies replacements for given cassette and returns
+                  list of ModuleRecords to revert and context used for execution
+    """
+
     def replace_decorator(func):
         func_cassette = (
             getattr(func, REQURE_CASSETTE_ATTRIBUTE_NAME)
@@ -425,35 +860,59 @@ def replace(
         )
         cassette_int = cassette or func_cassette or Cassette()
 
-        @functools.wraps(func)
-        def _replaced_function(*args, **kwargs):
+        def prepare(args, kwargs) -> Tuple[List[ModuleRecord], ContextManager]:
             # set storage if not set to default one, based on function name
             if cassette_int.storage_file is None:
                 change_storage_file(cassette=cassette_int, func=func, args=args)
             cassette_int.data_miner.key_stategy_cls = storage_keys_strategy
             # ensure that directory structure exists already
             os.makedirs(os.path.dirname(cassette_int.storage_file), exist_ok=True)
-            # Store values and their replacements for modules
-            # to be able to _revert_modules changes back
-            module_list = _parse_and_replace_sys_modules(
-                what=what, cassette=cassette_int, decorate=decorate, replace=replace
-            )
+            module_list, cassette_context = patch(cassette_int)
+            # pass current cassette to underneath decorator and do not overwrite if set there
+            if (
+                "cassette" in inspect.getfullargspec(func).annotations
+                and inspect.getfullargspec(func).annotations["cassette"] == Cassette
+                and "cassette" not in kwargs
+            ):
+                kwargs["cassette"] = cassette_int
+            return module_list, cassette_context
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def _replaced_coroutine(*args, **kwargs):
+                module_list, cassette_context = prepare(args, kwargs)
+                try:
+                    # execute content, context is kept for awaited calls
+                    with cassette_context:
+                        return await func(*args, **kwargs)
+                finally:
+                    try:
+                        # dump data to storage file
+                        cassette_int.dump()
+                    finally:
+                        # modules are reverted also when dump fails (e.g. in its hook)
+                        _revert_modules(module_list)
+
+            setattr(_replaced_coroutine, REQURE_CASSETTE_ATTRIBUTE_NAME, cassette_int)
+            return _replaced_coroutine
+
+        @functools.wraps(func)
+        def _replaced_function(*args, **kwargs):
+            module_list, cassette_context = prepare(args, kwargs)
             try:
-                # pass current cassette to underneath decorator and do not overwrite if set there
-                if (
-                    "cassette" in inspect.getfullargspec(func).annotations
-                    and inspect.getfullargspec(func).annotations["cassette"] == Cassette
-                    and "cassette" not in kwargs
-                ):
-                    kwargs["cassette"] = cassette_int
                 # execute content
-                output = func(*args, **kwargs)
+                with cassette_context:
+                    output = func(*args, **kwargs)
             except Exception as e:
                 raise (e)
             finally:
-                # dump data to storage file
-                cassette_int.dump()
-                _revert_modules(module_list)
+                try:
+                    # dump data to storage file
+                    cassette_int.dump()
+                finally:
+                    # modules are reverted also when dump fails (e.g. in its hook)
+                    _revert_modules(module_list)
             return output
 
         setattr(_replaced_function, REQURE_CASSETTE_ATTRIBUTE_NAME, cassette_int)
@@ -466,6 +925,8 @@ def replace(
 def record(
     what: str,
     cassette: Optional[Cassette] = None,
+    session: bool = False,
+    context_isolated: bool = False,
 ):
     """
     Decorator which can be used to store calls of the function and
@@ -505,10 +966,19 @@ def record(
 
     :param what: str - full path of function inside module
     :param cassette: Cassette instance to pass inside object to work with
+    :param session: install the replacement once per session
+                    (see `replace` decorator for details)
+    :param context_isolated: store just calls done in the current context
+                             (see `replace` decorator for details)
     """
 
     def _record_inner(func):
-        return replace(what=what, cassette=cassette)(func)
+        return replace(
+            what=what,
+            cassette=cassette,
+            session=session,
+            context_isolated=context_isolated,
+        )(func)
 
     return _record_inner
 
@@ -535,19 +1005,45 @@ def recording(
                                   default simple one avoid to store stack information
     """
     cassette = Cassette()
-    cassette.storage_file = storage_file
-    cassette.data_miner.key_stategy_cls = storage_keys_strategy
-    # ensure that directory structure exists already
-    os.makedirs(os.path.dirname(cassette.storage_file), exist_ok=True)
     # use default decorator for context manager if not given.
     if decorate is None and replace is None:
         logger.info(f"Using default decorator for {what}")
         decorate = Guess.decorator_plain(cassette=cassette)
     elif decorate is not None and replace is not None:
         raise ValueError("right one from [decorate, replace] parameter has to be set.")
+    with _recording_targets(
+        targets=[ReplacementTarget(what=what, decorate=decorate, replace=replace)],
+        storage_file=storage_file,
+        storage_keys_strategy=storage_keys_strategy,
+        cassette=cassette,
+    ) as cassette:
+        yield cassette
+
+
+@contextmanager
+def _recording_targets(
+    targets: List[ReplacementTarget],
+    storage_file: Optional[str] = None,
+    storage_keys_strategy=StorageKeysInspectSimple,
+    cassette: Optional[Cassette] = None,
+):
+    """
+    Internal context manager of recording, what replaces all targets
+    in single pass over sys.modules and reverts them together.
+
+    :param targets: list of ReplacementTarget objects
+    :param storage_file: path for storage file if you don't want to use default location
+    :param storage_keys_strategy: key strategy for storing data
+    :param cassette: Cassette instance, created if not given
+    """
+    cassette = cassette or Cassette()
+    cassette.storage_file = storage_file
+    cassette.data_miner.key_stategy_cls = storage_keys_strategy
+    # ensure that directory structure exists already
+    os.makedirs(os.path.dirname(cassette.storage_file), exist_ok=True)
     # Store values and their replacements for modules to be able to _revert_modules changes back
-    module_list = _parse_and_replace_sys_modules(
-        what=what, cassette=cassette, decorate=decorate, replace=replace
+    module_list = _parse_and_replace_sys_modules_multiple(
+        targets=targets, cassette=cassette
     )
     try:
         yield cassette
@@ -637,14 +1133,48 @@ def apply_decorator_to_all_methods(*decorator: Callable, regexp_method_pattern=N
 def replace_module_match_with_multiple_decorators(
     *decorators: Tuple[str, Callable],
     cassette: Optional[Cassette] = None,
+    storage_keys_strategy=None,
+    session: bool = False,
 ):
+    """
+    Decorator what decorates several "what" targets at once, like nested replace
+    decorators. All targets are resolved in single pass over sys.modules
+    and reverted together after execution.
+
+    :param decorators: tuples of (what, decorate)
+    :param cassette: Cassette instance to pass inside object to work with
+    :param storage_keys_strategy: you can change key strategy for storing data
+    :param session: install the replacements once per session
+                    (see `replace` decorator for details)
+    """
     if not decorators:
         raise AttributeError("decorators parameter has to be defined")
-    decorator_list = []
-    for what, decorate in decorators:
-        decorator_list.append(replace(what=what, decorate=decorate, cassette=cassette))
+    storage_keys_strategy = storage_keys_strategy or StorageKeysInspectSimple
+    targets = [
+        ReplacementTarget(what=what, decorate=decorate) for what, decorate in decorators
+    ]
+
+    @contextmanager
+    def session_scopes(cassette_int: Cassette):
+        with ExitStack() as stack:
+            for target in targets:
+                stack.enter_context(
+                    session_scope(
+                        what=target.what,
+                        cassette=cassette_int,
+                        decorate=target.decorate,
+                    )
+                )
+            yield cassette_int
 
-    def decorator(func):
-        return apply_decorators_recursively_to_fn(decorator_list, func)
+    def patch(cassette_int: Cassette):
+        if session:
+            return [], session_scopes(cassette_int)
+        module_list = _parse_and_replace_sys_modules_multiple(
+            targets=targets, cassette=cassette_int
+        )
+        return module_list, nullcontext(cassette_int)
 
-    return decorator
+    return _cassette_replace_decorator(
+        cassette=cassette, storage_keys_strategy=storage_keys_strategy, patch=patch
+    )
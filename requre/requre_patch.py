@@ -248,6 +248,100 @@ def purge(replaces, files, dry_run, simplify):
                 outfile.write(yaml.safe_dump(object_representation))
 
 
+@requre_base.command()
+@click.argument("files", nargs=-1, type=click.File("r"))
+def pretty(files):
+    """
+    Print storage files with JSON bodies (stored as text) expanded, for review and diffs
+    """
+    for one_file in files:
+        object_representation = yaml.safe_load(one_file)
+        DictProcessing(object_representation).expand_json_bodies()
+        click.echo(yaml.safe_dump(object_representation), nl=False)
+
+
+@requre_base.command()
+@click.argument("files", nargs=-1, required=True, type=click.Path(dir_okay=False))
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8080, show_default=True, type=int)
+@click.option(
+    "--latency",
+    is_flag=True,
+    default=False,
+    help="Delay responses by latency stored in metadata",
+)
+@click.option(
+    "--record",
+    "target",
+    metavar="URL",
+    help="Forward requests to URL and store responses to FILE",
+)
+def serve(files, host, port, latency, target):
+    """
+    Serve responses stored in FILES over HTTP, for clients what can't be patched
+    (curl, git, ...). Responses are matched via method, path and query of the url.
+    """
+    # imported here, to not slow down patched python
+    from requre.serve import CassetteRecorder, CassetteReplay, CassetteServer
+
+    if target:
+        if len(files) != 1:
+            raise click.ClickException("Just one FILE has to be given to record.")
+        server = CassetteServer(
+            (host, port), recorder=CassetteRecorder(files[0], target)
+        )
+        click.echo(f"Recording {target} to {files[0]} at {server.url}")
+    else:
+        replay = CassetteReplay(list(files))
+        server = CassetteServer((host, port), replay=replay, use_latency=latency)
+        click.echo(f"Serving {len(replay)} responses at {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@requre_base.command()
+@click.argument("files", nargs=-1, required=True, type=click.Path(dir_okay=False))
+@click.option(
+    "--target", required=True, metavar="URL", help="Base url of tested service"
+)
+@click.option(
+    "--concurrency",
+    default=10,
+    show_default=True,
+    type=int,
+    help="Number of requests sent at the same time",
+)
+@click.option(
+    "--repeat",
+    default=1,
+    show_default=True,
+    type=int,
+    help="How many times requests of FILES are sent",
+)
+@click.option(
+    "--timeout", default=30.0, show_default=True, help="Timeout of one request"
+)
+def loadgen(files, target, concurrency, repeat, timeout):
+    """
+    Send requests stored in FILES to the target service and print throughput
+    and latency percentiles compared with latencies stored in FILES.
+    """
+    from requre.loadgen import benchmark
+
+    result = benchmark(
+        target,
+        list(files),
+        concurrency=concurrency,
+        repeat=repeat,
+        timeout=timeout,
+    )
+    click.echo(yaml.safe_dump(result, sort_keys=False), nl=False)
+
+
 @requre_base.command()
 @click.argument("base_dir", nargs=1, type=click.Path())
 @click.option(
@@ -0,0 +1,300 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Registry of serializers used by Guess class to store objects of given types
+in compact (non-pickle) form.
+"""
+
+import dataclasses
+import datetime
+import decimal
+import enum
+import importlib
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from requre.objects import ObjectStorage
+from requre.simple_object import Simple
+
+logger = logging.getLogger(__name__)
+
+
+def _type_path(value_type: type) -> str:
+    return f"{value_type.__module__}:{value_type.__qualname__}"
+
+
+def _type_from_path(path: str) -> type:
+    module_name, qualname = path.split(":", 1)
+    output: Any = importlib.import_module(module_name)
+    for item in qualname.split("."):
+        output = getattr(output, item)
+    return output
+
+
+def _is_importable(value_type: type) -> bool:
+    """
+    Types defined inside functions are not possible to import back when reading
+    """
+    return "<locals>" not in value_type.__qualname__
+
+
+class SerializerRegistry:
+    """
+    Maps python types to serializer classes (ObjectStorage subclasses).
+    Serializer is found via exact type and then via predicates
+    (for types without common base class, e.g. dataclasses or namedtuples).
+    Subclasses of registered types are not matched, serializer would create
+    instance of the base type (they are pickled by Guess).
+    Result of lookup is cached per type. Later registration takes precedence.
+    Serializers are stored in metadata by their import path.
+    """
+
+    def __init__(self):
+        self._types: Dict[type, Type[ObjectStorage]] = {}
+        self._predicates: List[Tuple[Callable[[type], bool], Type[ObjectStorage]]] = []
+        self._names: Dict[str, Type[ObjectStorage]] = {}
+        self._cache: Dict[type, Optional[Type[ObjectStorage]]] = {}
+
+    def register(
+        self,
+        serializer: Type[ObjectStorage],
+        *types: type,
+        predicate: Optional[Callable[[type], bool]] = None,
+    ) -> Type[ObjectStorage]:
+        """
+        Register serializer for types or for types matching predicate
+
+        :param serializer: ObjectStorage subclass with to_serializable/from_serializable
+        :param types: types what will be stored via serializer (exact types)
+        :param predicate: function what gets type and returns True if it is supported
+        :return: serializer, to be able to use it as class decorator
+        """
+        if not types and predicate is None:
+            raise ValueError("types or predicate has to be set to register serializer")
+        name = self.name(serializer)
+        if self._names.get(name, serializer) is not serializer:
+            raise ValueError(f"Other serializer is already registered as {name}")
+        for value_type in types:
+            self._types[value_type] = serializer
+        if predicate is not None:
+            self._predicates.insert(0, (predicate, serializer))
+        self._names[name] = serializer
+        self._cache.clear()
+        return serializer
+
+    def lookup(self, value_type: type) -> Optional[Type[ObjectStorage]]:
+        """
+        Find serializer for the type
+
+        :param value_type: type of stored object
+        :return: serializer class or None if type is not registered
+        """
+        try:
+            return self._cache[value_type]
+        except KeyError:
+            pass
+        serializer = self._types.get(value_type)
+        if serializer is None:
+            for predicate, predicate_serializer in self._predicates:
+                if predicate(value_type):
+                    serializer = predicate_serializer
+                    break
+        self._cache[value_type] = serializer
+        return serializer
+
+    @staticmethod
+    def name(serializer: Type[ObjectStorage]) -> str:
+        """
+        Name of serializer stored inside cassette metadata
+        """
+        return _type_path(serializer)
+
+    def get(self, name: str) -> Optional[Type[ObjectStorage]]:
+        """
+        Find serializer by name stored inside cassette metadata
+        """
+        return self._names.get(name)
+
+
+serializer_registry = SerializerRegistry()
+
+
+def register_serializer(*types: type, predicate: Optional[Callable] = None):
+    """
+    Class decorator to register serializer for types in default registry,
+    what is used by Guess class.
+
+    Example:
+
+    @register_serializer(MyClass)
+    class MyClassSerializer(Simple):
+        def to_serializable(self, obj):
+            return obj.to_dict()
+
+        def from_serializable(self, data):
+            return MyClass.from_dict(data)
+    """
+
+    def decorator(serializer):
+        return serializer_registry.register(serializer, *types, predicate=predicate)
+
+    return decorator
+
+
+class RegistrySerializer(Simple):
+    """
+    Base class for serializers of structured types. Nested values are stored
+    via Guess, so they may use registered serializers as well.
+    """
+
+    @staticmethod
+    def encode(value: Any) -> Any:
+        from requre.guess_object import Guess
+
+        return Guess.encode(value)
+
+    @staticmethod
+    def decode(data: Any) -> Any:
+        from requre.guess_object import Guess
+
+        return Guess.decode(data)
+
+
+@register_serializer(
+    predicate=lambda value_type: _is_importable(value_type)
+    and dataclasses.is_dataclass(value_type)
+)
+class DataclassObject(RegistrySerializer):
+    """
+    Store dataclass instances as dict of their fields,
+    attributes set outside of fields (e.g. in __post_init__) are stored as well
+    """
+
+    def to_serializable(self, obj: Any) -> Any:
+        field_names = [field.name for field in dataclasses.fields(obj)]
+        output = {
+            "type": _type_path(type(obj)),
+            "fields": {name: self.encode(getattr(obj, name)) for name in field_names},
+        }
+        attributes = {
+            key: self.encode(value)
+            for key, value in getattr(obj, "__dict__", {}).items()
+            if key not in field_names
+        }
+        if attributes:
+            output["attributes"] = attributes
+        return output
+
+    def from_serializable(self, data: Any) -> Any:
+        value_type = _type_from_path(data["type"])
+        # same as pickle, do not call __init__ (and __post_init__) again
+        obj: Any = object.__new__(value_type)
+        for key, value in {**data["fields"], **data.get("attributes", {})}.items():
+            object.__setattr__(obj, key, self.decode(value))
+        return obj
+
+
+@register_serializer(
+    predicate=lambda value_type: issubclass(value_type, tuple)
+    and hasattr(value_type, "_fields")
+    and _is_importable(value_type)
+)
+class NamedTupleObject(RegistrySerializer):
+    """
+    Store namedtuple instances as list of their items
+    """
+
+    def to_serializable(self, obj: Any) -> Any:
+        return {
+            "type": _type_path(type(obj)),
+            "items": [self.encode(item) for item in obj],
+        }
+
+    def from_serializable(self, data: Any) -> Any:
+        value_type = _type_from_path(data["type"])
+        return value_type(*[self.decode(item) for item in data["items"]])
+
+
+@register_serializer(
+    predicate=lambda value_type: issubclass(value_type, enum.Enum)
+    and _is_importable(value_type)
+)
+class EnumObject(RegistrySerializer):
+    """
+    Store enum members via their value
+    """
+
+    def to_serializable(self, obj: Any) -> Any:
+        return {"type": _type_path(type(obj)), "value": self.encode(obj.value)}
+
+    def from_serializable(self, data: Any) -> Any:
+        return _type_from_path(data["type"])(self.decode(data["value"]))
+
+
+@register_serializer(datetime.datetime, datetime.date, datetime.time)
+class DateTimeObject(Simple):
+    """
+    Store datetime, date and time objects as ISO format string (keeps timezone)
+    """
+
+    types = {
+        item.__name__: item
+        for item in (datetime.datetime, datetime.date, datetime.time)
+    }
+
+    def to_serializable(self, obj: Any) -> Any:
+        for name, value_type in self.types.items():
+            if isinstance(obj, value_type):
+                # datetime is subclass of date, it is first in types
+                return [name, obj.isoformat()]
+        raise TypeError(f"Unsupported type {type(obj)}")
+
+    def from_serializable(self, data: Any) -> Any:
+        name, value = data
+        return self.types[name].fromisoformat(value)
+
+
+@register_serializer(datetime.timedelta)
+class TimeDeltaObject(Simple):
+    def to_serializable(self, obj: Any) -> Any:
+        return [obj.days, obj.seconds, obj.microseconds]
+
+    def from_serializable(self, data: Any) -> Any:
+        return datetime.timedelta(*data)
+
+
+@register_serializer(decimal.Decimal)
+class DecimalObject(Simple):
+    def to_serializable(self, obj: Any) -> Any:
+        return str(obj)
+
+    def from_serializable(self, data: Any) -> Any:
+        return decimal.Decimal(data)
+
+
+@register_serializer(set, frozenset)
+class SetObject(RegistrySerializer):
+    def to_serializable(self, obj: Any) -> Any:
+        return {
+            "frozen": isinstance(obj, frozenset),
+            "items": [self.encode(item) for item in obj],
+        }
+
+    def from_serializable(self, data: Any) -> Any:
+        items = (self.decode(item) for item in data["items"])
+        return frozenset(items) if data["frozen"] else set(items)
+
+
+@register_serializer(bytes, bytearray)
+class BytesObject(Simple):
+    """
+    Store bytes directly as YAML binary value
+    """
+
+    def to_serializable(self, obj: Any) -> Any:
+        return [type(obj).__name__, bytes(obj)]
+
+    def from_serializable(self, data: Any) -> Any:
+        name, value = data
+        return bytearray(value) if name == bytearray.__name__ else value
@@ -0,0 +1,275 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Local HTTP server, what replays responses stored in storage files to clients
+which can't be patched (curl, git over HTTP, tools written in other languages).
+It records responses as forwarding proxy to the same storage file format as well.
+"""
+
+import itertools
+import logging
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from requre.cassette import Cassette, activate_cassette
+from requre.postprocessing import DictProcessing
+from requre.utils import StorageMode
+
+logger = logging.getLogger(__name__)
+
+# headers what are not valid for decoded body or are managed by the server
+SKIPPED_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+
+def request_key(method: str, url: str) -> Tuple[str, str]:
+    """
+    Responses are matched via method and path (with query) of the url,
+    host of the recorded url is replaced by the address of the server
+    """
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+    return method.upper(), path
+
+
+class ReplayedResponse:
+    """
+    Response prepared to be sent by the server (body is decoded)
+    """
+
+    def __init__(
+        self,
+        status: int,
+        reason: str,
+        headers: List[Tuple[str, str]],
+        body: bytes,
+        latency: float = 0,
+    ):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.latency = latency
+
+    @classmethod
+    def from_stored(
+        cls, output: Dict, metadata: Dict, cassette: Cassette
+    ) -> "ReplayedResponse":
+        """
+        Create response from data stored by RequestResponseHandling
+        or HTTPXRequestResponseHandling
+        """
+        with activate_cassette(cassette):
+            if "reason" in output:
+                from requre.helpers.requests_response import RequestResponseHandling
+
+                response = RequestResponseHandling(
+                    store_keys=[], cassette=None
+                ).from_serializable(output)
+                status, reason, body = (
+                    response.status_code,
+                    response.reason,
+                    response.content,
+                )
+            else:
+                from requre.helpers.httpx_response import HTTPXRequestResponseHandling
+
+                httpx_response = HTTPXRequestResponseHandling(
+                    store_keys=[], cassette=None
+                ).from_serializable(output)
+                status, reason, body = (
+                    httpx_response.status_code,
+                    httpx_response.reason_phrase,
+                    httpx_response.read(),
+                )
+            headers = [
+                (name, value)
+                for name, value in output["headers"].items()
+                if value is not None and name.lower() not in SKIPPED_HEADERS
+            ]
+            return cls(
+                status=status,
+                reason=reason,
+                headers=headers,
+                body=body,
+                latency=metadata.get(cassette.data_miner.LATENCY_KEY, 0),
+            )
+
+
+class CassetteReplay:
+    """
+    Responses of storage files indexed by request. Responses of the same request
+    are served in stored order and repeated when all of them were served,
+    so many clients can replay in parallel from once loaded storage files.
+    """
+
+    def __init__(self, storage_files: List[str]):
+        self._responses: Dict[Tuple[str, str], List[ReplayedResponse]] = {}
+        for storage_file in storage_files:
+            self.load(storage_file)
+        # next() of itertools.count is atomic, no lock is needed for threads
+        self._counters = {key: itertools.count() for key in self._responses}
+
+    def load(self, storage_file: str) -> None:
+        cassette = Cassette()
+        cassette.storage_file = storage_file
+        for method, url, metadata, output in DictProcessing(
+            cassette.storage_object
+        ).responses():
+            self._responses.setdefault(request_key(method, url), []).append(
+                ReplayedResponse.from_stored(output, metadata, cassette)
+            )
+        logger.info(f"Loaded {storage_file}")
+
+    def __len__(self) -> int:
+        return sum(len(item) for item in self._responses.values())
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        return iter(self._responses)
+
+    def response(self, method: str, path: str) -> Optional[ReplayedResponse]:
+        key = request_key(method, path)
+        responses = self._responses.get(key)
+        if not responses:
+            return None
+        return responses[next(self._counters[key]) % len(responses)]
+
+
+class CassetteRecorder:
+    """
+    Forward requests to the target and store responses via CassetteAdapter
+    """
+
+    def __init__(self, storage_file: str, target: str):
+        import requests
+
+        from requre.helpers.requests_response import CassetteAdapter
+
+        self.target = target.rstrip("/")
+        self.cassette = Cassette()
+        self.cassette.storage_file = storage_file
+        self.cassette.mode = StorageMode.write
+        self.session = requests.Session()
+        # do not add any headers, client sends them
+        self.session.headers.clear()
+        # storage file is one for all client threads, adapter stores responses
+        # one by one, requests are forwarded in parallel
+        self.session.mount(self.target, CassetteAdapter(cassette=self.cassette))
+
+    def response(
+        self, method: str, path: str, headers: Dict[str, str], body: bytes
+    ) -> ReplayedResponse:
+        response = self.session.request(
+            method,
+            f"{self.target}{path}",
+            headers=headers,
+            data=body or None,
+            allow_redirects=False,
+        )
+        return ReplayedResponse(
+            status=response.status_code,
+            reason=response.reason,
+            headers=[
+                (name, value)
+                for name, value in response.headers.items()
+                if name.lower() not in SKIPPED_HEADERS
+            ],
+            body=response.content,
+            latency=response.elapsed.total_seconds(),
+        )
+
+    def close(self) -> None:
+        # cassette is dumped by the adapter
+        self.session.close()
+
+
+class CassetteRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serve responses of server.replay, or of server.recorder when recording
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "CassetteServer"
+
+    def handle_request(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if self.server.recorder is not None:
+            headers = {
+                name: value
+                for name, value in self.headers.items()
+                if name.lower() not in SKIPPED_HEADERS | {"host"}
+            }
+            response = self.server.recorder.response(
+                self.command, self.path, headers, body
+            )
+        else:
+            found = self.server.replay.response(self.command, self.path)
+            if found is None:
+                self.send_error(
+                    404, f"No stored response for {self.command} {self.path}"
+                )
+                return
+            response = found
+            if self.server.use_latency:
+                time.sleep(response.latency)
+        self.log_request(response.status)
+        # stored headers contain Date and Server already
+        self.send_response_only(response.status, response.reason)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(response.body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = handle_request
+    do_PATCH = do_DELETE = do_OPTIONS = handle_request
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+class CassetteServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server what replays (or records) storage files
+
+    :param address: (host, port) tuple, port 0 selects free port
+    :param replay: loaded storage files to replay
+    :param recorder: recorder used instead of replay
+    :param use_latency: delay responses by stored latency
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        replay: Optional[CassetteReplay] = None,
+        recorder: Optional[CassetteRecorder] = None,
+        use_latency: bool = False,
+    ):
+        super().__init__(address, CassetteRequestHandler)
+        self.replay = replay or CassetteReplay([])
+        self.recorder = recorder
+        self.use_latency = use_latency
+
+    @property
+    def url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.recorder is not None:
+            self.recorder.close()
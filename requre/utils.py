@@ -5,8 +5,10 @@ import inspect
 import logging
 import shlex
 import subprocess
+import zlib
 from enum import Enum
 from pathlib import Path
+from typing import Any, Optional
 
 from _pytest.python import Function
 
@@ -154,3 +156,68 @@ def get_datafile_filename(obj, suffix=DEFAULT_SUFIX):
         if old_store_path.exists():
             return old_store_path
     return testdata_dirname / f"{test_name}.{suffix}"
+
+
+def is_json_content_type(content_type: Optional[str]) -> bool:
+    """
+    Check if Content-Type header value describes JSON document
+    (application/json or structured syntax suffix e.g. application/vnd.github+json)
+
+    :param content_type: value of Content-Type header
+    :return: bool
+    """
+    if not content_type:
+        return False
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type == "application/json" or media_type.endswith("+json")
+
+
+def get_content_compressor(content_encoding: Optional[str]) -> Any:
+    """
+    Return zlib compress object producing data for given Content-Encoding header value
+
+    :param content_encoding: value of Content-Encoding header
+    :return: compress object or None for identity encoding
+    :raises ValueError: for unsupported encodings
+    """
+    content_encoding = (content_encoding or "identity").strip().lower()
+    if content_encoding in ("gzip", "x-gzip"):
+        return zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    if content_encoding == "deflate":
+        return zlib.compressobj()
+    if content_encoding == "identity":
+        return None
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
+def get_content_decompressor(content_encoding: Optional[str]) -> Any:
+    """
+    Return zlib decompress object decoding data for given Content-Encoding header value
+
+    :param content_encoding: value of Content-Encoding header
+    :return: decompress object or None for identity encoding
+    :raises ValueError: for unsupported encodings
+    """
+    content_encoding = (content_encoding or "identity").strip().lower()
+    if content_encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    if content_encoding == "deflate":
+        return zlib.decompressobj()
+    if content_encoding == "identity":
+        return None
+    raise ValueError(f"Unsupported content encoding: {content_encoding}")
+
+
+def encode_content(data: bytes, content_encoding: Optional[str]) -> bytes:
+    """
+    Compress data again according to Content-Encoding header,
+    it does not have to be byte-identical with original data, but it is decodable.
+    """
+    try:
+        compressor = get_content_compressor(content_encoding)
+    except ValueError as error:
+        logger.warning(f"{error}, using decoded data.")
+        return data
+    if compressor is None:
+        return data
+    return compressor.compress(data) + compressor.flush()
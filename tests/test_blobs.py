@@ -0,0 +1,266 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import asyncio
+import datetime
+import gzip
+import hashlib
+import os
+from io import BufferedReader, BytesIO
+
+import httpx
+import urllib3
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from requre.blobs import BlobStore
+from requre.constants import BLOB_REFERENCE_KEY
+from requre.helpers.httpx_response import HTTPXRequestResponseHandling
+from requre.helpers.requests_response import RequestResponseHandling
+from tests.testbase import BaseClass
+
+BODY = b'{"login": "requre", "id": 1}'
+
+
+def requests_response():
+    response = Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response.reason = "OK"
+    response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+    response.elapsed = datetime.timedelta(seconds=1)
+    response.raw = BytesIO(BODY)
+    response._content = BODY
+    return response
+
+
+class Store(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        self.blob_dir = os.path.join(self.response_dir, ".blobs")
+        BlobStore.clear_cache()
+
+    def test_store_once(self):
+        store = BlobStore(self.blob_dir)
+        digest = store.put(BODY)
+        self.assertEqual(hashlib.sha256(BODY).hexdigest(), digest)
+        self.assertEqual(digest, store.put(BODY))
+        self.assertEqual([digest], os.listdir(self.blob_dir))
+        self.assertEqual(BODY, store.resolve(store.reference(BODY)))
+        self.assertEqual("abc", store.resolve("abc"))
+
+    def test_cache(self):
+        store = BlobStore(self.blob_dir)
+        digest = store.put(BODY)
+        # written data are not cached
+        self.assertEqual({}, BlobStore._cache)
+        self.assertEqual(BODY, store.get(digest))
+        os.remove(store.path(digest))
+        # content is cached in-process
+        self.assertEqual(BODY, BlobStore(self.blob_dir).get(digest))
+
+    def test_cache_limit(self):
+        store = BlobStore(self.blob_dir)
+        store.cache_limit = 2 * (len(BODY) + 1)
+        digests = [store.put(BODY + bytes([index])) for index in range(3)]
+        for digest in digests:
+            store.get(digest)
+        # least recently used content is dropped
+        self.assertEqual([store.path(item) for item in digests[1:]], list(store._cache))
+        self.assertEqual(2 * len(BODY) + 2, BlobStore._cache_size)
+        store.get(digests[1])
+        store.get(digests[0])
+        # ordered from least recently used
+        self.assertEqual(
+            [store.path(digests[1]), store.path(digests[0])], list(store._cache)
+        )
+
+    def test_for_storage_file(self):
+        self.assertEqual(
+            "/repo/tests/test_data/.blobs",
+            BlobStore.for_storage_file(
+                "/repo/tests/test_data/test_module/Test.test.yaml"
+            ).directory,
+        )
+        self.assertEqual(
+            self.blob_dir, BlobStore.for_storage_file(self.response_file).directory
+        )
+
+
+class RequestResponse(BaseClass):
+    def test_requests(self):
+        storage = RequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+        data = storage.to_serializable(requests_response())
+        self.assertEqual(
+            {BLOB_REFERENCE_KEY: hashlib.sha256(BODY).hexdigest()}, data["raw"]
+        )
+        self.assertEqual(data["raw"], data["_content"])
+        self.assertEqual(
+            [data["_content"][BLOB_REFERENCE_KEY]],
+            os.listdir(os.path.join(self.response_dir, ".blobs")),
+        )
+        BlobStore.clear_cache()
+        response = storage.from_serializable(data)
+        self.assertEqual(BODY, response.content)
+        self.assertEqual({"login": "requre", "id": 1}, response.json())
+        self.assertEqual(BODY, response.raw.read())
+
+    def test_httpx(self):
+        storage = HTTPXRequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+        response = httpx.Response(
+            200, content=BODY, request=httpx.Request("GET", "https://example.com")
+        )
+        response.elapsed = datetime.timedelta(seconds=1)
+        data = storage.to_serializable(response)
+        self.assertEqual(3, data["__store_indicator"])
+        BlobStore.clear_cache()
+        response = storage.from_serializable(data)
+        self.assertEqual(BODY, response.content)
+
+
+class Streaming(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        BlobStore.clear_cache()
+
+    def test_requests(self):
+        storage = RequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+        data = storage.to_serializable(requests_response())
+        BlobStore.clear_cache()
+        response = storage.from_serializable(data)
+        self.assertFalse(response._content)
+        chunks = list(response.iter_content(chunk_size=10))
+        self.assertEqual([BODY[:10], BODY[10:20], BODY[20:]], chunks)
+        # read from blob file, not loaded to memory
+        self.assertIsInstance(response.raw.decoded_stream, BufferedReader)
+        self.assertEqual({}, BlobStore._cache)
+        response.close()
+
+    def httpx_response(self):
+        response = httpx.Response(
+            200,
+            headers={"Content-Encoding": "gzip"},
+            stream=httpx.ByteStream(gzip.compress(BODY)),
+            request=httpx.Request("GET", "https://example.com"),
+        )
+        response.elapsed = datetime.timedelta(seconds=1)
+        return response
+
+    def test_httpx(self):
+        for store_blobs in [True, False]:
+            storage = HTTPXRequestResponseHandling(
+                store_keys=["GET", "https://example.com"],
+                cassette=self.cassette,
+                store_blobs=store_blobs,
+            )
+            recorded = self.httpx_response()
+            data = storage.to_serializable(recorded)
+            self.assertEqual(BODY, recorded.read())
+            self.assertTrue(data["__stream"])
+            BlobStore.clear_cache()
+            response = storage.from_serializable(data)
+            self.assertFalse(response.is_stream_consumed)
+            self.assertEqual(BODY, b"".join(response.iter_bytes()))
+            self.assertEqual("gzip", response.headers["Content-Encoding"])
+
+    def test_httpx_async(self):
+        storage = HTTPXRequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+        recorded = self.httpx_response()
+        data = storage.to_serializable(recorded)
+        recorded.read()
+        response = storage.from_serializable(data)
+        self.assertEqual(BODY, asyncio.run(response.aread()))
+
+
+class Tee(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        BlobStore.clear_cache()
+        self.storage = RequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+
+    def streamed_response(self):
+        response = requests_response()
+        response.headers["Content-Encoding"] = "gzip"
+        response.raw = urllib3.HTTPResponse(
+            BytesIO(gzip.compress(BODY)),
+            headers={"Content-Encoding": "gzip"},
+            preload_content=False,
+        )
+        response._content = False
+        return response
+
+    def test_requests(self):
+        response = self.streamed_response()
+        data = self.storage.to_serializable(response)
+        self.assertIsNone(data["_content"][BLOB_REFERENCE_KEY])
+        self.assertEqual(
+            [BODY[:10], BODY[10:20], BODY[20:]],
+            list(response.iter_content(chunk_size=10)),
+        )
+        self.assertEqual(
+            hashlib.sha256(BODY).hexdigest(), data["_content"][BLOB_REFERENCE_KEY]
+        )
+        self.assertEqual(
+            [data["_content"][BLOB_REFERENCE_KEY]],
+            os.listdir(os.path.join(self.response_dir, ".blobs")),
+        )
+        BlobStore.clear_cache()
+        replayed = self.storage.from_serializable(data)
+        self.assertEqual(BODY, replayed.content)
+        self.assertEqual(BODY, gzip.decompress(replayed.raw.read()))
+
+    def test_requests_raw(self):
+        response = self.streamed_response()
+        data = self.storage.to_serializable(response)
+        self.assertEqual(BODY, gzip.decompress(response.raw.read(decode_content=False)))
+        # decoded body is stored
+        self.assertEqual(BODY, self.storage.resolve_blob(data["_content"]))
+
+    def test_dump_hook(self):
+        response = self.streamed_response()
+        data = self.storage.to_serializable(response)
+        self.assertEqual(BODY[:5], response.raw.read(5, decode_content=True))
+        self.cassette.dump()
+        self.assertEqual(
+            hashlib.sha256(BODY).hexdigest(), data["_content"][BLOB_REFERENCE_KEY]
+        )
+        # client reads the rest after body was stored
+        self.assertEqual(BODY[5:], response.raw.read(decode_content=True))
+
+    def test_httpx(self):
+        storage = HTTPXRequestResponseHandling(
+            store_keys=["GET", "https://example.com"],
+            cassette=self.cassette,
+            store_blobs=True,
+        )
+        response = httpx.Response(
+            200,
+            headers={"Content-Encoding": "gzip"},
+            stream=httpx.ByteStream(gzip.compress(BODY)),
+            request=httpx.Request("GET", "https://example.com"),
+        )
+        response.elapsed = datetime.timedelta(seconds=1)
+        data = storage.to_serializable(response)
+        self.assertIsNone(data["_content"][BLOB_REFERENCE_KEY])
+        self.assertEqual(BODY, b"".join(response.iter_bytes()))
+        self.assertEqual(BODY, storage.blob_store.resolve(data["_content"]))
@@ -1,11 +1,20 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+import hashlib
 import os
+import shutil
 import tarfile
 import tempfile
+from concurrent import futures
 from io import BytesIO
 
+from requre.exceptions import PersistentStorageException
+from requre.helpers.archive import (
+    ExtractionCache,
+    codec_from_file_name,
+    get_codec,
+)
 from requre.helpers.files import StoreFiles
 from requre.storage import PersistentObjectStorage
 from requre.utils import StorageMode
@@ -270,3 +279,310 @@ class StoreOutputFile(Base):
             self.assertNotIn("ahoj", content)
             self.assertIn("cao", content)
         self.assertEqual(ofile2, oofile2)
+
+
+class Codecs(Base):
+    def check_codec(self, suffix):
+        self.create_temp_dir()
+        self.create_dir_content(
+            filename="ahoj", target_dir=self.temp_dir, content="ciao"
+        )
+        file_name = self.cassette.content["X"]["file"]["tar"]["StoreFiles"][
+            "storage_test.yaml"
+        ]["target_dir"][0]["output"]["filename"]
+        self.assertEqual(suffix, codec_from_file_name(file_name).suffix)
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+
+        self.create_temp_dir()
+        self.create_dir_content(
+            filename="nonsense", target_dir=self.temp_dir, content="bad"
+        )
+        self.assertEqual(["ahoj"], os.listdir(self.temp_dir))
+
+    def test_cassette_codec(self):
+        self.cassette.file_compression = "gz"
+        self.cassette.file_compression_level = 1
+        self.check_codec(".tar.gz")
+
+    def test_uncompressed(self):
+        self.cassette.file_compression = "none"
+        self.check_codec(".tar")
+
+    def test_zip(self):
+        self.cassette.file_compression = "zip"
+        self.check_codec(".zip")
+
+    def test_class_codec(self):
+        StoreFiles.tar_compression = "bz2"
+        try:
+            self.check_codec(".tar.bz2")
+        finally:
+            StoreFiles.tar_compression = "xz"
+
+    def test_codec_names(self):
+        self.assertEqual(".tar.zst", get_codec("zstd").suffix)
+        self.assertEqual("xz", codec_from_file_name("test.yaml.dir_1.tar.xz").name)
+        self.assertEqual("", codec_from_file_name("test.yaml.dir_1.tar").name)
+        self.assertRaises(PersistentStorageException, get_codec, "lz4")
+
+
+class Snapshots(Base):
+    def test_deduplication(self):
+        self.create_temp_dir()
+        for _ in range(1, 3):
+            self.create_dir_content(
+                filename="ahoj", target_dir=self.temp_dir, content="ciao"
+            )
+        self.create_dir_content(
+            filename="ahoj", target_dir=self.temp_dir, content="changed"
+        )
+        file_names = [
+            item["output"]["filename"]
+            for item in self.cassette.content["X"]["file"]["tar"]["StoreFiles"][
+                "storage_test.yaml"
+            ]["target_dir"]
+        ]
+        self.assertEqual(file_names[0], file_names[1])
+        self.assertNotEqual(file_names[0], file_names[2])
+        blob_dir = os.path.join(self.response_dir, ".blobs")
+        self.assertEqual(
+            sorted(os.path.basename(item) for item in set(file_names)),
+            sorted(os.listdir(blob_dir)),
+        )
+        with open(os.path.join(self.response_dir, file_names[0]), "rb") as archive:
+            with tarfile.open(mode="r:xz", fileobj=archive) as tar_archive:
+                payload = BytesIO()
+                with tarfile.open(mode="w", fileobj=payload) as tar_store:
+                    for member in tar_archive.getmembers():
+                        tar_store.addfile(member, tar_archive.extractfile(member))
+        self.assertTrue(
+            os.path.basename(file_names[0]).startswith(
+                hashlib.sha256(payload.getvalue()).hexdigest()
+            )
+        )
+
+    def test_store_file_content(self):
+        file_name = StoreFiles.store_file_content(
+            cassette=self.cassette, content=b"archive"
+        )
+        self.assertTrue(file_name.endswith(".tar.xz"))
+        self.assertEqual(
+            b"archive",
+            StoreFiles.read_file_content(cassette=self.cassette, file_name=file_name),
+        )
+        # suffix of codec set for cassette
+        self.cassette.file_compression = "gz"
+        self.assertTrue(
+            StoreFiles.store_file_content(
+                cassette=self.cassette, content=b"archive"
+            ).endswith(".tar.gz")
+        )
+        with self.assertWarns(DeprecationWarning):
+            StoreFiles.store_file_content(
+                cassette=self.cassette, content=b"archive", file_name="target_dir"
+            )
+
+
+class Extraction(Base):
+    def test_extracted_once(self):
+        ExtractionCache.clear()
+        self.create_temp_dir()
+        self.create_dir_content(
+            filename="ahoj", target_dir=self.temp_dir, content="ciao"
+        )
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+
+        for _ in range(1, 3):
+            self.cassette.storage_file = self.response_file
+            self.create_temp_dir()
+            self.create_dir_content(
+                filename="nonsense", target_dir=self.temp_dir, content="bad"
+            )
+            self.assertEqual(["ahoj"], os.listdir(self.temp_dir))
+            # normalized modification time of archive is not restored
+            self.assertGreater(os.path.getmtime(os.path.join(self.temp_dir, "ahoj")), 0)
+            # replayed content is a copy, cached one is not changed
+            with open(os.path.join(self.temp_dir, "ahoj"), "r+") as fd:
+                self.assertEqual("ciao", fd.read())
+                fd.write(" changed")
+        self.assertEqual(1, len(ExtractionCache._extracted))
+
+    @StoreFiles.where_arg_references(
+        {"target_dir": 1}, cassette=PersistentObjectStorage().cassette
+    )
+    def create_link(self, target_dir):
+        os.makedirs(os.path.join(target_dir, "subdir"), exist_ok=True)
+        with open(os.path.join(target_dir, "subdir", "file"), "w") as fd:
+            fd.write("linked")
+        if not os.path.lexists(os.path.join(target_dir, "link")):
+            os.symlink("subdir", os.path.join(target_dir, "link"))
+
+    def test_replay_to_same_path(self):
+        ExtractionCache.clear()
+        self.create_temp_dir()
+        for _ in range(1, 3):
+            self.create_link(target_dir=self.temp_dir)
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+
+        self.create_temp_dir()
+        # existing symlink is replaced by the second replay
+        for _ in range(1, 3):
+            self.create_link(target_dir=self.temp_dir)
+        self.assertEqual("subdir", os.readlink(os.path.join(self.temp_dir, "link")))
+        with open(os.path.join(self.temp_dir, "link", "file")) as fd:
+            self.assertEqual("linked", fd.read())
+
+
+class BackgroundCompression(Base):
+    def setUp(self) -> None:
+        super().setUp()
+        StoreFiles.compression_workers = 2
+
+    def tearDown(self) -> None:
+        StoreFiles.compression_workers = 0
+        StoreFiles.shutdown_executor()
+        super().tearDown()
+
+    def test_record_and_replay(self):
+        # storage file is dumped at the end, not after every snapshot
+        self.cassette.dump_after_store = False
+        for content in ["ciao", "hello", "ahoj"]:
+            self.create_temp_dir()
+            self.create_dir_content(
+                filename="file", target_dir=self.temp_dir, content=content
+            )
+            # content is captured before the test continues
+            with open(os.path.join(self.temp_dir, "file"), "w") as fd:
+                fd.write("changed")
+        self.assertTrue(StoreFiles._pending)
+        self.cassette.dump()
+        self.assertEqual({}, StoreFiles._pending)
+        # just archives, staged snapshots are removed
+        self.assertEqual(3, len(os.listdir(os.path.join(self.response_dir, ".blobs"))))
+        self.cassette.mode = StorageMode.read
+
+        for content in ["ciao", "hello", "ahoj"]:
+            self.create_temp_dir()
+            self.create_dir_content(
+                filename="nonsense", target_dir=self.temp_dir, content="bad"
+            )
+            with open(os.path.join(self.temp_dir, "file")) as fd:
+                self.assertEqual(content, fd.read())
+
+    def test_written_snapshots_released(self):
+        self.cassette.dump_after_store = False
+        self.create_temp_dir()
+        self.create_dir_content(filename="file", target_dir=self.temp_dir)
+        futures.wait(StoreFiles._pending.values())
+        self.create_dir_content(filename="other", target_dir=self.temp_dir)
+        # archive of first snapshot is written, not waited for anymore
+        self.assertEqual(1, len(StoreFiles._pending))
+        self.cassette.dump()
+        self.assertEqual({}, StoreFiles._pending)
+
+
+class DeltaSnapshots(Base):
+    def setUp(self) -> None:
+        super().setUp()
+        StoreFiles.delta_snapshots = True
+        ExtractionCache.clear()
+
+    def tearDown(self) -> None:
+        StoreFiles.delta_snapshots = False
+        super().tearDown()
+
+    def steps(self):
+        self.create_dir_content(filename="a", target_dir=self.temp_dir, content="1")
+        self.create_dir_content(filename="b", target_dir=self.temp_dir, content="2")
+        self.create_dir_content(filename="a", target_dir=self.temp_dir, content="3")
+
+    def test_record_and_replay(self):
+        self.create_temp_dir()
+        os.makedirs(os.path.join(self.temp_dir, "subdir"))
+        with open(os.path.join(self.temp_dir, "subdir", "big"), "w") as fd:
+            fd.write("unchanged" * 1000)
+        self.steps()
+        manifests = [
+            item["output"]["manifest"]
+            for item in self.cassette.content["X"]["file"]["tar"]["StoreFiles"][
+                "storage_test.yaml"
+            ]["target_dir"]
+        ]
+        self.assertEqual(
+            ["a", "subdir", "subdir/big"], [item["path"] for item in manifests[0]]
+        )
+        self.assertEqual(
+            ["a", "b", "subdir", "subdir/big"],
+            [item["path"] for item in manifests[2]],
+        )
+        # archives contain just changed files
+        members = []
+        for path, manifest in zip(["a", "b", "a"], manifests):
+            archive = [item["archive"] for item in manifest if item["path"] == path]
+            with tarfile.open(os.path.join(self.response_dir, archive[0])) as tar:
+                # without top directory
+                members.append(len(tar.getmembers()) - 1)
+        self.assertEqual([2, 1, 1], members)
+        # unchanged file is stored just by the first snapshot
+        self.assertEqual(manifests[0][2]["archive"], manifests[2][3]["archive"])
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+
+        self.create_temp_dir()
+        self.steps()
+        self.assertEqual(["a", "b", "subdir"], sorted(os.listdir(self.temp_dir)))
+        with open(os.path.join(self.temp_dir, "a")) as fd:
+            self.assertEqual("3", fd.read())
+        with open(os.path.join(self.temp_dir, "subdir", "big")) as fd:
+            self.assertEqual("unchanged" * 1000, fd.read())
+        self.assertGreater(os.path.getmtime(os.path.join(self.temp_dir, "a")), 0)
+
+    def test_record_again(self):
+        self.create_temp_dir()
+        for _ in range(2):
+            # record same storage file and directory again from scratch,
+            # e.g. rerun of test
+            self.cassette.storage_file = None
+            shutil.rmtree(self.response_dir)
+            os.makedirs(self.response_dir)
+            self.cassette.storage_file = self.response_file
+            for name in os.listdir(self.temp_dir):
+                os.remove(os.path.join(self.temp_dir, name))
+            with open(os.path.join(self.temp_dir, "big"), "w") as fd:
+                fd.write("unchanged" * 1000)
+            self.steps()
+        manifest = self.cassette.content["X"]["file"]["tar"]["StoreFiles"][
+            "storage_test.yaml"
+        ]["target_dir"][0]["output"]["manifest"]
+        # first snapshot is complete, not delta to snapshot of previous recording
+        self.assertEqual(manifest[0]["archive"], manifest[1]["archive"])
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        self.create_temp_dir()
+        self.steps()
+        with open(os.path.join(self.temp_dir, "big")) as fd:
+            self.assertEqual("unchanged" * 1000, fd.read())
+
+    def test_zip_members(self):
+        StoreFiles.tar_compression = "zip"
+        try:
+            self.create_temp_dir()
+            self.steps()
+            self.cassette.dump()
+            self.cassette.mode = StorageMode.read
+            self.create_temp_dir()
+            self.steps()
+        finally:
+            StoreFiles.tar_compression = "xz"
+        with open(os.path.join(self.temp_dir, "a")) as fd:
+            self.assertEqual("3", fd.read())
+        # files are extracted one by one, every content just once
+        members = [key[1] for key in ExtractionCache._extracted]
+        self.assertEqual(3, len(members))
+        self.assertEqual(
+            sorted(hashlib.sha256(item).hexdigest() for item in [b"1", b"2", b"3"]),
+            sorted(members),
+        )
@@ -0,0 +1,84 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import os
+import shutil
+import subprocess
+import tempfile
+
+import git
+
+from requre.helpers import record_git_module
+from requre.helpers.git.bundle import GitBundle
+from requre.utils import StorageMode
+from tests.testbase import BaseClass
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "requre",
+    "GIT_AUTHOR_EMAIL": "requre@example.com",
+    "GIT_COMMITTER_NAME": "requre",
+    "GIT_COMMITTER_EMAIL": "requre@example.com",
+}
+
+
+class Bundles(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        GitBundle._stored_tips.clear()
+        self.origin = tempfile.mkdtemp(prefix="origin")
+        self.addCleanup(shutil.rmtree, self.origin, True)
+        self.git("init", "-q", "-b", "main")
+        self.commit("README", "first")
+
+    def git(self, *args):
+        subprocess.run(
+            ["git", *args],
+            cwd=self.origin,
+            check=True,
+            env={**os.environ, **GIT_ENV},
+        )
+
+    def commit(self, filename, content):
+        with open(os.path.join(self.origin, filename), "w") as fd:
+            fd.write(content)
+        self.git("add", filename)
+        self.git("commit", "-q", "-m", content)
+
+    def clone_and_update(self, to_path):
+        repo = git.Repo.clone_from(self.origin, to_path=to_path)
+        if self.recording:
+            self.commit("fetched", "second")
+        repo.remotes.origin.fetch()
+        fetched = repo.commit("origin/main").message
+        if self.recording:
+            self.commit("pulled", "third")
+        repo.remotes.origin.pull()
+        return fetched, sorted(os.listdir(to_path))
+
+    def test_clone_fetch_pull(self):
+        self.recording = True
+        self.create_temp_dir()
+        recorded = record_git_module(git_bundles=True, cassette=self.cassette)(
+            self.clone_and_update
+        )(self.temp_dir)
+        self.assertEqual(
+            ("second\n", [".git", "README", "fetched", "pulled"]), recorded
+        )
+        bundles = os.listdir(os.path.join(self.response_dir, ".blobs"))
+        # clone, fetch and pull store just new objects
+        self.assertEqual(3, len(bundles))
+        self.assertTrue(all(item.endswith(".bundle") for item in bundles))
+
+        self.recording = False
+        shutil.rmtree(self.origin)
+        shutil.rmtree(self.temp_dir)
+        os.makedirs(self.temp_dir)
+        self.cassette.mode = StorageMode.read
+        replayed = record_git_module(git_bundles=True, cassette=self.cassette)(
+            self.clone_and_update
+        )(self.temp_dir)
+        self.assertEqual(recorded, replayed)
+        repo = git.Repo(self.temp_dir)
+        self.assertEqual("third\n", repo.head.commit.message)
+        self.assertEqual(self.origin, repo.remotes.origin.url)
+        self.assertFalse(repo.is_dirty())
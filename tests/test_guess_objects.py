@@ -3,6 +3,7 @@
 
 import unittest
 import math
+import pickle
 import os
 from requre.objects import ObjectStorage
 from requre.utils import StorageMode
@@ -29,6 +30,27 @@ class Unit(BaseClass):
         self.assertNotEqual(Void, Guess.guess_type(OwnClass(1)))
         self.assertNotEqual(Simple, Guess.guess_type(OwnClass(1)))
 
+    def testNested(self):
+        self.assertEqual(
+            Simple, Guess.guess_type({"a": [1, 2.5, None, {"b": {b"c", True}}]})
+        )
+        self.assertEqual(ObjectStorage, Guess.guess_type({"a": [1, OwnClass(1)]}))
+        self.assertEqual(ObjectStorage, Guess.guess_type({OwnClass(1): "a"}))
+        self.assertEqual(Void, Guess.guess_type([sys.__stdout__]))
+
+    def testTypeVerdictCache(self):
+        class OwnStr(str):
+            pass
+
+        self.assertNotEqual(Simple, Guess.guess_type(OwnStr("abc")))
+        self.assertFalse(Guess._yaml_type_verdicts[OwnStr])
+
+    def testSerializedDataReused(self):
+        cls, data = Guess.guess_type_and_data(OwnClass(1))
+        self.assertEqual(ObjectStorage, cls)
+        self.assertEqual(1, pickle.loads(data).num)
+        self.assertEqual((Simple, None), Guess.guess_type_and_data([1, "a"]))
+
 
 def obj_return(num, obj):
     _ = num
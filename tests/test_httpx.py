@@ -1,14 +1,29 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+import asyncio
 import importlib
+import os
 import unittest
 
-from requre.exceptions import ItemNotInStorage
-from requre.helpers.httpx_response import HTTPXRequestResponseHandling
+import httpx
+
+from requre.blobs import BlobStore
+from requre.cassette import Cassette
+from requre.exceptions import ItemNotInStorage, PersistentStorageException
+from requre.helpers.httpx_response import (
+    AsyncCassetteTransport,
+    CassetteTransport,
+    HTTPXRequestResponseHandling,
+    record_httpx,
+    recording_httpx,
+)
+from requre.record_and_replace import uninstall_session_replacements
 from requre.utils import StorageMode
 from tests.testbase import BaseClass, network_connection_available
 
+original_send = httpx.Client.send
+
 
 class StoreAnyRequest(BaseClass):
     domain = "https://example.com/"
@@ -194,3 +209,220 @@ class StoreAnyRequest(BaseClass):
 
         self.assertIn("headers", saved_item["output"])
         self.assertNotIn("NotKnownHeader", saved_item["output"]["headers"])
+
+
+class MockServer(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        self.calls = 0
+
+    def handler(self, request):
+        self.calls += 1
+        return httpx.Response(200, json={"url": str(request.url)})
+
+    def transport(self):
+        return httpx.MockTransport(self.handler)
+
+    def replay_cassette(self):
+        cassette = Cassette()
+        cassette.storage_file = self.response_file
+        self.assertEqual(StorageMode.read, cassette.mode)
+        return cassette
+
+
+class AsyncClient(MockServer):
+    def test_concurrent_requests(self):
+        urls = [f"https://example.com/{index}" for index in range(1, 51)]
+
+        async def fetch_all():
+            async with httpx.AsyncClient(transport=self.transport()) as client:
+                responses = await asyncio.gather(*[client.get(url) for url in urls])
+            return [response.json()["url"] for response in responses]
+
+        self.assertEqual(
+            urls, asyncio.run(record_httpx(cassette=self.cassette)(fetch_all)())
+        )
+        self.assertEqual(50, self.calls)
+        replayed = record_httpx(cassette=self.replay_cassette())(fetch_all)
+        self.assertEqual(urls, asyncio.run(replayed()))
+        self.assertEqual(50, self.calls)
+
+    def test_stream(self):
+        async def fetch():
+            async with httpx.AsyncClient(transport=self.transport()) as client:
+                request = client.build_request("GET", "https://example.com/stream")
+                response = await client.send(request, stream=True)
+                try:
+                    return b"".join([chunk async for chunk in response.aiter_bytes()])
+                finally:
+                    await response.aclose()
+
+        body = asyncio.run(record_httpx(cassette=self.cassette)(fetch)())
+        self.assertEqual(b'{"url":"https://example.com/stream"}', body)
+        replayed = record_httpx(cassette=self.replay_cassette())(fetch)
+        self.assertEqual(body, asyncio.run(replayed()))
+        self.assertEqual(1, self.calls)
+
+    def test_sync_client(self):
+        def fetch():
+            with httpx.Client(transport=self.transport()) as client:
+                return client.get("https://example.com/sync").json()
+
+        before = record_httpx(cassette=self.cassette)(fetch)()
+        after = record_httpx(cassette=self.replay_cassette())(fetch)()
+        self.assertEqual(before, after)
+        self.assertEqual(1, self.calls)
+
+    def test_blob_body(self):
+        async def fetch():
+            async with httpx.AsyncClient(transport=self.transport()) as client:
+                response = await client.get("https://example.com/blob")
+            return response.json()
+
+        recorded = asyncio.run(
+            record_httpx(cassette=self.cassette, store_blobs=True)(fetch)()
+        )
+        BlobStore.clear_cache()
+        replayed = record_httpx(cassette=self.replay_cassette(), store_blobs=True)(
+            fetch
+        )
+        self.assertEqual(recorded, asyncio.run(replayed()))
+        # body is read from blob file via async stream, not via in-process cache
+        self.assertEqual({}, BlobStore._cache)
+        self.assertEqual(1, self.calls)
+
+    def stream_transport(self):
+        async def chunks():
+            for chunk in [b"first ", b"second ", b"third"]:
+                yield chunk
+
+        def handler(request):
+            self.calls += 1
+            return httpx.Response(200, content=chunks())
+
+        return httpx.MockTransport(handler)
+
+    def test_stream_blob_body(self):
+        # cassette is dumped at the end, after body is read
+        self.cassette.dump_after_store = False
+
+        async def fetch(read_whole=True):
+            transport = self.stream_transport()
+            async with httpx.AsyncClient(transport=transport) as client:
+                request = client.build_request("GET", "https://example.com/stream")
+                response = await client.send(request, stream=True)
+                # body is stored while client reads it, not read by recording
+                self.assertFalse(response.is_stream_consumed)
+                try:
+                    chunks = []
+                    async for chunk in response.aiter_raw():
+                        chunks.append(chunk)
+                        if not read_whole:
+                            break
+                    return b"".join(chunks)
+                finally:
+                    await response.aclose()
+
+        self.assertEqual(
+            b"first second third",
+            asyncio.run(
+                record_httpx(cassette=self.cassette, store_blobs=True)(fetch)()
+            ),
+        )
+        replayed = record_httpx(cassette=self.replay_cassette(), store_blobs=True)
+        self.assertEqual(b"first second third", asyncio.run(replayed(fetch)()))
+
+        # response closed before it is read whole, rest of body is stored as well
+        self.cassette.storage_file = None
+        os.remove(self.response_file)
+        self.cassette.storage_file = self.response_file
+        self.assertEqual(
+            b"first ",
+            asyncio.run(
+                record_httpx(cassette=self.cassette, store_blobs=True)(fetch)(
+                    read_whole=False
+                )
+            ),
+        )
+        replayed = record_httpx(cassette=self.replay_cassette(), store_blobs=True)
+        self.assertEqual(b"first second third", asyncio.run(replayed(fetch)()))
+        self.assertEqual(2, self.calls)
+
+    def test_stream_not_read(self):
+        self.cassette.dump_after_store = False
+
+        async def fetch():
+            async with httpx.AsyncClient(transport=self.stream_transport()) as client:
+                request = client.build_request("GET", "https://example.com/stream")
+                return await client.send(request, stream=True)
+
+        with self.assertRaises(PersistentStorageException):
+            asyncio.run(record_httpx(cassette=self.cassette, store_blobs=True)(fetch)())
+
+
+class BothClients(MockServer):
+    async def fetch(self):
+        with httpx.Client(transport=self.transport()) as client:
+            sync_url = client.get("https://example.com/sync").json()["url"]
+        async with httpx.AsyncClient(transport=self.transport()) as client:
+            response = await client.get("https://example.com/async")
+        return [sync_url, response.json()["url"]]
+
+    def test_session(self):
+        self.addCleanup(uninstall_session_replacements)
+        recorded = asyncio.run(
+            record_httpx(cassette=self.cassette, session=True)(self.fetch)()
+        )
+        replayed = record_httpx(cassette=self.replay_cassette(), session=True)(
+            self.fetch
+        )
+        self.assertEqual(recorded, asyncio.run(replayed()))
+        self.assertEqual(2, self.calls)
+
+    def test_recording(self):
+        with recording_httpx(storage_file=self.response_file):
+            recorded = asyncio.run(self.fetch())
+        with recording_httpx(storage_file=self.response_file) as cassette:
+            self.assertEqual(StorageMode.read, cassette.mode)
+            self.assertEqual(recorded, asyncio.run(self.fetch()))
+        self.assertEqual(2, self.calls)
+        self.assertIs(original_send, httpx.Client.send)
+
+
+class Transport(MockServer):
+    def test_sync(self):
+        def fetch(cassette):
+            transport = CassetteTransport(
+                transport=self.transport(), cassette=cassette, store_blobs=True
+            )
+            with httpx.Client(transport=transport) as client:
+                return [
+                    client.get(f"https://example.com/{index}").json()
+                    for index in range(1, 4)
+                ]
+
+        class_cassette = HTTPXRequestResponseHandling._cassette
+        recorded = fetch(self.cassette)
+        self.assertEqual(3, self.calls)
+        self.assertTrue(os.path.exists(self.response_file))
+        BlobStore.clear_cache()
+        self.assertEqual(recorded, fetch(self.replay_cassette()))
+        self.assertEqual(3, self.calls)
+        # nothing is patched and class cassette is untouched
+        self.assertIs(httpx.Client.send, original_send)
+        self.assertIs(class_cassette, HTTPXRequestResponseHandling._cassette)
+
+    def test_async(self):
+        urls = [f"https://example.com/{index}" for index in range(1, 11)]
+
+        async def fetch_all(cassette):
+            transport = AsyncCassetteTransport(
+                transport=self.transport(), cassette=cassette
+            )
+            async with httpx.AsyncClient(transport=transport) as client:
+                responses = await asyncio.gather(*[client.get(url) for url in urls])
+            return [response.json()["url"] for response in responses]
+
+        self.assertEqual(urls, asyncio.run(fetch_all(self.cassette)))
+        self.assertEqual(urls, asyncio.run(fetch_all(self.replay_cassette())))
+        self.assertEqual(10, self.calls)
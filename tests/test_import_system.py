@@ -2,7 +2,15 @@
 # SPDX-License-Identifier: MIT
 
 import builtins
-from requre.import_system import UpgradeImportSystem, replace, decorate
+import importlib
+import os
+import sys
+from requre.import_system import (
+    ImportHookLoader,
+    UpgradeImportSystem,
+    replace,
+    decorate,
+)
 from tests.testbase import BaseClass
 from tempfile import mktemp as original_mktemp
 
@@ -103,3 +111,58 @@ class TestUpgradeImportSystem(BaseClass):
             self.assertIn("decorated_c", tempfile.mktemp())
             self.assertIn("/tmp", tempfile.mktemp())
             tempfile.mktemp = original_mktemp
+
+
+class TestImportHook(BaseClass):
+    module_name = "requre_import_hook_module"
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.create_temp_dir()
+        with open(os.path.join(self.temp_dir, f"{self.module_name}.py"), "w") as fd:
+            fd.write("def hello():\n    return 'hello'\n")
+        sys.path.insert(0, self.temp_dir)
+        self.meta_path = list(sys.meta_path)
+
+    def tearDown(self) -> None:
+        sys.path.remove(self.temp_dir)
+        sys.modules.pop(self.module_name, None)
+        sys.meta_path[:] = self.meta_path
+        super().tearDown()
+
+    def test_decorate_when_imported(self):
+        upgraded = UpgradeImportSystem().decorate(
+            what=f"{self.module_name}.hello",
+            decorator=lambda x: lambda: f"decorated {x()}",
+        )
+        self.assertIn(upgraded.import_hook, sys.meta_path)
+        module = importlib.import_module(self.module_name)
+        self.assertEqual("decorated hello", module.hello())
+        # applied exactly once, hook is not needed anymore
+        self.assertNotIn(upgraded.import_hook, sys.meta_path)
+        self.assertEqual(1, len(upgraded.module_list))
+        self.assertNotIsInstance(module.__loader__, ImportHookLoader)
+        upgraded.revert()
+        self.assertEqual("hello", module.hello())
+
+    def test_revert_uninstalls_hook(self):
+        upgraded = UpgradeImportSystem().replace(
+            what=f"{self.module_name}.hello", replacement=lambda: "replaced"
+        )
+        self.assertIn(upgraded.import_hook, sys.meta_path)
+        upgraded.revert()
+        self.assertNotIn(upgraded.import_hook, sys.meta_path)
+        module = importlib.import_module(self.module_name)
+        self.assertEqual("hello", module.hello())
+
+    def test_other_imports_untouched(self):
+        with UpgradeImportSystem().replace(
+            what=f"{self.module_name}.hello", replacement=lambda: "replaced"
+        ) as upgraded:
+            import json.tool
+
+            self.assertNotIsInstance(json.tool.__loader__, ImportHookLoader)
+            from requre_import_hook_module import hello
+
+            self.assertEqual("replaced", hello())
+        self.assertNotIn(upgraded.import_hook, sys.meta_path)
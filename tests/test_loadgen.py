@@ -0,0 +1,69 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import threading
+
+import httpx
+
+from requre.helpers.httpx_response import CassetteTransport
+from requre.loadgen import LoadRequest, benchmark, percentile
+from requre.serve import CassetteReplay, CassetteServer
+from tests.testbase import BaseClass
+
+
+class LoadGen(BaseClass):
+    def record(self):
+        def handler(request):
+            status = 404 if request.url.path == "/missing" else 200
+            return httpx.Response(status, json={"path": request.url.path})
+
+        transport = CassetteTransport(
+            transport=httpx.MockTransport(handler), cassette=self.cassette
+        )
+        with httpx.Client(transport=transport) as client:
+            for path in ["/1", "/2?page=1", "/missing"]:
+                client.get(f"https://example.com{path}")
+            client.post("https://example.com/create", json={"name": "requre"})
+
+    def test_percentile(self):
+        values = [float(item) for item in range(1, 101)]
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(1, percentile([1.0], 90))
+        self.assertEqual(0, percentile([], 90))
+
+    def test_requests(self):
+        self.record()
+        requests = LoadRequest.from_storage_files([self.response_file])
+        self.assertEqual(
+            [
+                ("GET", "/1", 200),
+                ("GET", "/2?page=1", 200),
+                ("GET", "/missing", 404),
+                ("POST", "/create", 200),
+            ],
+            [(item.method, item.path, item.status) for item in requests],
+        )
+
+    def test_benchmark(self):
+        self.record()
+        server = CassetteServer(
+            ("127.0.0.1", 0), replay=CassetteReplay([self.response_file])
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            result = benchmark(
+                server.url, [self.response_file], concurrency=4, repeat=5
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertEqual(15, result["requests"])
+        # POST request is not sent, its body is not stored
+        self.assertEqual(1, result["skipped"])
+        self.assertEqual(0, result["failed"])
+        self.assertEqual(0, result["status_mismatch"])
+        self.assertGreater(result["throughput"], 0)
+        self.assertEqual({"p50", "p90", "p99", "max"}, set(result["latency"]))
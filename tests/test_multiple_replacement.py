@@ -0,0 +1,98 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import tests.data.special_requre_module
+from requre.cassette import Cassette
+from requre.record_and_replace import (
+    ReplacementTarget,
+    TargetTrie,
+    _parse_and_replace_sys_modules_multiple,
+    _revert_modules,
+    replace_module_match_with_multiple_decorators,
+)
+from requre.simple_object import Simple
+from requre.utils import StorageMode
+from tests.testbase import BaseClass
+
+ORIGINAL_RANDOM_NUMBER = tests.data.special_requre_module.random_number
+ORIGINAL_ANOTHER_RANDOM_NUMBER = tests.data.special_requre_module.another_random_number
+
+
+class MultipleReplacement(BaseClass):
+    targets = [
+        "tests.data.special_requre_module.random_number",
+        "tests.data.special_requre_module.another_random_number",
+    ]
+
+    def test_trie_walk(self):
+        targets = [ReplacementTarget(what=what) for what in self.targets]
+        trie = TargetTrie(targets)
+        # common prefix is stored just once
+        self.assertEqual(
+            ["random_number", "another_random_number"],
+            list(
+                trie.root.children["tests"]
+                .children["data"]
+                .children["special_requre_module"]
+                .children
+            ),
+        )
+        matches = trie.walk(tests.data)
+        self.assertEqual(
+            [(targets[0], 2), (targets[1], 2)],
+            [(target, depth) for target, depth, _, _ in matches],
+        )
+        self.assertIs(ORIGINAL_RANDOM_NUMBER, matches[0][3])
+        self.assertIs(tests.data.special_requre_module, matches[0][2])
+
+    def test_single_pass(self):
+        module_list = _parse_and_replace_sys_modules_multiple(
+            targets=[
+                ReplacementTarget(what=what, decorate=Simple.decorator_plain())
+                for what in self.targets
+            ],
+            cassette=self.cassette,
+        )
+        self.assertEqual(set(self.targets), {item.what for item in module_list})
+        self.assertIsNot(
+            ORIGINAL_RANDOM_NUMBER, tests.data.special_requre_module.random_number
+        )
+        self.assertIsNot(
+            ORIGINAL_ANOTHER_RANDOM_NUMBER,
+            tests.data.special_requre_module.another_random_number,
+        )
+        _revert_modules(module_list)
+        self.assertIs(
+            ORIGINAL_RANDOM_NUMBER, tests.data.special_requre_module.random_number
+        )
+        self.assertIs(
+            ORIGINAL_ANOTHER_RANDOM_NUMBER,
+            tests.data.special_requre_module.another_random_number,
+        )
+
+    def test_decorator(self):
+        def call(cassette):
+            @replace_module_match_with_multiple_decorators(
+                *[(what, Simple.decorator_plain()) for what in self.targets],
+                cassette=cassette,
+            )
+            def random_numbers():
+                return (
+                    tests.data.special_requre_module.random_number(),
+                    tests.data.special_requre_module.another_random_number(),
+                )
+
+            return random_numbers()
+
+        before = call(self.cassette)
+        self.assertEqual(
+            {"random_number", "another_random_number"},
+            set(self.cassette.storage_object["tests.data.special_requre_module"]),
+        )
+        self.assertIs(
+            ORIGINAL_RANDOM_NUMBER, tests.data.special_requre_module.random_number
+        )
+        cassette = Cassette()
+        cassette.storage_file = self.response_file
+        self.assertEqual(StorageMode.read, cassette.mode)
+        self.assertEqual(before, call(cassette))
@@ -1,7 +1,13 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
-from requre.objects import ObjectStorage
+import asyncio
+import os
+import pickle
+from unittest import mock
+
+from requre.guess_object import Guess
+from requre.objects import OUT_OF_BAND_KEY, ObjectStorage
 from requre.utils import StorageMode
 
 from tests.testbase import BaseClass
@@ -72,6 +78,167 @@ class StoreAnyRequest(BaseClass):
         self.assertRaises(Exception, decorated_own, 1)
 
 
+async def async_sum(num, inputval):
+    await asyncio.sleep(0)
+    return num + inputval
+
+
+async def async_range(num):
+    for item in range(1, num + 1):
+        await asyncio.sleep(0)
+        yield item
+
+
+class StoreAsync(BaseClass):
+    def testCoroutine(self):
+        decorated = ObjectStorage.decorator_all_keys(cassette=self.cassette)(async_sum)
+        self.assertTrue(asyncio.iscoroutinefunction(decorated))
+        self.assertEqual(3, asyncio.run(decorated(1, 2)))
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        self.assertEqual(3, asyncio.run(decorated(1, 2)))
+        self.assertRaises(Exception, asyncio.run, decorated(1, 2))
+
+    def testExecute(self):
+        self.assertEqual(
+            3,
+            asyncio.run(
+                ObjectStorage.execute(["key"], async_sum, 1, 2, cassette=self.cassette)
+            ),
+        )
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        self.assertEqual(
+            3,
+            asyncio.run(
+                ObjectStorage.execute(["key"], async_sum, 1, 1, cassette=self.cassette)
+            ),
+        )
+
+    def testAsyncGenerator(self):
+        decorated = ObjectStorage.decorator_plain(cassette=self.cassette)(async_range)
+
+        async def collect(num):
+            return [item async for item in decorated(num)]
+
+        self.assertEqual([1, 2, 3], asyncio.run(collect(3)))
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        # items are replayed from storage, not generated again
+        self.assertEqual([1, 2, 3], asyncio.run(collect(1)))
+
+    def testLatency(self):
+        async def slow(num):
+            await asyncio.sleep(0.2)
+            return num
+
+        decorated = ObjectStorage.decorator_plain(cassette=self.cassette)(slow)
+
+        async def call_concurrently():
+            return await asyncio.gather(decorated(1), decorated(2))
+
+        self.assertEqual([1, 2], asyncio.run(call_concurrently()))
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        self.cassette.data_miner.use_latency = True
+        events = []
+        original_sleep = asyncio.sleep
+
+        async def sleep(delay):
+            events.append(delay)
+            await original_sleep(0)
+            events.append("woken")
+
+        with mock.patch("requre.objects.asyncio.sleep", sleep):
+            self.assertEqual([1, 2], asyncio.run(call_concurrently()))
+        # recorded latency is applied via asyncio.sleep, calls wait concurrently
+        self.assertEqual(["woken", "woken"], events[2:])
+        self.assertTrue(all(delay >= 0.2 for delay in events[:2]))
+
+    def testGuessCoroutine(self):
+        coroutine = async_sum(1, 2)
+        self.assertRaises(TypeError, Guess.guess_type_and_data, coroutine)
+        coroutine.close()
+
+
+class ZeroCopyBuffer(bytearray):
+    """
+    bytearray handing its content to pickle out-of-band via PickleBuffer
+    """
+
+    def __reduce_ex__(self, protocol):
+        if protocol >= 5:
+            return type(self)._reconstruct, (pickle.PickleBuffer(self),), None
+        return type(self)._reconstruct, (bytearray(self),), None
+
+    @classmethod
+    def _reconstruct(cls, obj):
+        with memoryview(obj) as view:
+            return cls(view)
+
+
+class OutOfBandObjectStorage(ObjectStorage):
+    out_of_band_buffers = True
+    out_of_band_threshold = 1024
+
+
+class StoreOutOfBand(BaseClass):
+    def testRawCall(self):
+        keys = [1]
+        obj_before = {
+            "bytes": b"a" * 2048,
+            "bytearray": bytearray(b"b" * 4096),
+            "small": b"c",
+            "own": OwnClass(1),
+        }
+        OutOfBandObjectStorage(store_keys=keys, cassette=self.cassette).write(
+            obj_before
+        )
+        self.cassette.dump()
+        stored = self.cassette.storage_object[1][0]["output"]
+        self.assertIn(OUT_OF_BAND_KEY, stored)
+        self.assertEqual([], stored["buffers"])
+        self.assertEqual([[0, 2048], [2048, 4096]], stored["bytes"])
+        self.assertLess(len(stored[OUT_OF_BAND_KEY]), 1024)
+        self.assertEqual(6144, os.path.getsize(self.cassette.buffer_segment.path))
+
+        # load it again from the storage file
+        self.cassette.storage_file = None
+        self.cassette.storage_file = self.response_file
+        self.assertEqual(StorageMode.read, self.cassette.mode)
+        obj_after = ObjectStorage(store_keys=keys, cassette=self.cassette).read()
+        self.assertEqual(obj_before["bytes"], obj_after["bytes"])
+        self.assertEqual(obj_before["bytearray"], obj_after["bytearray"])
+        self.assertIsInstance(obj_after["bytearray"], bytearray)
+        self.assertEqual(b"c", obj_after["small"])
+        self.assertEqual(1, obj_after["own"].num)
+
+    def testPickleBuffer(self):
+        keys = [1]
+        obj_before = {
+            "zero_copy": ZeroCopyBuffer(b"z" * 2048),
+            "small": ZeroCopyBuffer(b"s"),
+        }
+        OutOfBandObjectStorage(store_keys=keys, cassette=self.cassette).write(
+            obj_before
+        )
+        self.cassette.dump()
+        stored = self.cassette.storage_object[1][0]["output"]
+        # buffer exported by __reduce_ex__ is written out-of-band, small one in-band
+        self.assertEqual([[0, 2048]], stored["buffers"])
+        self.assertEqual([], stored["bytes"])
+        self.assertLess(len(stored[OUT_OF_BAND_KEY]), 1024)
+        self.assertEqual(2048, os.path.getsize(self.cassette.buffer_segment.path))
+
+        self.cassette.storage_file = None
+        self.cassette.storage_file = self.response_file
+        obj_after = ObjectStorage(store_keys=keys, cassette=self.cassette).read()
+        self.assertIsInstance(obj_after["zero_copy"], ZeroCopyBuffer)
+        self.assertEqual(obj_before["zero_copy"], obj_after["zero_copy"])
+        self.assertIsInstance(obj_after["small"], ZeroCopyBuffer)
+        self.assertEqual(b"s", obj_after["small"])
+
+
 class CallDebug(BaseClass):
     def setUp(self) -> None:
         super().setUp()
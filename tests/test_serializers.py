@@ -0,0 +1,221 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import collections
+import dataclasses
+import datetime
+import decimal
+import enum
+from typing import List, Optional
+
+import yaml
+
+from requre.guess_object import GUESS_STR, Guess
+from requre.objects import ObjectStorage
+from requre.serializers import (
+    DataclassObject,
+    EnumObject,
+    NamedTupleObject,
+    SerializerRegistry,
+    serializer_registry,
+)
+from requre.simple_object import Simple
+from requre.utils import StorageMode
+from tests.testbase import BaseClass
+
+
+@dataclasses.dataclass
+class Commit:
+    sha: str
+    parents: List["Commit"]
+    created: datetime.datetime
+    amount: Optional[decimal.Decimal] = None
+
+
+@dataclasses.dataclass
+class Doubled:
+    value: int
+    factor: dataclasses.InitVar[int] = 2
+
+    def __post_init__(self, factor):
+        self.doubled = self.value * factor
+
+
+class Color(enum.Enum):
+    RED = "red"
+    BLUE = "blue"
+
+
+Point = collections.namedtuple("Point", ["x", "y"])
+
+
+class Amount:
+    def __init__(self, value):
+        self.value = value
+
+
+class Tags(set):
+    owner = None
+
+
+class Timestamp(datetime.datetime):
+    pass
+
+
+class Digest(bytes):
+    pass
+
+
+class AmountSerializer(Simple):
+    def to_serializable(self, obj):
+        return obj.value
+
+    def from_serializable(self, data):
+        return Amount(data)
+
+
+def obj_return(num, obj):
+    _ = num
+    return obj
+
+
+class Registry(BaseClass):
+    def test_lookup(self):
+        self.assertIs(DataclassObject, serializer_registry.lookup(Commit))
+        self.assertIs(EnumObject, serializer_registry.lookup(Color))
+        self.assertIs(NamedTupleObject, serializer_registry.lookup(Point))
+        self.assertIsNone(serializer_registry.lookup(tuple))
+        self.assertIsNone(serializer_registry.lookup(dict))
+
+    def test_subclass(self):
+        class SubAmount(Amount):
+            pass
+
+        registry = SerializerRegistry()
+        registry.register(AmountSerializer, Amount)
+        # serializer would create Amount instance, subclass is not matched
+        self.assertIsNone(registry.lookup(SubAmount))
+        self.assertIsNone(registry._cache[SubAmount])
+        self.assertIs(
+            AmountSerializer,
+            registry.get("tests.test_serializers:AmountSerializer"),
+        )
+        self.assertRaises(ValueError, registry.register, AmountSerializer)
+
+    def test_duplicate_name(self):
+        registry = SerializerRegistry()
+        registry.register(AmountSerializer, Amount)
+        # registering the same serializer again is fine
+        registry.register(AmountSerializer, Tags)
+        duplicate = type(AmountSerializer.__name__, (Simple,), {})
+        duplicate.__module__ = AmountSerializer.__module__
+        self.assertRaises(ValueError, registry.register, duplicate, Digest)
+
+    def test_encode(self):
+        created = datetime.datetime(2020, 1, 1)
+        encoded = Guess.encode(Commit(sha="abc", parents=[], created=created))
+        self.assertEqual(serializer_registry.name(DataclassObject), encoded[GUESS_STR])
+        self.assertEqual("tests.test_serializers:Commit", encoded["data"]["type"])
+        self.assertEqual("abc", encoded["data"]["fields"]["sha"])
+        self.assertEqual(
+            {GUESS_STR: Simple.__name__, "data": []},
+            encoded["data"]["fields"]["parents"],
+        )
+
+    def test_yaml_roundtrip(self):
+        value = Point(
+            Commit(sha="abc", parents=[], created=datetime.datetime(2020, 1, 1)),
+            {Color.RED: decimal.Decimal("1.5"), "set": {b"a", 1}},
+        )
+        encoded = yaml.safe_load(yaml.dump(Guess.encode(value)))
+        self.assertEqual(value, Guess.decode(encoded))
+
+    def test_registration_clears_cache(self):
+        registry = SerializerRegistry()
+        self.assertIsNone(registry.lookup(Amount))
+        registry.register(AmountSerializer, Amount)
+        self.assertIs(AmountSerializer, registry.lookup(Amount))
+
+
+class Store(BaseClass):
+    def setUp(self) -> None:
+        super().setUp()
+        # keys of the first call are computed before cassette is set to the class
+        Guess.set_cassette(self.cassette)
+
+    def test_types(self):
+        created = datetime.datetime(2020, 1, 1, 12, tzinfo=datetime.timezone.utc)
+        values = [
+            Commit(
+                sha="abc",
+                parents=[Commit(sha="def", parents=[], created=created)],
+                created=created,
+                amount=decimal.Decimal("1.10"),
+            ),
+            Color.BLUE,
+            Point(1, Color.RED),
+            created,
+            datetime.date(2020, 1, 1),
+            datetime.timedelta(days=1, seconds=2),
+            decimal.Decimal("3.14"),
+            {1, 2},
+            frozenset(["a"]),
+            b"bytes",
+            bytearray(b"bytearray"),
+        ]
+        decorated = Guess.decorator(cassette=self.cassette, item_list=[0])(obj_return)
+        for index, value in enumerate(values, start=1):
+            decorated(index, value)
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        for index, value in enumerate(values, start=1):
+            after = decorated(index, None)
+            self.assertNotEqual(
+                ObjectStorage.__name__, self.cassette.data_miner.metadata[GUESS_STR]
+            )
+            self.assertEqual(value, after)
+            self.assertIs(type(value), type(after))
+
+    def test_dataclass_attributes(self):
+        decorated = Guess.decorator_plain(cassette=self.cassette)(obj_return)
+        decorated(1, Doubled(3, factor=3))
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        after = decorated(1, None)
+        self.assertEqual(
+            serializer_registry.name(DataclassObject),
+            self.cassette.data_miner.metadata[GUESS_STR],
+        )
+        self.assertIsInstance(after, Doubled)
+        self.assertEqual({"value": 3, "doubled": 9}, vars(after))
+
+    def test_subclasses_pickled(self):
+        tags = Tags(["a"])
+        tags.owner = "requre"
+        values = [tags, Timestamp(2020, 1, 1), Digest(b"abc")]
+        decorated = Guess.decorator(cassette=self.cassette, item_list=[0])(obj_return)
+        for index, value in enumerate(values, start=1):
+            decorated(index, value)
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        replayed = []
+        for index, value in enumerate(values, start=1):
+            replayed.append(decorated(index, None))
+            self.assertEqual(
+                ObjectStorage.__name__, self.cassette.data_miner.metadata[GUESS_STR]
+            )
+        self.assertEqual(values, replayed)
+        self.assertEqual([type(item) for item in values], [type(x) for x in replayed])
+        self.assertEqual("requre", replayed[0].owner)
+
+    def test_user_registration(self):
+        serializer_registry.register(AmountSerializer, Amount)
+        decorated = Guess.decorator_plain(cassette=self.cassette)(obj_return)
+        decorated(1, Amount(3))
+        self.cassette.dump()
+        self.cassette.mode = StorageMode.read
+        self.assertEqual(3, decorated(1, None).value)
+        self.assertEqual(
+            serializer_registry.name(AmountSerializer),
+            self.cassette.data_miner.metadata[GUESS_STR],
+        )
@@ -0,0 +1,121 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+
+from requre.helpers.httpx_response import CassetteTransport
+from requre.serve import CassetteRecorder, CassetteReplay, CassetteServer
+from tests.testbase import BaseClass
+
+
+class TargetHandler(BaseHTTPRequestHandler):
+    calls = 0
+    # requests of /parallel paths wait for each other
+    barrier = threading.Barrier(2, timeout=5)
+
+    def do_GET(self):
+        TargetHandler.calls += 1
+        if self.path.startswith("/parallel"):
+            TargetHandler.barrier.wait()
+        body = gzip.compress(json.dumps({"path": self.path}).encode())
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Serve(BaseClass):
+    def start(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_record_and_replay(self):
+        TargetHandler.calls = 0
+        target = self.start(ThreadingHTTPServer(("127.0.0.1", 0), TargetHandler))
+        target_url = f"http://127.0.0.1:{target.server_address[1]}"
+        proxy = CassetteServer(
+            ("127.0.0.1", 0), recorder=CassetteRecorder(self.response_file, target_url)
+        )
+        self.start(proxy)
+        self.assertEqual(
+            {"path": "/repos?page=1"}, requests.get(f"{proxy.url}/repos?page=1").json()
+        )
+        proxy.shutdown()
+        proxy.server_close()
+        self.assertEqual(1, TargetHandler.calls)
+
+        replay = CassetteReplay([self.response_file])
+        self.assertEqual([("GET", "/repos?page=1")], list(replay))
+        server = self.start(CassetteServer(("127.0.0.1", 0), replay=replay))
+        with requests.Session() as session:
+            # responses are repeated for parallel clients
+            for _ in range(1, 3):
+                response = session.get(f"{server.url}/repos?page=1")
+                self.assertEqual({"path": "/repos?page=1"}, response.json())
+                self.assertNotIn("Content-Encoding", response.headers)
+            self.assertEqual(404, session.get(f"{server.url}/unknown").status_code)
+        self.assertEqual(1, TargetHandler.calls)
+
+    def test_record_in_parallel(self):
+        TargetHandler.barrier.reset()
+        target = self.start(ThreadingHTTPServer(("127.0.0.1", 0), TargetHandler))
+        target_url = f"http://127.0.0.1:{target.server_address[1]}"
+        recorder = CassetteRecorder(self.response_file, target_url)
+        proxy = self.start(CassetteServer(("127.0.0.1", 0), recorder=recorder))
+        results = []
+
+        def fetch(index):
+            response = requests.get(f"{proxy.url}/parallel/{index}")
+            results.append(response.json())
+
+        # target answers when both requests are forwarded at the same time
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(
+            [{"path": "/parallel/0"}, {"path": "/parallel/1"}],
+            sorted(results, key=lambda item: item["path"]),
+        )
+        proxy.shutdown()
+        proxy.server_close()
+        replay = CassetteReplay([self.response_file])
+        self.assertEqual(
+            [("GET", "/parallel/0"), ("GET", "/parallel/1")], sorted(replay)
+        )
+
+    def test_httpx_latency(self):
+        def handler(request):
+            time.sleep(0.2)
+            return httpx.Response(200, text="ok")
+
+        transport = CassetteTransport(
+            transport=httpx.MockTransport(handler), cassette=self.cassette
+        )
+        with httpx.Client(transport=transport) as client:
+            client.get("https://example.com/latency")
+
+        replay = CassetteReplay([self.response_file])
+        server = self.start(
+            CassetteServer(("127.0.0.1", 0), replay=replay, use_latency=True)
+        )
+        start = time.monotonic()
+        self.assertEqual("ok", requests.get(f"{server.url}/latency").text)
+        self.assertLessEqual(0.2, time.monotonic() - start)
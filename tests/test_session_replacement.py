@@ -0,0 +1,213 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import os
+import gc
+import threading
+import unittest
+import weakref
+
+import tests.data.special_requre_module
+from requre.cassette import Cassette, activate_cassette
+from requre.exceptions import PersistentStorageException
+from requre.record_and_replace import (
+    _session_replacements,
+    install_session_replacement,
+    replace,
+    session_scope,
+    uninstall_session_replacements,
+)
+from requre.simple_object import Simple
+from requre.utils import StorageMode
+from tests.testbase import BaseClass
+
+ORIGINAL_RANDOM_NUMBER = tests.data.special_requre_module.random_number
+ORIGINAL_INC = tests.data.special_requre_module.inc
+
+
+class SessionReplacement(BaseClass):
+    what = "tests.data.special_requre_module.random_number"
+
+    def tearDown(self) -> None:
+        uninstall_session_replacements()
+        super().tearDown()
+
+    def test_install_once(self):
+        first = install_session_replacement(what=self.what)
+        module_list = list(first.module_list)
+        self.assertTrue(module_list)
+        second = install_session_replacement(what=self.what)
+        self.assertIs(first, second)
+        self.assertEqual(module_list, second.module_list)
+        self.assertIsNot(
+            ORIGINAL_RANDOM_NUMBER, tests.data.special_requre_module.random_number
+        )
+        uninstall_session_replacements()
+        self.assertIs(
+            ORIGINAL_RANDOM_NUMBER, tests.data.special_requre_module.random_number
+        )
+        self.assertEqual({}, _session_replacements)
+
+    def test_scope_handlers_released(self):
+        install_session_replacement(what=self.what, decorate=Simple.decorator_plain())
+        session_replacement = _session_replacements[self.what]
+        references = []
+        for _ in range(3):
+            decorate = Simple.decorator_plain()
+            references.append(weakref.ref(decorate))
+            with session_scope(
+                what=self.what, cassette=self.cassette, decorate=decorate
+            ):
+                tests.data.special_requre_module.random_number()
+        del decorate
+        # replacements created for scopes are not cached after the scope ends,
+        # just for the session default handler (the last installed one)
+        session_replacement.set_handler(decorate=Simple.decorator_plain())
+        gc.collect()
+        self.assertEqual([None, None, None], [item() for item in references])
+        self.assertEqual({}, session_replacement.handler._replacements)
+
+    def test_no_active_cassette(self):
+        install_session_replacement(what=self.what, decorate=Simple.decorator_plain())
+        tests.data.special_requre_module.random_number()
+        self.assertEqual({}, self.cassette.storage_object)
+
+    def test_active_cassette(self):
+        install_session_replacement(what=self.what, decorate=Simple.decorator_plain())
+        cassette = Cassette()
+        cassette.storage_file = self.response_file
+        with activate_cassette(cassette):
+            before = tests.data.special_requre_module.random_number()
+        cassette.dump()
+        cassette = Cassette()
+        cassette.storage_file = self.response_file
+        self.assertEqual(StorageMode.read, cassette.mode)
+        with activate_cassette(cassette):
+            after = tests.data.special_requre_module.random_number()
+        self.assertEqual(before, after)
+        self.assertNotEqual(after, tests.data.special_requre_module.random_number())
+
+
+@replace(what="tests.data.special_requre_module.random_number", session=True)
+class SessionReplaceDecorator(unittest.TestCase):
+    @classmethod
+    def tearDownClass(cls) -> None:
+        uninstall_session_replacements()
+
+    def cassette_teardown(self, cassette):
+        os.remove(cassette.storage_file)
+
+    def test(self, cassette: Cassette):
+        tests.data.special_requre_module.random_number()
+        self.assertIn(
+            "tests.data.special_requre_module", cassette.storage_object.keys()
+        )
+        self.assertIn(
+            "tests.data.special_requre_module.random_number", _session_replacements
+        )
+
+    def test_second(self, cassette: Cassette):
+        module_list = _session_replacements[
+            "tests.data.special_requre_module.random_number"
+        ].module_list
+        tests.data.special_requre_module.random_number()
+        self.assertIs(
+            module_list,
+            _session_replacements[
+                "tests.data.special_requre_module.random_number"
+            ].module_list,
+        )
+
+
+class ContextIsolation(BaseClass):
+    what = "tests.data.special_requre_module.inc"
+
+    def test_other_thread_calls_original(self):
+        results = []
+
+        @replace(what=self.what, cassette=self.cassette, context_isolated=True)
+        def scope():
+            thread = threading.Thread(
+                target=lambda: results.append(tests.data.special_requre_module.inc(1))
+            )
+            thread.start()
+            thread.join()
+            return tests.data.special_requre_module.inc(2)
+
+        self.assertEqual(3, scope())
+        self.assertEqual([2], results)
+        self.assertEqual(
+            1,
+            len(
+                self.cassette.storage_object["tests.data.special_requre_module"]["inc"]
+            ),
+        )
+        # replacement is reverted after the last scope
+        self.assertEqual({}, _session_replacements)
+        self.assertIs(ORIGINAL_INC, tests.data.special_requre_module.inc)
+
+    def test_concurrent_scopes(self):
+        barrier = threading.Barrier(2)
+        cassettes = []
+        for index in range(2):
+            cassette = Cassette()
+            cassette.storage_file = os.path.join(
+                self.response_dir, f"concurrent_{index}.yaml"
+            )
+            cassettes.append(cassette)
+
+        def run_scope(cassette, value):
+            @replace(
+                what=self.what,
+                cassette=cassette,
+                decorate=Simple.decorator(item_list=[0]),
+                context_isolated=True,
+            )
+            def scope():
+                barrier.wait()
+                tests.data.special_requre_module.inc(value)
+                barrier.wait()
+
+            scope()
+
+        threads = [
+            threading.Thread(target=run_scope, args=(cassette, index * 10 + 1))
+            for index, cassette in enumerate(cassettes)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for index, cassette in enumerate(cassettes):
+            self.assertEqual(
+                [index * 10 + 1],
+                list(
+                    cassette.storage_object["tests.data.special_requre_module"][
+                        "inc"
+                    ].keys()
+                ),
+            )
+        self.assertIs(ORIGINAL_INC, tests.data.special_requre_module.inc)
+
+    def test_explicit_cassette_wins(self):
+        explicit = Cassette()
+        explicit.storage_file = os.path.join(self.response_dir, "explicit.yaml")
+        decorated = Simple.decorator(item_list=[0], cassette=explicit)(
+            tests.data.special_requre_module.inc
+        )
+        with activate_cassette(self.cassette):
+            self.assertEqual(2, decorated(1))
+        self.assertTrue(explicit.storage_object)
+        self.assertEqual({}, self.cassette.storage_object)
+        # instance keeps its cassette, class one is not changed
+        storage = Simple(store_keys=[], cassette=explicit)
+        with activate_cassette(self.cassette):
+            self.assertIs(explicit, storage.get_cassette())
+            self.assertIs(self.cassette, Simple.get_cassette())
+
+    def test_set_cassette_with_active_one(self):
+        other = Cassette()
+        with activate_cassette(self.cassette):
+            self.assertRaises(PersistentStorageException, Simple.set_cassette, other)
+            Simple.set_cassette(self.cassette)
+        self.assertIs(self.cassette, Simple._cassette)